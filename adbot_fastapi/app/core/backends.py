@@ -0,0 +1,24 @@
+from .config import POWERSHELL_BACKEND_CONFIG
+from .fake_directory import get_fake_backend
+from .session_pool import get_session_pool
+
+BACKENDS = ("winrm", "fake")
+
+
+def backend_name() -> str:
+    name = POWERSHELL_BACKEND_CONFIG["backend"]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown POWERSHELL_BACKEND '{name}', expected one of {', '.join(BACKENDS)}")
+    return name
+
+
+def get_backend():
+    """What scripts run on: the WinRM session pool or the fake directory.
+
+    Both provide config["server"], execute(script, timings) -> (stdout, stderr,
+    had_errors), stream(script, timings) yielding output objects, and stats().
+    timings, when given, is a dict the backend adds phase durations to.
+    """
+    if backend_name() == "fake":
+        return get_fake_backend()
+    return get_session_pool()
@@ -0,0 +1,115 @@
+import json
+import logging
+import time
+
+from .config import BATCH_GET_CONFIG
+from .directory_cache import directory_cache
+from .ldap_query import escape_ldap_value, ps_double_quoted
+from .powershell_client import read_remote_ps_async
+from .bulk import chunked
+from . import fields as field_projection
+
+logger = logging.getLogger(__name__)
+
+BATCH_CMDLETS = {
+    "users": "Get-ADUser",
+    "groups": "Get-ADGroup",
+    "computers": "Get-ADComputer",
+}
+
+# Fields returned when the request names none, matching the single-object responses
+DEFAULT_VIEWS = {
+    "users": "detail",
+    "groups": "detail",
+    "computers": "list",
+}
+
+
+class BatchGetError(ValueError):
+    """Raised for an unknown field or too many identities"""
+
+
+def _account_name(object_type: str, identity: str) -> str:
+    """sAMAccountName searched for an identity; computer accounts carry a trailing $"""
+    if object_type == "computers" and not identity.endswith("$"):
+        return identity + "$"
+    return identity
+
+
+def build_batch_script(object_type: str, identities: list, selected: tuple, chunk_size: int) -> str:
+    """One script resolving every identity, one OR'd sAMAccountName filter per chunk"""
+    filters = []
+    for chunk in chunked(identities, chunk_size):
+        clauses = "".join(f"(sAMAccountName={escape_ldap_value(_account_name(object_type, i))})" for i in chunk)
+        filters.append(f'"{ps_double_quoted("(|" + clauses + ")")}"')
+    members_script = '''
+                $members = @(Get-ADGroupMember -Identity $o -ErrorAction SilentlyContinue | Select-Object -ExpandProperty SamAccountName)''' \
+        if "Members" in selected else ""
+    entries = field_projection.hashtable_entries(object_type, selected, "$o")
+    return f'''
+    try {{
+        $results = New-Object System.Collections.Generic.List[object]
+        foreach ($filter in @({", ".join(filters)})) {{
+            foreach ($o in @({BATCH_CMDLETS[object_type]} -LDAPFilter $filter {field_projection.properties(object_type, selected)})) {{{members_script}
+                $results.Add(@{{
+{entries}
+                }})
+            }}
+        }}
+        ConvertTo-Json -InputObject $results.ToArray() -Depth 3 -Compress
+    }} catch {{
+        Write-Error "PowerShell Error: $($_.Exception.Message)"
+        exit 1
+    }}
+    '''
+
+
+def resolve_batch_fields(object_type: str, fields: list = None) -> tuple:
+    """Selected fields for a batch, always including SamAccountName, which results are keyed on"""
+    try:
+        selected = field_projection.resolve_fields(object_type, ",".join(fields or []), DEFAULT_VIEWS[object_type])
+    except field_projection.UnknownField as e:
+        raise BatchGetError(str(e))
+    return selected if "SamAccountName" in selected else ("SamAccountName",) + selected
+
+
+async def get_many(object_type: str, identities: list, fields: list = None) -> dict:
+    """Resolve many objects in one round trip.
+
+    Returns {"items": {identity: object or None}, "not_found": [...], ...} with
+    every requested identity present as a key. Detail entries already in the
+    directory cache are used when they hold every selected field.
+    """
+    selected = resolve_batch_fields(object_type, fields)
+    unique = list(dict.fromkeys(i.strip() for i in identities if i and i.strip()))
+    if len(unique) > BATCH_GET_CONFIG["max_identities"]:
+        raise BatchGetError(f"At most {BATCH_GET_CONFIG['max_identities']} identities per request, got {len(unique)}")
+    started = time.perf_counter()
+    items = {}
+    missing = []
+    for identity in unique:
+        cached = directory_cache.get(object_type, directory_cache.detail_key(identity))
+        if cached is not None and all(f in cached for f in selected):
+            items[identity] = field_projection.project(cached, selected)
+        else:
+            missing.append(identity)
+    if missing:
+        chunk_size = BATCH_GET_CONFIG["chunk_size"]
+        stdout, stderr, rc = await read_remote_ps_async(build_batch_script(object_type, missing, selected, chunk_size))
+        if rc != 0:
+            raise RuntimeError(f"Failed to get {object_type}: {stderr}")
+        rows = json.loads(stdout) if stdout and stdout.strip() else []
+        rows = [rows] if isinstance(rows, dict) else rows
+        by_name = {(row.get("SamAccountName") or "").lower(): row for row in rows}
+        for identity in missing:
+            items[identity] = by_name.get(_account_name(object_type, identity).lower())
+    not_found = [i for i in unique if items.get(i) is None]
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Batch get of {len(unique)} {object_type} ({len(unique) - len(missing)} cached) took {duration_ms:.0f}ms")
+    return {
+        "items": {i: items.get(i) for i in unique},
+        "found": len(unique) - len(not_found),
+        "not_found": not_found,
+        "cached": len(unique) - len(missing),
+        "duration_ms": duration_ms,
+    }
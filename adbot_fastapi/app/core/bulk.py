@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import time
+
+from .config import BULK_CONFIG
+from .ldap_query import ps_double_quoted
+from .powershell_client import execute_remote_ps_async
+
+logger = logging.getLogger(__name__)
+
+# Per-item PowerShell for each bulk operation. $id is the identity and $user the
+# account read before the action; "result" adds fields to the item's result.
+BULK_OPERATIONS = {
+    "enable": {
+        "action": "Enable-ADAccount -Identity $user -ErrorAction Stop",
+        "result": "Enabled = $true",
+        "message": "User enabled successfully",
+        "failure": "Failed to enable user",
+    },
+    "disable": {
+        "action": "Disable-ADAccount -Identity $user -ErrorAction Stop",
+        "result": "Enabled = $false",
+        "message": "User disabled successfully",
+        "failure": "Failed to disable user",
+    },
+    "delete": {
+        "action": "Remove-ADUser -Identity $user -Confirm:$false -ErrorAction Stop",
+        "result": "DistinguishedName = $user.DistinguishedName",
+        "message": "User deleted successfully",
+        "failure": "Failed to delete user",
+    },
+    "move": {
+        "action": 'Move-ADObject -Identity $user.DistinguishedName -TargetPath "{target_ou}" -ErrorAction Stop',
+        "result": 'PreviousLocation = $user.DistinguishedName; TargetOU = "{target_ou}"',
+        "message": "User moved successfully",
+        "failure": "Failed to move user",
+        "requires": ("target_ou",),
+    },
+}
+
+
+class BulkOperationError(ValueError):
+    """Raised for an unknown operation or missing parameters"""
+
+
+def _ps_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def chunked(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def build_chunk_script(operation: str, identities: list, parameters: dict = None) -> str:
+    """One script that applies the operation to every identity and reports each outcome"""
+    spec = BULK_OPERATIONS[operation]
+    params = {k: ps_double_quoted(str(v)) for k, v in (parameters or {}).items()}
+    action = spec["action"].format(**params)
+    extra = spec["result"].format(**params)
+    ids = ", ".join(_ps_literal(i) for i in identities)
+    return f'''
+    $results = foreach ($id in @({ids})) {{
+        try {{
+            $user = Get-ADUser -Identity $id -ErrorAction Stop
+            {action}
+            [PSCustomObject]@{{
+                Message = "{spec["message"]}"
+                SamAccountName = $user.SamAccountName
+                Name = $user.Name
+                {extra}
+                Success = $true
+            }}
+        }} catch [Microsoft.ActiveDirectory.Management.ADIdentityNotFoundException] {{
+            [PSCustomObject]@{{
+                Message = "User not found"
+                SamAccountName = $id
+                Error = "User '$id' does not exist in Active Directory"
+                Success = $false
+            }}
+        }} catch {{
+            [PSCustomObject]@{{
+                Message = "{spec["failure"]}"
+                SamAccountName = $id
+                Error = $_.Exception.Message
+                Success = $false
+            }}
+        }}
+    }}
+    ConvertTo-Json -InputObject @($results) -Depth 3 -Compress
+    '''
+
+
+async def _run_chunk(operation: str, identities: list, parameters: dict) -> list:
+    try:
+        stdout, stderr, rc = await execute_remote_ps_async(build_chunk_script(operation, identities, parameters))
+        if rc != 0:
+            raise RuntimeError(stderr or "PowerShell returned a non-zero exit code")
+        data = json.loads(stdout)
+        data = [data] if isinstance(data, dict) else data
+        if len(data) != len(identities):
+            raise RuntimeError(f"Expected {len(identities)} results, got {len(data)}")
+        return data
+    except Exception as e:
+        logger.error(f"Bulk {operation} chunk of {len(identities)} failed: {str(e)}")
+        return [
+            {"Message": BULK_OPERATIONS[operation]["failure"], "SamAccountName": i, "Error": str(e), "Success": False}
+            for i in identities
+        ]
+
+
+async def run_bulk(operation: str, identities: list, parameters: dict = None, chunk_size: int = None,
+                   on_chunk=None) -> dict:
+    """Apply an operation to many users, one script per chunk, chunks in parallel.
+
+    Returns {"items": per-identity results in input order, "chunks": n, "duration_ms": t}.
+    Concurrency is bounded by the per-server limit of execute_remote_ps_async.
+    on_chunk(results), if given, is called as each chunk finishes.
+    """
+    spec = BULK_OPERATIONS.get(operation)
+    if spec is None:
+        raise BulkOperationError(f"Unknown operation '{operation}', expected one of {', '.join(BULK_OPERATIONS)}")
+    missing = [p for p in spec.get("requires", ()) if not (parameters or {}).get(p)]
+    if missing:
+        raise BulkOperationError(f"Operation '{operation}' requires parameters: {', '.join(missing)}")
+    started = time.perf_counter()
+    unique = list(dict.fromkeys(identities))
+    chunks = chunked(unique, chunk_size or BULK_CONFIG["chunk_size"])
+
+    async def run_chunk(chunk):
+        results = await _run_chunk(operation, chunk, parameters)
+        if on_chunk is not None:
+            on_chunk(results)
+        return results
+
+    outcomes = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+    by_identity = {}
+    for chunk, results in zip(chunks, outcomes):
+        for identity, result in zip(chunk, results):
+            by_identity[identity] = result
+    logger.info(f"Bulk {operation} of {len(unique)} users in {len(chunks)} chunks took {(time.perf_counter() - started) * 1000:.0f}ms")
+    return {
+        "items": [by_identity[i] for i in identities],
+        "chunks": len(chunks),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
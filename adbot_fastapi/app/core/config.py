@@ -15,4 +15,137 @@ WINRM_CONFIG = {
     "cert_validation": False,
     "auth": "negotiate",
     "transport": "plaintext"
-} 
\ No newline at end of file
+}
+
+# Long-lived WinRM sessions shared by all routers
+WINRM_POOL_CONFIG = {
+    "min_size": int(os.getenv("WINRM_POOL_MIN_SIZE", "1")),
+    "max_size": int(os.getenv("WINRM_POOL_MAX_SIZE", "8")),
+    "idle_timeout": float(os.getenv("WINRM_POOL_IDLE_TIMEOUT", "300")),  # seconds before an idle session is closed
+    "health_check_interval": float(os.getenv("WINRM_POOL_HEALTH_CHECK_INTERVAL", "60")),  # seconds idle before a ping on checkout
+    "acquire_timeout": float(os.getenv("WINRM_POOL_ACQUIRE_TIMEOUT", "30")),
+}
+
+# Runspace initialization done once per pooled session instead of once per request
+WINRM_WARMUP_CONFIG = {
+    "enabled": os.getenv("WINRM_WARMUP_ENABLED", "true").lower() == "true",
+    "on_startup": os.getenv("WINRM_WARMUP_ON_STARTUP", "true").lower() == "true",
+    "modules": [m.strip() for m in os.getenv("WINRM_WARMUP_MODULES", "ActiveDirectory").split(",") if m.strip()],
+}
+
+# Dedicated executor behind execute_remote_ps_async; in-flight calls beyond the limits wait without holding a thread
+PS_EXECUTOR_CONFIG = {
+    "max_workers": int(os.getenv("PS_EXECUTOR_MAX_WORKERS", "32")),
+    "per_server_limit": int(os.getenv("PS_EXECUTOR_PER_SERVER_LIMIT", os.getenv("WINRM_POOL_MAX_SIZE", "8"))),
+}
+
+# In-process cache of directory reads (seconds per object type)
+DIRECTORY_CACHE_CONFIG = {
+    "enabled": os.getenv("DIRECTORY_CACHE_ENABLED", "true").lower() == "true",
+    "max_entries": int(os.getenv("DIRECTORY_CACHE_MAX_ENTRIES", "512")),
+    "ttl": {
+        "users": float(os.getenv("DIRECTORY_CACHE_TTL_USERS", "60")),
+        "groups": float(os.getenv("DIRECTORY_CACHE_TTL_GROUPS", "120")),
+        "computers": float(os.getenv("DIRECTORY_CACHE_TTL_COMPUTERS", "300")),
+        "ous": float(os.getenv("DIRECTORY_CACHE_TTL_OUS", "600")),
+    },
+}
+
+# Background mirror of users/groups/computers kept current from uSNChanged deltas
+DIRECTORY_SYNC_CONFIG = {
+    "enabled": os.getenv("DIRECTORY_SYNC_ENABLED", "false").lower() == "true",
+    "interval": float(os.getenv("DIRECTORY_SYNC_INTERVAL", "30")),  # seconds between delta polls
+    "object_types": [t.strip() for t in os.getenv("DIRECTORY_SYNC_OBJECT_TYPES", "users,groups,computers").split(",") if t.strip()],
+    "tombstone_retention": float(os.getenv("DIRECTORY_SYNC_TOMBSTONE_RETENTION", "86400")),
+}
+
+# In-memory type-ahead index served by /search
+SEARCH_INDEX_CONFIG = {
+    "object_types": [t.strip() for t in os.getenv("SEARCH_INDEX_OBJECT_TYPES", "users,groups,computers").split(",") if t.strip()],
+    "refresh_interval": float(os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", "300")),  # seconds before a background rebuild
+}
+
+# Member counts for the groups page, served stale while a background refresh runs
+GROUP_MEMBER_COUNTS_CONFIG = {
+    "cache_enabled": os.getenv("GROUP_MEMBER_COUNTS_CACHE_ENABLED", "true").lower() == "true",
+    "ttl": float(os.getenv("GROUP_MEMBER_COUNTS_TTL", "300")),  # seconds before counts are refreshed
+}
+
+# Bulk user operations: identities per PowerShell script; chunks run in parallel up to PS_EXECUTOR_PER_SERVER_LIMIT
+BULK_CONFIG = {
+    "chunk_size": int(os.getenv("BULK_CHUNK_SIZE", "50")),
+}
+
+# Background jobs: SQLite store and the number of jobs executed at once
+JOBS_CONFIG = {
+    "db_path": os.getenv("JOBS_DB_PATH", "adbot_jobs.db"),
+    "workers": int(os.getenv("JOBS_WORKERS", "4")),
+    "max_attempts": int(os.getenv("JOBS_MAX_ATTEMPTS", "3")),  # resumes after restarts before a job is failed
+}
+
+# Identical read scripts issued concurrently share one WinRM execution
+SINGLEFLIGHT_CONFIG = {
+    "enabled": os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true",
+}
+
+# Dashboard totals and aggregates, served stale while a background refresh runs
+DASHBOARD_STATS_CONFIG = {
+    "cache_enabled": os.getenv("DASHBOARD_STATS_CACHE_ENABLED", "true").lower() == "true",
+    "ttl": float(os.getenv("DASHBOARD_STATS_TTL", "30")),  # seconds before object totals are recounted
+    "aggregates_ttl": float(os.getenv("DASHBOARD_AGGREGATES_TTL", "300")),
+    "stale_computer_days": int(os.getenv("DASHBOARD_STALE_COMPUTER_DAYS", "90")),  # no logon for this long counts as stale
+}
+
+# Dashboard history: SQLite time series written by a background sampler
+TIMESERIES_CONFIG = {
+    "enabled": os.getenv("TIMESERIES_ENABLED", "true").lower() == "true",
+    "db_path": os.getenv("TIMESERIES_DB_PATH", "adbot_timeseries.db"),
+    "interval": float(os.getenv("TIMESERIES_SAMPLE_INTERVAL", "300")),  # seconds between samples
+}
+
+# Batch reads: identities per OR'd LDAP filter and per request
+BATCH_GET_CONFIG = {
+    "chunk_size": int(os.getenv("BATCH_GET_CHUNK_SIZE", "200")),
+    "max_identities": int(os.getenv("BATCH_GET_MAX_IDENTITIES", "5000")),
+}
+
+# Nested group membership graph, loaded in bulk and rebuilt in the background
+MEMBERSHIP_GRAPH_CONFIG = {
+    "ttl": float(os.getenv("MEMBERSHIP_GRAPH_TTL", "600")),  # seconds before the graph is reloaded
+}
+
+# Where PowerShell scripts run: "winrm" (the domain controller) or "fake" (in-process synthetic directory)
+POWERSHELL_BACKEND_CONFIG = {
+    "backend": os.getenv("POWERSHELL_BACKEND", "winrm").lower(),
+}
+
+# Synthetic directory served by the fake backend, for load tests and benchmarks
+FAKE_DIRECTORY_CONFIG = {
+    "objects": int(os.getenv("FAKE_DIRECTORY_OBJECTS", "10000")),  # users, groups, computers and OUs together
+    "latency_ms": float(os.getenv("FAKE_DIRECTORY_LATENCY_MS", "20")),  # per script, like a WinRM round trip
+    "per_object_us": float(os.getenv("FAKE_DIRECTORY_PER_OBJECT_US", "5")),  # added per object examined, sorted or returned
+    "domain": os.getenv("FAKE_DIRECTORY_DOMAIN", "fake.local"),
+}
+
+# Prometheus metrics at /metrics and the Server-Timing response header
+METRICS_CONFIG = {
+    "enabled": os.getenv("METRICS_ENABLED", "true").lower() == "true",
+    "server_timing": os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true",
+}
+
+# Per-request remote profiling (?profile=true or X-ADBot-Profile: true)
+PROFILING_CONFIG = {
+    "enabled": os.getenv("PROFILING_ENABLED", "true").lower() == "true",
+}
+
+# OpenTelemetry tracing; a no-op unless enabled and opentelemetry-sdk is installed
+TRACING_CONFIG = {
+    "enabled": os.getenv("TRACING_ENABLED", "false").lower() == "true",
+    "service_name": os.getenv("TRACING_SERVICE_NAME", "adbot-fastapi"),
+    # otlp (needs opentelemetry-exporter-otlp-proto-http), file, console or none
+    "exporter": os.getenv("TRACING_EXPORTER", "otlp").lower(),
+    "otlp_endpoint": os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),
+    "file": os.getenv("TRACING_FILE", "adbot_traces.jsonl"),
+    # Share of new traces recorded; requests arriving with a traceparent follow the caller's decision
+    "sample_ratio": float(os.getenv("TRACING_SAMPLE_RATIO", "0.1")),
+}
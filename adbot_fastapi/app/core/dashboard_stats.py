@@ -0,0 +1,346 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from .config import DASHBOARD_STATS_CONFIG
+from .powershell_client import read_remote_ps_async
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# LDAP filters matching what Get-ADUser/Get-ADGroup/Get-ADComputer/Get-ADOrganizationalUnit -Filter * return
+COUNT_FILTERS = {
+    "users": "(&(objectCategory=person)(objectClass=user))",
+    "groups": "(objectClass=group)",
+    "computers": "(objectClass=computer)",
+    "ous": "(objectClass=organizationalUnit)",
+}
+
+# Paged search loading a single attribute: results are counted as pages arrive
+# instead of being materialised as full AD objects
+_COUNT_SCRIPT = '''
+try {{
+    $searcher = New-Object System.DirectoryServices.DirectorySearcher
+    $searcher.PageSize = 1000
+    $searcher.Filter = "{ldap_filter}"
+    [void]$searcher.PropertiesToLoad.Add("distinguishedname")
+    $results = $searcher.FindAll()
+    $count = 0
+    foreach ($r in $results) {{ $count++ }}
+    $results.Dispose()
+    Write-Output $count
+}} catch {{
+    Write-Error "PowerShell Error: $($_.Exception.Message)"
+    exit 1
+}}
+'''
+
+# Aggregates computed server-side when the sync mirrors are not available
+_AGGREGATE_SCRIPT = '''
+try {{
+    $searcher = New-Object System.DirectoryServices.DirectorySearcher
+    $searcher.PageSize = 1000
+    $searcher.Filter = "{users_filter}"
+    foreach ($p in @("distinguishedname", "useraccountcontrol")) {{ [void]$searcher.PropertiesToLoad.Add($p) }}
+    $enabled = 0
+    $disabled = 0
+    $perOu = @{{}}
+    foreach ($r in $searcher.FindAll()) {{
+        if ([int]$r.Properties["useraccountcontrol"][0] -band 2) {{ $disabled++ }} else {{ $enabled++ }}
+        $parent = ([string]$r.Properties["distinguishedname"][0] -split '(?<!\\\\),', 2)[1]
+        $perOu[$parent] = 1 + [int]$perOu[$parent]
+    }}
+    $locked = @(Search-ADAccount -LockedOut -UsersOnly).Count
+    $cutoff = (Get-Date).AddDays(-{stale_days}).ToFileTimeUtc()
+    $stale = New-Object System.DirectoryServices.DirectorySearcher
+    $stale.PageSize = 1000
+    $stale.Filter = "(&(objectClass=computer)(|(!(lastLogonTimestamp=*))(lastLogonTimestamp<=$cutoff)))"
+    [void]$stale.PropertiesToLoad.Add("distinguishedname")
+    $staleCount = 0
+    foreach ($r in $stale.FindAll()) {{ $staleCount++ }}
+    @{{
+        Enabled = $enabled
+        Disabled = $disabled
+        Locked = $locked
+        StaleComputers = $staleCount
+        UsersPerOU = $perOu
+    }} | ConvertTo-Json -Depth 3 -Compress
+}} catch {{
+    Write-Error "PowerShell Error: $($_.Exception.Message)"
+    exit 1
+}}
+'''
+
+_DN_SEPARATOR = re.compile(r"(?<!\\),")
+_JSON_DATE = re.compile(r"/Date\((-?\d+)")
+
+
+def parent_dn(dn: str) -> str:
+    """Container holding the object, i.e. the DN minus its first RDN"""
+    parts = _DN_SEPARATOR.split(dn or "", maxsplit=1)
+    return parts[1] if len(parts) == 2 else ""
+
+
+def parse_logon_date(value):
+    """LastLogonDate as ConvertTo-Json emits it (/Date(ms)/, ISO or 'Never') to a UTC date, or None"""
+    if not value or value == "Never":
+        return None
+    if isinstance(value, str):
+        match = _JSON_DATE.search(value)
+        if match:
+            return datetime.fromtimestamp(int(match.group(1)) / 1000, timezone.utc).date()
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).date()
+        except ValueError:
+            return None
+    return None
+
+
+async def count_objects(object_type: str) -> int:
+    stdout, stderr, rc = await read_remote_ps_async(_COUNT_SCRIPT.format(ldap_filter=COUNT_FILTERS[object_type]))
+    if rc != 0:
+        raise RuntimeError(f"Failed to count {object_type}: {stderr}")
+    return int(stdout.strip() or 0)
+
+
+async def fetch_counts() -> dict:
+    """Object totals in the /dashboard/stats shape; the four counts run concurrently"""
+    types = list(COUNT_FILTERS)
+    counts = await asyncio.gather(*(count_objects(t) for t in types))
+    return {f"total_{t}": n for t, n in zip(types, counts)}
+
+
+async def fetch_aggregates(stale_days: int) -> dict:
+    stdout, stderr, rc = await read_remote_ps_async(
+        _AGGREGATE_SCRIPT.format(users_filter=COUNT_FILTERS["users"], stale_days=stale_days)
+    )
+    if rc != 0:
+        raise RuntimeError(f"Failed to compute dashboard aggregates: {stderr}")
+    payload = json.loads(stdout)
+    return {
+        "users": {
+            "enabled": int(payload.get("Enabled") or 0),
+            "disabled": int(payload.get("Disabled") or 0),
+            "locked": int(payload.get("Locked") or 0),
+        },
+        "computers": {
+            "stale": int(payload.get("StaleComputers") or 0),
+            "stale_after_days": stale_days,
+        },
+        "users_per_ou": dict(sorted((payload.get("UsersPerOU") or {}).items())),
+    }
+
+
+class CachedValue:
+    """Stale-while-revalidate holder for one value produced by an async fetch"""
+
+    def __init__(self, name: str, fetch, ttl: float, enabled: bool = True, object_types=None):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.enabled = enabled
+        self.object_types = object_types
+        self.value = None
+        self.fetched_at = None
+        self.stale = False
+        self.last_error = None
+        self._refresh_task = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self.value is not None and not self.stale and time.time() - self.fetched_at < self.ttl
+
+    async def refresh(self):
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                value = await self.fetch()
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self.value, self.fetched_at, self.stale, self.last_error = value, time.time(), False, None
+            logger.info(f"Dashboard {self.name} refreshed in {(time.perf_counter() - started) * 1000:.0f}ms")
+            return value
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"Background refresh of dashboard {self.name} failed: {str(e)}")
+
+    async def get(self, force: bool = False) -> tuple:
+        """Return (value, served_from_cache); a stale value is returned while a refresh runs"""
+        if not self.enabled or force or self.value is None:
+            tracing.cache_event(f"dashboard {self.name}", False)
+            return await self.refresh(), False
+        if not self._fresh() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.get_running_loop().create_task(self._background_refresh())
+        tracing.cache_event(f"dashboard {self.name}", True)
+        return self.value, True
+
+    def mark_stale(self, object_type: str = None, *_):
+        """Directory cache listener: changes to a counted type make the value stale but keep serving it"""
+        if object_type is None or self.object_types is None or object_type in self.object_types:
+            self.stale = True
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "age_seconds": round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+            "ttl_seconds": self.ttl,
+            "stale": self.stale or (self.fetched_at is not None and time.time() - self.fetched_at >= self.ttl),
+            "refreshing": self._refresh_task is not None and not self._refresh_task.done(),
+            "last_error": self.last_error,
+        }
+
+
+class MirrorAggregates:
+    """User and computer aggregates maintained from directory sync deltas.
+
+    Each object's contribution (enabled, locked, parent OU, last logon day) is
+    remembered by ObjectGUID, so a delta subtracts the old contribution and adds
+    the new one instead of rescanning the mirror. Stale computers are counted
+    from per-day buckets, which stay small however many computers there are.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset("users")
+        self._reset("computers")
+
+    def _reset(self, object_type: str):
+        if object_type == "users":
+            self.users = {}
+            self.user_guids = {}
+            self.user_counts = Counter()
+            self.users_per_ou = Counter()
+            self.users_seeded = False
+        elif object_type == "computers":
+            self.computers = {}
+            self.computer_guids = {}
+            self.logon_days = Counter()
+            self.computers_seeded = False
+
+    def _remove_user(self, guid: str):
+        enabled, locked, ou = self.users.pop(guid)
+        self.user_counts["enabled" if enabled else "disabled"] -= 1
+        if locked:
+            self.user_counts["locked"] -= 1
+        self.users_per_ou[ou] -= 1
+        if not self.users_per_ou[ou]:
+            del self.users_per_ou[ou]
+
+    def _add_user(self, record):
+        guid = record.get("ObjectGUID")
+        if guid in self.users:
+            self._remove_user(guid)
+        enabled, locked = bool(record.get("Enabled")), bool(record.get("LockedOut"))
+        ou = parent_dn(record.get("DistinguishedName"))
+        self.users[guid] = (enabled, locked, ou)
+        self.user_guids[(record.get("SamAccountName") or "").lower()] = guid
+        self.user_counts["enabled" if enabled else "disabled"] += 1
+        if locked:
+            self.user_counts["locked"] += 1
+        self.users_per_ou[ou] += 1
+
+    def _remove_computer(self, guid: str):
+        day = self.computers.pop(guid)
+        self.logon_days[day] -= 1
+        if not self.logon_days[day]:
+            del self.logon_days[day]
+
+    def _add_computer(self, record):
+        guid = record.get("ObjectGUID")
+        if guid in self.computers:
+            self._remove_computer(guid)
+        day = parse_logon_date(record.get("LastLogonDate"))
+        self.computers[guid] = day
+        self.computer_guids[(record.get("SamAccountName") or "").lower()] = guid
+        self.logon_days[day] += 1
+
+    def on_sync(self, object_type: str, changed: list, removed: list, full: bool):
+        """Directory sync listener"""
+        if object_type not in ("users", "computers"):
+            return
+        users = object_type == "users"
+        with self._lock:
+            if full:
+                self._reset(object_type)
+            objects, guids = (self.users, self.user_guids) if users else (self.computers, self.computer_guids)
+            remove = self._remove_user if users else self._remove_computer
+            add = self._add_user if users else self._add_computer
+            for sam in removed:
+                guid = guids.pop((sam or "").lower(), None)
+                if guid in objects:
+                    remove(guid)
+            for record in changed:
+                add(record)
+            if users:
+                self.users_seeded = True
+            else:
+                self.computers_seeded = True
+
+    @property
+    def ready(self) -> bool:
+        return self.users_seeded and self.computers_seeded
+
+    def snapshot(self, stale_days: int) -> dict:
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=stale_days)).date()
+        with self._lock:
+            stale = sum(n for day, n in self.logon_days.items() if day is None or day <= cutoff)
+            return {
+                "users": {
+                    "enabled": self.user_counts["enabled"],
+                    "disabled": self.user_counts["disabled"],
+                    "locked": self.user_counts["locked"],
+                },
+                "computers": {
+                    "stale": stale,
+                    "stale_after_days": stale_days,
+                },
+                "users_per_ou": dict(sorted(self.users_per_ou.items())),
+            }
+
+
+class DashboardStats:
+    """Object totals and aggregates behind the dashboard, both served stale-while-revalidate"""
+
+    def __init__(self, ttl: float, aggregates_ttl: float, stale_computer_days: int, enabled: bool = True):
+        self.stale_computer_days = stale_computer_days
+        self.mirror = MirrorAggregates()
+        self.counts = CachedValue("counts", fetch_counts, ttl, enabled)
+        self.aggregates = CachedValue("aggregates", lambda: fetch_aggregates(self.stale_computer_days),
+                                      aggregates_ttl, enabled, object_types=("users", "computers"))
+
+    async def get_counts(self, force: bool = False) -> tuple:
+        return await self.counts.get(force)
+
+    async def get_aggregates(self, force: bool = False) -> tuple:
+        """Return (aggregates, source); the mirror is used once both users and computers are seeded"""
+        if self.mirror.ready:
+            return self.mirror.snapshot(self.stale_computer_days), "mirror"
+        value, cached = await self.aggregates.get(force)
+        return value, "cache" if cached else "directory"
+
+    def mark_stale(self, object_type: str = None, *_):
+        self.counts.mark_stale(object_type)
+        self.aggregates.mark_stale(object_type)
+
+    def status(self) -> dict:
+        return {
+            "counts": self.counts.status(),
+            "aggregates": {**self.aggregates.status(), "mirror_ready": self.mirror.ready},
+        }
+
+
+dashboard_stats = DashboardStats(
+    ttl=DASHBOARD_STATS_CONFIG["ttl"],
+    aggregates_ttl=DASHBOARD_STATS_CONFIG["aggregates_ttl"],
+    stale_computer_days=DASHBOARD_STATS_CONFIG["stale_computer_days"],
+    enabled=DASHBOARD_STATS_CONFIG["cache_enabled"],
+)
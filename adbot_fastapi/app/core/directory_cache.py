@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from . import tracing
+from .config import DIRECTORY_CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Object types the cache knows about; each has its own TTL
+OBJECT_TYPES = ("users", "groups", "computers", "ous")
+
+
+class DirectoryCache:
+    """Size-bounded LRU cache of directory reads with per-object-type TTLs.
+
+    Entries are keyed by (object_type, key) where key is a tuple whose first
+    element is the scope: ("list", ...) for listings, ("detail", identity) for
+    a single object. Mutating endpoints call invalidate_object() so the next
+    read goes back to AD. Every invalidation bumps the type's generation; a
+    reader takes generation() before fetching and passes it to set(), which
+    drops the value if a write invalidated the type meanwhile.
+    """
+
+    def __init__(self, ttls: dict, max_entries: int = 512, enabled: bool = True):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._generations = {}
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "stale_sets": 0, "evictions": 0, "expirations": 0,
+                       "invalidations": 0}
+
+    def add_listener(self, callback):
+        """Call callback(object_type, identity) whenever entries are invalidated"""
+        self._listeners.append(callback)
+
+    def _notify(self, object_type: str, identity: str = None):
+        for callback in self._listeners:
+            try:
+                callback(object_type, identity)
+            except Exception as e:
+                logger.warning(f"Directory cache listener failed: {str(e)}")
+
+    @staticmethod
+    def detail_key(identity: str) -> tuple:
+        return ("detail", identity.lower())
+
+    def get(self, object_type: str, key: tuple):
+        """Return the cached value, or None on a miss or expired entry"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get((object_type, key))
+            if entry is None:
+                self._stats["misses"] += 1
+                tracing.cache_event("directory", False, object_type)
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[(object_type, key)]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                tracing.cache_event("directory", False, object_type)
+                return None
+            self._entries.move_to_end((object_type, key))
+            self._stats["hits"] += 1
+            tracing.cache_event("directory", True, object_type)
+            return value
+
+    def generation(self, object_type: str) -> int:
+        """Invalidation count of an object type, to pass to set() after the fetch"""
+        with self._lock:
+            return self._generations.get(object_type, 0)
+
+    def _bump(self, object_type: str = None):
+        for t in ({*OBJECT_TYPES, *self._generations} if object_type is None else (object_type,)):
+            self._generations[t] = self._generations.get(t, 0) + 1
+
+    def set(self, object_type: str, key: tuple, value, ttl: float = None, generation: int = None):
+        """Cache value; with a generation, only if object_type was not invalidated since it was taken"""
+        if not self.enabled:
+            return
+        ttl = self.ttls.get(object_type, 60) if ttl is None else ttl
+        with self._lock:
+            if generation is not None and generation != self._generations.get(object_type, 0):
+                # The read started before a write and may hold pre-write data
+                self._stats["stale_sets"] += 1
+                return
+            self._entries[(object_type, key)] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end((object_type, key))
+            self._stats["sets"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, object_type: str = None, key: tuple = None) -> int:
+        """Drop one entry, every entry of an object type, or everything"""
+        with self._lock:
+            if object_type is None:
+                doomed = list(self._entries)
+            elif key is None:
+                doomed = [k for k in self._entries if k[0] == object_type]
+            else:
+                doomed = [(object_type, key)] if (object_type, key) in self._entries else []
+            for k in doomed:
+                del self._entries[k]
+            self._bump(object_type)
+            self._stats["invalidations"] += len(doomed)
+        if doomed:
+            logger.info(f"Directory cache invalidated {len(doomed)} entries ({object_type or 'all'})")
+        self._notify(object_type, key[1] if key and key[0] == "detail" else None)
+        return len(doomed)
+
+    def invalidate_object(self, object_type: str, identity: str = None) -> int:
+        """Drop an object's detail entry plus every listing of its type that may contain it"""
+        detail = self.detail_key(identity) if identity else None
+        with self._lock:
+            doomed = [
+                k for k in self._entries
+                if k[0] == object_type and (k[1][0] != "detail" or k[1] == detail)
+            ]
+            for k in doomed:
+                del self._entries[k]
+            self._bump(object_type)
+            self._stats["invalidations"] += len(doomed)
+        self._notify(object_type, identity)
+        return len(doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_type = {t: 0 for t in OBJECT_TYPES}
+            for object_type, _ in self._entries:
+                per_type[object_type] = per_type.get(object_type, 0) + 1
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "entries_by_type": per_type,
+                "ttl_seconds": dict(self.ttls),
+                "hit_ratio": round(self._stats["hits"] / lookups, 3) if lookups else None,
+                **self._stats,
+            }
+
+
+directory_cache = DirectoryCache(
+    ttls=DIRECTORY_CACHE_CONFIG["ttl"],
+    max_entries=DIRECTORY_CACHE_CONFIG["max_entries"],
+    enabled=DIRECTORY_CACHE_CONFIG["enabled"],
+)
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from .config import DIRECTORY_SYNC_CONFIG
+from .records import RECORD_TYPES
+from .powershell_client import execute_remote_ps_async
+
+logger = logging.getLogger(__name__)
+
+# What each mirrored object type fetches. "public_fields" is the shape the list
+# endpoints return; the remaining attributes are kept for filtering and deltas.
+SYNC_PROJECTIONS = {
+    "users": {
+        "cmdlet": "Get-ADUser",
+        "properties": "Name, SamAccountName, Enabled, LastLogonDate, Description, Department, GivenName, Surname, "
+                      "DisplayName, UserPrincipalName, EmailAddress, LockedOut, DistinguishedName, ObjectGUID, uSNChanged",
+        "select": "Name, SamAccountName, Enabled, "
+                  "@{Name='LastLogonDate'; Expression={if ($_.LastLogonDate) {$_.LastLogonDate.ToString('yyyy-MM-dd HH:mm:ss')} else {'Never'}}}, "
+                  "Description, Department, GivenName, Surname, DisplayName, UserPrincipalName, EmailAddress, LockedOut, "
+                  "DistinguishedName, @{Name='ObjectGUID'; Expression={$_.ObjectGUID.ToString()}}, uSNChanged",
+        "deleted_filter": "(objectClass=user)(!(objectClass=computer))",
+        "public_fields": ("Name", "SamAccountName", "Enabled", "LastLogonDate", "Description", "Department",
+                          "GivenName", "Surname", "DisplayName", "UserPrincipalName"),
+    },
+    "groups": {
+        "cmdlet": "Get-ADGroup",
+        "properties": "Name, SamAccountName, Description, DistinguishedName, ObjectGUID, uSNChanged",
+        "select": "Name, SamAccountName, Description, DistinguishedName, "
+                  "@{Name='ObjectGUID'; Expression={$_.ObjectGUID.ToString()}}, uSNChanged",
+        "deleted_filter": "(objectClass=group)",
+        "public_fields": ("Name", "SamAccountName", "Description", "DistinguishedName"),
+    },
+    "computers": {
+        "cmdlet": "Get-ADComputer",
+        "properties": "Name, SamAccountName, Description, Enabled, OperatingSystem, LastLogonDate, DistinguishedName, "
+                      "ObjectGUID, uSNChanged",
+        "select": "Name, SamAccountName, Description, Enabled, OperatingSystem, LastLogonDate, DistinguishedName, "
+                  "@{Name='ObjectGUID'; Expression={$_.ObjectGUID.ToString()}}, uSNChanged",
+        "deleted_filter": "(objectClass=computer)",
+        "public_fields": ("Name", "SamAccountName", "Description", "Enabled", "OperatingSystem", "LastLogonDate",
+                          "DistinguishedName"),
+    },
+}
+
+
+def build_sync_script(object_type: str, since_usn: int = None) -> str:
+    """Full enumeration when since_usn is None, otherwise only objects changed after it"""
+    projection = SYNC_PROJECTIONS[object_type]
+    if since_usn is None:
+        selector = "-Filter *"
+        deleted = "$deleted = @()"
+    else:
+        selector = f'-LDAPFilter "(uSNChanged>={since_usn + 1})"'
+        deleted = (
+            f'$deleted = @(Get-ADObject -IncludeDeletedObjects -LDAPFilter '
+            f'"(&(isDeleted=TRUE)(uSNChanged>={since_usn + 1}){projection["deleted_filter"]})" | '
+            f'ForEach-Object {{ $_.ObjectGUID.ToString() }})'
+        )
+    return f'''
+    try {{
+        # Read the high-water mark first so changes made during the query are picked up next time
+        $highestUsn = [long](Get-ADRootDSE).highestCommittedUSN
+        $changed = @({projection["cmdlet"]} {selector} -Properties {projection["properties"]} -ResultPageSize 1000 |
+                     Select-Object {projection["select"]})
+        {deleted}
+        @{{
+            HighestCommittedUSN = $highestUsn
+            Changed = $changed
+            Deleted = $deleted
+        }} | ConvertTo-Json -Depth 3 -Compress
+    }} catch {{
+        Write-Error "PowerShell Error: $($_.Exception.Message)"
+        exit 1
+    }}
+    '''
+
+
+class DirectoryMirror:
+    """Local copy of one object type, seeded once and then kept current from uSNChanged deltas"""
+
+    def __init__(self, object_type: str, tombstone_retention: float):
+        self.object_type = object_type
+        self.projection = SYNC_PROJECTIONS[object_type]
+        self.record_type = RECORD_TYPES[object_type]
+        self.available_fields = frozenset(p.strip() for p in self.projection["properties"].split(","))
+        self.tombstone_retention = tombstone_retention
+        self.objects = {}
+        self.tombstones = {}
+        self.high_water_mark = None
+        self.last_sync_at = None
+        self.last_delta = {"changed": 0, "deleted": 0, "duration_ms": 0}
+        self.totals = {"syncs": 0, "changed": 0, "deleted": 0, "errors": 0}
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def seeded(self) -> bool:
+        return self.high_water_mark is not None
+
+    def apply(self, payload: dict, duration_ms: float, full: bool):
+        """Merge a sync payload; returns (changed records, SamAccountNames of removed objects)"""
+        changed = payload.get("Changed") or []
+        if isinstance(changed, dict):
+            changed = [changed]
+        changed = [self.record_type(record) for record in changed]
+        deleted = payload.get("Deleted") or []
+        if isinstance(deleted, str):
+            deleted = [deleted]
+        now = time.time()
+        removed_names = []
+        with self._lock:
+            if full:
+                self.objects = {}
+            for record in changed:
+                self.objects[record["ObjectGUID"]] = record
+                self.tombstones.pop(record["ObjectGUID"], None)
+            for guid in deleted:
+                removed = self.objects.pop(guid, None)
+                self.tombstones[guid] = {
+                    "deleted_at": now,
+                    "SamAccountName": removed.get("SamAccountName") if removed else None,
+                }
+                removed_names.append(self.tombstones[guid]["SamAccountName"])
+            for guid in [g for g, t in self.tombstones.items() if now - t["deleted_at"] > self.tombstone_retention]:
+                del self.tombstones[guid]
+            self.high_water_mark = int(payload["HighestCommittedUSN"])
+            self.last_sync_at = now
+            self.last_delta = {"changed": len(changed), "deleted": len(deleted), "duration_ms": round(duration_ms, 1)}
+            self.totals["syncs"] += 1
+            self.totals["changed"] += len(changed)
+            self.totals["deleted"] += len(deleted)
+            self.last_error = None
+        return changed, removed_names
+
+    def records(self, where=None, fields: tuple = None) -> list:
+        """Snapshot of the mirrored objects in the public list shape, sorted like Sort-Object Name.
+
+        where, if given, is a predicate over the full mirrored record (e.g.
+        CompiledQuery.matches), so it can test attributes the list omits.
+        fields replaces the public list shape with another projection.
+        """
+        fields = fields or self.projection["public_fields"]
+        with self._lock:
+            objects = list(self.objects.values())
+        if where is not None:
+            objects = [o for o in objects if where(o)]
+        objects.sort(key=lambda o: (o.get("Name") or "").lower())
+        return [o.project(fields) for o in objects]
+
+    def raw_records(self) -> list:
+        with self._lock:
+            return list(self.objects.values())
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "seeded": self.seeded,
+                "objects": len(self.objects),
+                "tombstones": len(self.tombstones),
+                "high_water_mark": self.high_water_mark,
+                "last_sync_at": datetime.fromtimestamp(self.last_sync_at, timezone.utc).isoformat() if self.last_sync_at else None,
+                "lag_seconds": round(time.time() - self.last_sync_at, 1) if self.last_sync_at else None,
+                "last_delta": dict(self.last_delta),
+                "totals": dict(self.totals),
+                "last_error": self.last_error,
+            }
+
+
+class DirectorySync:
+    """Background engine polling AD for changed objects and applying them to the mirrors"""
+
+    def __init__(self, object_types, interval: float, tombstone_retention: float):
+        self.interval = interval
+        self.mirrors = {t: DirectoryMirror(t, tombstone_retention) for t in object_types}
+        # POST /sync/run and the background loop must not apply overlapping deltas for one type
+        self._locks = {t: asyncio.Lock() for t in object_types}
+        self._task = None
+        self._wake = None
+        self._loop = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call callback(object_type, changed, removed, full) after every applied delta"""
+        self._listeners.append(callback)
+
+    def is_ready(self, object_type: str) -> bool:
+        mirror = self.mirrors.get(object_type)
+        return self._task is not None and mirror is not None and mirror.seeded
+
+    def covers(self, object_type: str, fields: tuple = None) -> bool:
+        """Whether the mirror is ready and holds every requested field"""
+        if not self.is_ready(object_type):
+            return False
+        return fields is None or set(fields) <= self.mirrors[object_type].available_fields
+
+    def records(self, object_type: str, where=None, fields: tuple = None) -> list:
+        return self.mirrors[object_type].records(where, fields)
+
+    async def sync_once(self, object_type: str):
+        async with self._locks[object_type]:
+            await self._sync(object_type)
+
+    async def _sync(self, object_type: str):
+        mirror = self.mirrors[object_type]
+        full = not mirror.seeded
+        started = time.perf_counter()
+        try:
+            stdout, stderr, rc = await execute_remote_ps_async(build_sync_script(object_type, mirror.high_water_mark), retry=True)
+            if rc != 0:
+                raise RuntimeError(f"Sync query failed: {stderr}")
+            payload = json.loads(stdout)
+        except Exception as e:
+            mirror.totals["errors"] += 1
+            mirror.last_error = str(e)
+            logger.error(f"Directory sync of {object_type} failed: {str(e)}")
+            return
+        changed, removed = mirror.apply(payload, (time.perf_counter() - started) * 1000, full)
+        logger.info(f"Directory sync of {object_type}: {mirror.last_delta}")
+        for callback in self._listeners:
+            try:
+                callback(object_type, mirror.raw_records() if full else changed, removed, full)
+            except Exception as e:
+                logger.warning(f"Directory sync listener failed: {str(e)}")
+
+    async def sync_all(self):
+        await asyncio.gather(*(self.sync_once(t) for t in self.mirrors))
+
+    async def _run(self):
+        while True:
+            await self.sync_all()
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def request_sync(self, *_):
+        """Poll early, e.g. right after the API itself changed an object"""
+        if self._wake is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def status(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "interval_seconds": self.interval,
+            "object_types": {t: m.status() for t, m in self.mirrors.items()},
+        }
+
+
+directory_sync = DirectorySync(
+    object_types=DIRECTORY_SYNC_CONFIG["object_types"],
+    interval=DIRECTORY_SYNC_CONFIG["interval"],
+    tombstone_retention=DIRECTORY_SYNC_CONFIG["tombstone_retention"],
+)
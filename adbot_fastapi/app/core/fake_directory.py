@@ -0,0 +1,998 @@
+import heapq
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from itertools import takewhile
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+
+from .config import FAKE_DIRECTORY_CONFIG
+from .paging import PAGE_KEYS
+
+logger = logging.getLogger(__name__)
+
+# In-process stand-in for a domain controller. Objects are generated on demand
+# from their index, so memory stays flat from 10k to 1M objects; changes made
+# through the API are kept as overrides on top. Scripts are not interpreted as
+# PowerShell: each script family the routers and core modules generate is
+# recognised and answered with the JSON the real cmdlets would have produced.
+
+OBJECT_TYPES = ("users", "groups", "computers", "ous")
+
+_GIVEN = ("James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+          "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen")
+_SURNAMES = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+             "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin")
+_DEPARTMENTS = ("IT", "HR", "Finance", "Sales", "Marketing", "Engineering", "Support", "Legal", "Operations", "Research")
+_TITLES = ("Analyst", "Engineer", "Manager", "Specialist", "Coordinator", "Director", "Administrator", "Consultant")
+_OPERATING_SYSTEMS = (("Windows 11 Enterprise", "10.0 (22631)"), ("Windows 10 Enterprise", "10.0 (19045)"),
+                      ("Windows Server 2022 Standard", "10.0 (20348)"), ("Windows Server 2019 Standard", "10.0 (17763)"))
+
+# Fixed ids of the two built-in groups every account has as primary group
+_DOMAIN_COMPUTERS_RID = 515
+_DOMAIN_USERS_RID = 513
+
+# LDAP attribute names to the attribute names the cmdlets expose
+_LDAP_ATTRIBUTES = {
+    "samaccountname": "SamAccountName", "name": "Name", "cn": "Name", "sn": "Surname", "givenname": "GivenName",
+    "displayname": "DisplayName", "department": "Department", "mail": "EmailAddress",
+    "userprincipalname": "UserPrincipalName", "distinguishedname": "DistinguishedName", "description": "Description",
+    "operatingsystem": "OperatingSystem", "primarygroupid": "primaryGroupID", "usnchanged": "uSNChanged",
+    "title": "Title", "dnshostname": "DNSHostName",
+}
+
+# Write cmdlets the fake applies; scripts using any other write cmdlet are refused
+_SUPPORTED_WRITES = ("Enable-ADAccount", "Disable-ADAccount", "Add-ADGroupMember", "Remove-ADGroupMember", "Remove-ADUser",
+                     "Set-ADUser", "New-ADUser")
+_WRITE_CMDLET = re.compile(r"\b((?:New|Set|Remove|Add|Enable|Disable|Move|Rename|Unlock|Clear)-AD\w+)")
+
+_GET_CMDLET = re.compile(r"\b(Get-ADUser|Get-ADGroup|Get-ADComputer|Get-ADOrganizationalUnit)\b(?!Member)")
+_CMDLET_TYPES = {"Get-ADUser": "users", "Get-ADGroup": "groups", "Get-ADComputer": "computers",
+                 "Get-ADOrganizationalUnit": "ous"}
+
+
+class FakeDirectoryError(Exception):
+    """Raised for a script the fake directory cannot answer; reported as PowerShell stderr"""
+
+
+def _json_value(value):
+    """A Python attribute value as ConvertTo-Json in Windows PowerShell renders it"""
+    if isinstance(value, datetime):
+        return f"/Date({int(value.timestamp() * 1000)})/"
+    return value
+
+
+def _split_top_level(text: str, separator: str) -> list:
+    """Split on separator outside quotes, braces and parentheses"""
+    parts, depth, quote, current = [], 0, None, []
+    for ch in text:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch in "({":
+            depth += 1
+        elif ch in ")}":
+            depth -= 1
+        elif ch == separator and depth == 0:
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"`(.)", r"\1", value[1:-1])
+    return value
+
+
+def _wildcard(pattern: str) -> re.Pattern:
+    return re.compile("^" + ".*".join(re.escape(p) for p in pattern.split("*")) + "$", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _compile_expression(expression: str):
+    """Function (object, variables) -> value for a Select-Object or hashtable expression"""
+    expression = expression.strip()
+    if expression == "@()":
+        return lambda obj, variables: []
+    if expression in ("$true", "$false"):
+        return lambda obj, variables: expression == "$true"
+    if expression.startswith('"') and expression.endswith('"'):
+        literal = _unquote(expression)
+        return lambda obj, variables: literal
+    if re.fullmatch(r"\$\w+", expression):
+        name = expression[1:].lower()
+        return lambda obj, variables: variables.get(name) if variables is not None else None
+    match = re.search(r"\$(\w+)\.(\w+)", expression)
+    if not match:
+        raise FakeDirectoryError(f"Unsupported expression: {expression}")
+    variable, attribute = match.group(1).lower(), match.group(2)
+
+    def read(obj, variables):
+        source = obj if variable in ("_", "o") or variables is None else variables.get(variable, obj)
+        return source[attribute] if attribute in source else _attribute(source, attribute)
+
+    if "ToString('yyyy-MM-dd HH:mm:ss')" in expression:
+        missing = "Never" if "'Never'" in expression else None
+        return lambda obj, variables: missing if (v := read(obj, variables)) is None else v.strftime("%Y-%m-%d %H:%M:%S")
+    if expression.startswith("[string]") or expression.endswith(".ToString()"):
+        return lambda obj, variables: None if (v := read(obj, variables)) is None else str(v)
+    return lambda obj, variables: _json_value(read(obj, variables))
+
+
+class LdapFilter:
+    """Just enough of RFC 4515 to evaluate the filters this API builds"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tree, _ = self._parse(text.strip(), 0)
+
+    def _parse(self, s: str, i: int):
+        if s[i] != "(":
+            raise FakeDirectoryError(f"Unsupported LDAP filter: {s}")
+        i += 1
+        if s[i] in "&|!":
+            op, i, children = s[i], i + 1, []
+            while s[i] == "(":
+                child, i = self._parse(s, i)
+                children.append(child)
+            return (op, children), i + 1
+        depth, j = 0, i
+        while s[j] != ")" or depth:
+            depth += {"(": 1, ")": -1}.get(s[j], 0)
+            j += 1
+        match = re.match(r"^([\w.\-;]+?)(?::([\d.]+):)?(>=|<=|~=|=)(.*)$", s[i:j], re.DOTALL)
+        if not match:
+            raise FakeDirectoryError(f"Unsupported LDAP filter item: {s[i:j]}")
+        attr, rule, op, value = match.groups()
+        value = re.sub(r"\\([0-9a-fA-F]{2})", lambda m: chr(int(m.group(1), 16)), value)
+        return ("item", attr.lower(), rule, op, value), j + 1
+
+    def matches(self, obj: dict) -> bool:
+        return self._eval(self.tree, obj)
+
+    def lower_bound(self, attribute: str, op: str = ">="):
+        """Value of a top-level (attribute>=value) clause, used to seek in name order"""
+        nodes = self.tree[1] if self.tree[0] == "&" else [self.tree]
+        for node in nodes:
+            if node[0] == "item" and node[1] == attribute and node[3] == op:
+                return node[4]
+        return None
+
+    def _eval(self, node, obj: dict) -> bool:
+        if node[0] == "&":
+            return all(self._eval(c, obj) for c in node[1])
+        if node[0] == "|":
+            return any(self._eval(c, obj) for c in node[1])
+        if node[0] == "!":
+            return not self._eval(node[1][0], obj)
+        _, attr, rule, op, value = node
+        object_type = obj["_type"]
+        if attr == "objectcategory":
+            return {"person": "users", "computer": "computers", "group": "groups",
+                    "organizationalunit": "ous"}.get(value.lower()) == object_type or value == "*"
+        if attr == "objectclass":
+            classes = {"users": ("user", "person", "top"), "computers": ("computer", "user", "top"),
+                       "groups": ("group", "top"), "ous": ("organizationalunit", "top")}[object_type]
+            return value == "*" or value.lower() in classes
+        if attr == "anr":
+            term = value.lower()
+            return any((obj.get(f) or "").lower().startswith(term)
+                       for f in ("Name", "SamAccountName", "DisplayName", "GivenName", "Surname"))
+        if attr == "useraccountcontrol":
+            uac = 512 | (0 if obj.get("Enabled", True) else 2)
+            return bool(uac & int(value)) if rule else uac == int(value)
+        if attr == "lastlogontimestamp":
+            last = obj.get("LastLogonDate")
+            if value == "*":
+                return last is not None
+            if last is None:
+                return False
+            filetime = int((last - datetime(1601, 1, 1, tzinfo=timezone.utc)).total_seconds() * 10_000_000)
+            return filetime <= int(value) if op == "<=" else filetime >= int(value)
+        actual = obj.get(_LDAP_ATTRIBUTES.get(attr, attr))
+        if value == "*" and op == "=":
+            return actual not in (None, "", [])
+        if actual is None:
+            return False
+        if isinstance(actual, (int, float)) and not isinstance(actual, bool):
+            return {">=": actual >= int(value), "<=": actual <= int(value)}.get(op, actual == int(value))
+        actual = str(actual).lower()
+        if op == ">=":
+            return actual >= value.lower()
+        if op == "<=":
+            return actual <= value.lower()
+        return bool(_wildcard(value).match(actual)) if "*" in value else actual == value.lower()
+
+
+def _ps_filter(text: str):
+    """Predicate for the -Filter expressions this API builds: clauses joined by -and"""
+    text = text.strip()
+    if text in ("*", ""):
+        return lambda obj: True, None
+    clauses, lower_bound = [], None
+    for part in re.split(r"\s+-and\s+", text):
+        part = part.strip()
+        while part.startswith("(") and part.endswith(")"):
+            part = part[1:-1].strip()
+        if part == "*":
+            continue
+        match = re.match(r"^(\w+)\s+-(eq|ne|ge|gt|le|lt|like)\s+('(?:[^']|'')*'|\"[^\"]*\"|\S+)$", part, re.IGNORECASE)
+        if not match:
+            raise FakeDirectoryError(f"Unsupported -Filter expression: {part}")
+        attr, op, value = match.group(1), match.group(2).lower(), _unquote(match.group(3))
+        if attr.lower() == "name" and op == "ge":
+            lower_bound = value
+        clauses.append((attr, op, value))
+
+    def predicate(obj: dict) -> bool:
+        for attr, op, value in clauses:
+            actual = str(_attribute(obj, attr) or "").lower()
+            v = value.lower()
+            ok = {"eq": actual == v, "ne": actual != v, "ge": actual >= v, "gt": actual > v, "le": actual <= v,
+                  "lt": actual < v, "like": bool(_wildcard(v).match(actual))}[op]
+            if not ok:
+                return False
+        return True
+    return predicate, lower_bound
+
+
+def _attribute(obj: dict, name: str):
+    if name in obj:
+        return obj[name]
+    name = _LDAP_ATTRIBUTES.get(name.lower(), name)
+    for key, value in obj.items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+class SyntheticDirectory:
+    """Deterministic users, groups, computers and OUs, plus the changes made to them"""
+
+    def __init__(self, objects: int, domain: str):
+        self.domain = domain
+        self.base_dn = ",".join(f"DC={part}" for part in domain.split("."))
+        ous = max(1, objects // 100)
+        groups = max(3, objects // 20)
+        computers = max(1, objects * 14 // 100)
+        self.sizes = {"users": max(1, objects - ous - groups - computers), "groups": groups,
+                      "computers": computers, "ous": ous}
+        self.reference_time = datetime.now(timezone.utc).replace(microsecond=0)
+        # uSNChanged of generated objects is 1000 + a running index across types
+        self._usn_base, offset = {}, 1000
+        for object_type in OBJECT_TYPES:
+            self._usn_base[object_type] = offset
+            offset += self.sizes[object_type]
+        self.usn = offset
+        self.overrides = {t: {} for t in OBJECT_TYPES}
+        self.deleted = {t: {} for t in OBJECT_TYPES}
+        # Objects made through the API, by lowercase SamAccountName; generated ones are addressed by index instead
+        self.added = {t: {} for t in OBJECT_TYPES}
+        self.added_members = {}
+        self.removed_members = {}
+        self.lock = threading.RLock()
+
+    # Generation
+
+    def _ou_dn(self, index: int) -> str:
+        return f"OU=Unit {index % self.sizes['ous']:04d},{self.base_dn}"
+
+    def _guid(self, object_type: str, index: int) -> str:
+        return f"{OBJECT_TYPES.index(object_type) + 1:08x}-0000-4000-8000-{index:012x}"
+
+    def name_of(self, object_type: str, index: int) -> str:
+        if object_type == "users":
+            return f"User {index:07d}"
+        if object_type == "groups":
+            return ("Domain Computers", "Domain Users")[index] if index < 2 else f"Group {index:05d}"
+        if object_type == "computers":
+            return f"PC-{index:06d}"
+        return f"Unit {index:04d}"
+
+    def group_dn(self, index: int) -> str:
+        if index < 2:
+            return f"CN={self.name_of('groups', index)},CN=Users,{self.base_dn}"
+        return f"CN=Group {index:05d},{self._ou_dn(index)}"
+
+    def _user_group(self, index: int) -> int:
+        return 2 + index % (self.sizes["groups"] - 2)
+
+    def _parent_group(self, index: int):
+        return 2 + (index - 3) // 4 if index >= 3 else None
+
+    def _generate(self, object_type: str, index: int) -> dict:
+        ref = self.reference_time
+        obj = {"_type": object_type, "_index": index, "Name": self.name_of(object_type, index),
+               "ObjectGUID": self._guid(object_type, index), "uSNChanged": self._usn_base[object_type] + index,
+               "Created": ref - timedelta(days=30 + index % 2000)}
+        obj["Modified"] = obj["Created"] + timedelta(days=index % 30)
+        if object_type == "users":
+            given, surname = _GIVEN[index % len(_GIVEN)], _SURNAMES[(index // len(_GIVEN)) % len(_SURNAMES)]
+            department = _DEPARTMENTS[index % len(_DEPARTMENTS)]
+            sam = f"user{index:07d}"
+            obj.update({
+                "SamAccountName": sam, "GivenName": given, "Surname": surname, "DisplayName": f"{given} {surname}",
+                "UserPrincipalName": f"{sam}@{self.domain}", "EmailAddress": f"{given.lower()}.{surname.lower()}{index}@{self.domain}",
+                "Department": department, "Title": _TITLES[index % len(_TITLES)], "Description": f"{department} staff",
+                "OfficePhone": f"+1 555 {index % 10000:04d}", "Manager": None,
+                "DistinguishedName": f"CN={obj['Name']},{self._ou_dn(index)}",
+                "Enabled": index % 19 != 0, "LockedOut": index % 97 == 0,
+                "LastLogonDate": None if index % 23 == 0 else ref - timedelta(days=(index * 7) % 400, minutes=index % 1440),
+                "PasswordLastSet": ref - timedelta(days=index % 180), "AccountExpirationDate": None,
+                "PasswordExpired": False, "PasswordNeverExpires": index % 11 == 0,
+                "MemberOf": [self.group_dn(self._user_group(index))], "primaryGroupID": _DOMAIN_USERS_RID,
+            })
+        elif object_type == "groups":
+            parent = self._parent_group(index)
+            obj.update({
+                "SamAccountName": self.name_of("groups", index) if index < 2 else f"group{index:05d}",
+                "Description": "Built-in group" if index < 2 else f"Synthetic group {index}",
+                "DistinguishedName": self.group_dn(index), "GroupCategory": "Security", "GroupScope": "Global",
+                "ManagedBy": None, "Rid": (_DOMAIN_COMPUTERS_RID, _DOMAIN_USERS_RID)[index] if index < 2 else 1100 + index,
+                "MemberOf": [self.group_dn(parent)] if parent is not None else [],
+            })
+        elif object_type == "computers":
+            os_name, os_version = _OPERATING_SYSTEMS[index % len(_OPERATING_SYSTEMS)]
+            obj.update({
+                "SamAccountName": f"{obj['Name']}$", "DNSHostName": f"{obj['Name'].lower()}.{self.domain}",
+                "Description": f"Workstation {index}", "Enabled": index % 29 != 0,
+                "OperatingSystem": os_name, "OperatingSystemVersion": os_version,
+                "IPv4Address": f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}",
+                "LastLogonDate": None if index % 31 == 0 else ref - timedelta(days=(index * 3) % 200),
+                "DistinguishedName": f"CN={obj['Name']},{self._ou_dn(index)}", "primaryGroupID": _DOMAIN_COMPUTERS_RID,
+            })
+        else:
+            obj.update({
+                "DistinguishedName": f"OU={obj['Name']},{self.base_dn}", "Description": f"Organizational unit {index}",
+                "ManagedBy": None,
+            })
+        return obj
+
+    def _direct_member_dns(self, index: int) -> list:
+        """member attribute of a group; primary-group members are not listed, as in AD"""
+        if index < 2:
+            return []
+        span = self.sizes["groups"] - 2
+        members = [f"CN=User {i:07d},{self._ou_dn(i)}" for i in range(index - 2, self.sizes["users"], span)]
+        first_child = 4 * (index - 2) + 3
+        members += [self.group_dn(k) for k in range(first_child, min(first_child + 4, self.sizes["groups"]))]
+        return members
+
+    def get_index(self, object_type: str, index: int):
+        """The object as it stands now, or None if it was deleted"""
+        obj = self._generate(object_type, index)
+        key = obj.get("SamAccountName", obj["DistinguishedName"]).lower()
+        if key in self.deleted[object_type]:
+            return None
+        override = self.overrides[object_type].get(key)
+        if override:
+            obj.update(override)
+        if object_type == "groups":
+            obj["Members"] = self.members_of(obj)
+        return obj
+
+    def members_of(self, group: dict) -> list:
+        """Member DNs of a group with API-made changes applied"""
+        key = group["SamAccountName"].lower()
+        members = self._direct_member_dns(group["_index"])
+        removed = self.removed_members.get(key)
+        if removed:
+            members = [m for m in members if m.lower() not in removed]
+        return members + sorted(self.added_members.get(key, {}).values())
+
+    # Lookup
+
+    def find(self, object_type: str, identity: str):
+        """Resolve a SamAccountName, Name or DN to the object, or None"""
+        identity = identity.strip()
+        value = identity.lower()
+        index = None
+        if value.startswith(("cn=", "ou=")):
+            value = value.split(",", 1)[0].split("=", 1)[1]
+        if object_type == "users":
+            match = re.fullmatch(r"user ?(\d{7})", value)
+        elif object_type == "groups":
+            match = re.fullmatch(r"group ?(\d{5})", value)
+            if value in ("domain computers", "domain users"):
+                index = ("domain computers", "domain users").index(value)
+        elif object_type == "computers":
+            match = re.fullmatch(r"pc-(\d{6})\$?", value)
+        else:
+            match = re.fullmatch(r"unit (\d{4})", value)
+        if match:
+            index = int(match.group(1))
+        if index is None or index >= self.sizes[object_type]:
+            return self._find_added(object_type, identity)
+        return self.get_index(object_type, index)
+
+    def _find_added(self, object_type: str, identity: str):
+        value = identity.lower()
+        added = self.added[object_type]
+        obj = added.get(value) or next(
+            (o for o in added.values() if value in (o["Name"].lower(), o["DistinguishedName"].lower())), None)
+        if obj is None or obj["SamAccountName"].lower() in self.deleted[object_type]:
+            return None
+        return obj
+
+    def count(self, object_type: str) -> int:
+        return self.sizes[object_type] + len(self.added[object_type]) - len(self.deleted[object_type])
+
+    def scan(self, object_type: str, start_name: str = None):
+        """Objects in Name order, optionally starting at the first Name >= start_name"""
+        start = 0
+        if start_name is not None:
+            start = bisect_left(range(self.sizes[object_type]), start_name.lower(),
+                                key=lambda i: self.name_of(object_type, i).lower())
+        generated = (o for o in (self.get_index(object_type, i) for i in range(start, self.sizes[object_type]))
+                     if o is not None)
+        added = sorted((o for o in self.added[object_type].values()
+                        if o["SamAccountName"].lower() not in self.deleted[object_type]
+                        and (start_name is None or o["Name"].lower() >= start_name.lower())),
+                       key=lambda o: o["Name"].lower())
+        yield from heapq.merge(generated, added, key=lambda o: o["Name"].lower()) if added else generated
+
+    # Changes
+
+    def _touch(self, object_type: str, obj: dict, **changes):
+        with self.lock:
+            self.usn += 1
+            changes.update(uSNChanged=self.usn, Modified=datetime.now(timezone.utc).replace(microsecond=0))
+            key = obj.get("SamAccountName", obj["DistinguishedName"]).lower()
+            if key in self.added[object_type]:
+                self.added[object_type][key].update(changes)
+            else:
+                self.overrides[object_type].setdefault(key, {}).update(changes)
+            obj.update(changes)
+
+    def update(self, obj: dict, **changes):
+        """Set-ADUser: changed attributes by name"""
+        if "Name" in changes:
+            raise FakeDirectoryError("The fake directory does not implement renaming an object")
+        self._touch(obj["_type"], obj, **changes)
+
+    def add_user(self, name: str, sam: str, parent_dn: str, **attributes) -> dict:
+        """New-ADUser; the account starts with only the primary group, as in AD"""
+        key = sam.lower()
+        if self.find("users", sam) is not None or key in self.deleted["users"]:
+            raise FakeDirectoryError("The specified account already exists")
+        with self.lock:
+            self.usn += 1
+            now = datetime.now(timezone.utc).replace(microsecond=0)
+            obj = {
+                "_type": "users", "_index": None, "Name": name, "ObjectGUID": f"{1:08x}-0000-4000-9000-{self.usn:012x}",
+                "uSNChanged": self.usn, "Created": now, "Modified": now, "SamAccountName": sam,
+                "GivenName": None, "Surname": None, "DisplayName": None, "UserPrincipalName": None, "EmailAddress": None,
+                "Department": None, "Title": None, "Description": None, "OfficePhone": None, "Manager": None,
+                "DistinguishedName": f"CN={name},{parent_dn}", "Enabled": False, "LockedOut": False,
+                "LastLogonDate": None, "PasswordLastSet": now, "AccountExpirationDate": None,
+                "PasswordExpired": False, "PasswordNeverExpires": False, "MemberOf": [], "primaryGroupID": _DOMAIN_USERS_RID,
+            }
+            obj.update(attributes)
+            self.added["users"][key] = obj
+        return obj
+
+    def set_enabled(self, obj: dict, enabled: bool):
+        self._touch(obj["_type"], obj, Enabled=enabled)
+
+    def move(self, obj: dict, target_ou: str):
+        rdn = obj["DistinguishedName"].split(",", 1)[0]
+        self._touch(obj["_type"], obj, DistinguishedName=f"{rdn},{target_ou}")
+
+    def delete(self, obj: dict):
+        with self.lock:
+            self.usn += 1
+            self.deleted[obj["_type"]][obj["SamAccountName"].lower()] = (obj["ObjectGUID"], self.usn)
+
+    def set_membership(self, group: dict, member: dict, add: bool):
+        key, member_dn = group["SamAccountName"].lower(), member["DistinguishedName"]
+        with self.lock:
+            if add:
+                self.removed_members.get(key, set()).discard(member_dn.lower())
+                if member_dn not in self._direct_member_dns(group["_index"]):
+                    self.added_members.setdefault(key, {})[member_dn.lower()] = member_dn
+            else:
+                self.added_members.get(key, {}).pop(member_dn.lower(), None)
+                self.removed_members.setdefault(key, set()).add(member_dn.lower())
+            member_of = [g for g in member.get("MemberOf") or [] if g.lower() != group["DistinguishedName"].lower()]
+            if add:
+                member_of.append(group["DistinguishedName"])
+        self._touch(group["_type"], group)
+        self._touch(member["_type"], member, MemberOf=member_of)
+
+    def changed_since(self, object_type: str, usn: int) -> list:
+        """Objects whose uSNChanged is at least usn, without scanning unchanged ones"""
+        first = max(usn - self._usn_base[object_type], 0)
+        indexes = set(range(first, self.sizes[object_type]))
+        for key, override in self.overrides[object_type].items():
+            if override.get("uSNChanged", 0) >= usn:
+                obj = self.find(object_type, key)
+                if obj is not None:
+                    indexes.add(obj["_index"])
+        changed = [o for o in (self.get_index(object_type, i) for i in sorted(indexes)) if o is not None]
+        return changed + [o for key, o in self.added[object_type].items()
+                          if o["uSNChanged"] >= usn and key not in self.deleted[object_type]]
+
+    def deleted_since(self, object_type: str, usn: int) -> list:
+        return [guid for guid, deleted_usn in self.deleted[object_type].values() if deleted_usn >= usn]
+
+
+class FakeDirectoryBackend:
+    """PowerShell backend answering scripts from a SyntheticDirectory, with configurable latency"""
+
+    def __init__(self, objects: int, latency_ms: float, per_object_us: float, domain: str):
+        self.config = {"server": f"fake://{domain}"}
+        self.directory = SyntheticDirectory(objects, domain)
+        self.latency_ms = latency_ms
+        self.per_object_us = per_object_us
+        self._stats = {"executions": 0, "streams": 0, "errors": 0, "objects_returned": 0, "objects_examined": 0}
+        self._stats_lock = threading.Lock()
+        self._work = threading.local()
+
+    # Backend interface shared with SessionPool
+
+    def execute(self, script: str, timings: dict = None, retry: bool = False):
+        """Run a script; returns (stdout, stderr, had_errors) like SessionPool.execute"""
+        started = time.perf_counter()
+        self._work.examined = 0
+        try:
+            output, objects = self._run(script)
+            result = (output, "", False)
+        except FakeDirectoryError as e:
+            objects = 0
+            result = ("", str(e), True)
+        examined = self._work.examined
+        self._account(objects, examined, error=result[2])
+        self._sleep(started, objects + examined)
+        if timings is not None:
+            timings["remote"] = timings.get("remote", 0.0) + time.perf_counter() - started
+        return result
+
+    def stream(self, script: str, timings: dict = None):
+        """Yield one compressed JSON line per object, like SessionPool.stream over NDJSON_PIPELINE"""
+        with self._stats_lock:
+            self._stats["streams"] += 1
+        time.sleep(self.latency_ms / 1000)
+        self._work.examined = 0
+        object_type, rows = self._listing(script)
+        count, charged, owed = 0, 0, 0.0
+        for row in rows:
+            count += 1
+            # Per-object cost is slept in slices, since sub-millisecond sleeps overshoot
+            owed += (1 + self._work.examined - charged) * self.per_object_us / 1_000_000
+            charged = self._work.examined
+            if owed >= 0.005:
+                time.sleep(owed)
+                owed = 0.0
+            yield json.dumps(row, separators=(",", ":"))
+        self._account(count, self._work.examined)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"server": self.config["server"], "backend": "fake", "objects": dict(self.directory.sizes),
+                    "latency_ms": self.latency_ms, "per_object_us": self.per_object_us, **self._stats}
+
+    def warm(self) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+    def _account(self, objects: int, examined: int = 0, error: bool = False):
+        with self._stats_lock:
+            self._stats["executions"] += 1
+            self._stats["objects_returned"] += objects
+            self._stats["objects_examined"] += examined
+            if error:
+                self._stats["errors"] += 1
+
+    def _sleep(self, started: float, objects: int):
+        remaining = (self.latency_ms / 1000 + objects * self.per_object_us / 1_000_000) - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _scan(self, object_type: str, start_name: str = None):
+        """directory.scan, charging every object examined to the running script"""
+        for obj in self.directory.scan(object_type, start_name):
+            self._work.examined += 1
+            yield obj
+
+    def _sorted(self, rows):
+        """Sort-Object reads its whole input before emitting, so every row is examined"""
+        rows = list(rows)
+        self._work.examined += len(rows)
+        return iter(rows)
+
+    # Script families
+
+    def _run(self, script: str):
+        for cmdlet in _WRITE_CMDLET.findall(script):
+            if cmdlet not in _SUPPORTED_WRITES and "foreach ($id in" not in script:
+                raise FakeDirectoryError(f"The fake directory does not implement {cmdlet}")
+        if "$env:COMPUTERNAME" in script:
+            return "Connection successful\nFAKE-DC", 0
+        if "HighestCommittedUSN" in script:
+            return self._sync(script)
+        if "member;range=" in script:
+            return self._group_members()
+        if "PrimaryGroupId =" in script:
+            return self._principals()
+        if "UsersPerOU" in script:
+            return self._aggregates(script)
+        if "DirectorySearcher" in script and "$count++" in script:
+            return self._count(script)
+        if "$pageSearcher" in script:
+            return self._page(script)
+        if "foreach ($id in @(" in script:
+            return self._bulk(script)
+        if "Get-ADDomain" in script:
+            return json.dumps({"DomainDN": self.directory.base_dn, "DomainName": self.directory.domain.split(".")[0],
+                               "NetBIOSName": self.directory.domain.split(".")[0].upper()}), 0
+        if "foreach ($filter in @(" in script:
+            return self._batch(script)
+        if "Set-ADUser -Identity $user.DistinguishedName @set" in script:
+            return self._update(script)
+        if re.search(r"-Identity\s+[\"$]", script) and (_GET_CMDLET.search(script) or re.search("|".join(_SUPPORTED_WRITES), script)):
+            return self._detail(script)
+        if _GET_CMDLET.search(script):
+            object_type, rows = self._listing(script)
+            rows = list(rows)
+            if not rows:
+                return "[]", 0
+            return json.dumps(rows[0] if len(rows) == 1 else rows), len(rows)
+        raise FakeDirectoryError("Script not recognised by the fake directory backend")
+
+    def _fields(self, select: str) -> list:
+        """(output name, expression) pairs from a Select-Object argument list"""
+        fields = []
+        for item in _split_top_level(select, ","):
+            match = re.match(r"^@\{\s*Name\s*=\s*'([^']+)'\s*;\s*Expression\s*=\s*\{(.*)\}\s*\}$", item, re.DOTALL)
+            fields.append((match.group(1), match.group(2)) if match else (item, f"$_.{item}"))
+        return fields
+
+    def _hashtable_fields(self, body: str) -> list:
+        fields = []
+        for line in body.splitlines():
+            match = re.match(r"^\s*(\w+)\s*=\s*(.+?)\s*$", line)
+            if match:
+                fields.append((match.group(1), match.group(2)))
+        return fields
+
+    def _project(self, obj: dict, fields: list, variables: dict = None) -> dict:
+        return {name: _compile_expression(expression)(obj, variables) for name, expression in fields}
+
+    def _pipeline(self, script: str):
+        """Main Get-AD* statement: (object type, cmdlet arguments, pipeline stages)"""
+        match = _GET_CMDLET.search(script)
+        lines, rest = [], script[match.start():].splitlines()
+        for line in rest:
+            lines.append(line.strip())
+            if not line.rstrip().endswith("|"):
+                break
+        statement = " ".join(lines).rstrip(")")
+        stages = _split_top_level(statement, "|")
+        return _CMDLET_TYPES[match.group(1)], stages[0][len(match.group(1)):], stages[1:]
+
+    def _source(self, object_type: str, arguments: str):
+        """Objects matched by the cmdlet's -Filter/-LDAPFilter/-SearchBase, in Name order"""
+        predicate, lower_bound = (lambda obj: True), None
+        ldap = re.search(r'-LDAPFilter\s+"((?:[^"`]|`.)*)"', arguments)
+        ps_filter = re.search(r'-Filter\s+(\*|"(?:[^"`]|`.)*")', arguments)
+        if ldap:
+            compiled = LdapFilter(_unquote('"' + ldap.group(1) + '"'))
+            predicate, lower_bound = compiled.matches, compiled.lower_bound("name")
+        elif ps_filter:
+            predicate, lower_bound = _ps_filter(_unquote(ps_filter.group(1)))
+        base = re.search(r'-SearchBase\s+"((?:[^"`]|`.)*)"', arguments)
+        base_dn = _unquote('"' + base.group(1) + '"') if base else None
+        return self._matching(object_type, predicate, lower_bound, base_dn)
+
+    def _matching(self, object_type: str, predicate, lower_bound: str = None, base_dn: str = None):
+        for obj in self._scan(object_type, lower_bound):
+            if _in_base(obj, base_dn) and predicate(obj):
+                yield obj
+
+    def _listing(self, script: str):
+        """Evaluate a listing pipeline lazily: (object type, iterator of output rows)"""
+        object_type, arguments, stages = self._pipeline(script)
+        rows = self._source(object_type, arguments)
+        projected = False
+        for stage in stages:
+            command, _, argument = stage.partition(" ")
+            argument = argument.strip()
+            if command == "Select-Object" and argument.startswith("-First"):
+                rows = _take(rows, int(argument.split()[1]))
+            elif command == "Select-Object":
+                rows = map(lambda o, fields=self._fields(argument): self._project(o, fields), rows)
+                projected = True
+            elif command == "Sort-Object":
+                # Objects already come in Name order; other sort keys are not generated by the API
+                if argument.split(",")[0].strip() not in ("Name", ""):
+                    raise FakeDirectoryError(f"Unsupported sort: {argument}")
+                rows = self._sorted(rows)
+            elif command == "ForEach-Object":
+                continue
+            else:
+                raise FakeDirectoryError(f"Unsupported pipeline stage: {command}")
+        if not projected:
+            rows = ({k: _json_value(v) for k, v in o.items() if not k.startswith("_")} for o in rows)
+        return object_type, rows
+
+    def _page(self, script: str):
+        """paging.page_search followed by a Get-AD* -LDAPFilter $pageFilter read of the page's objects"""
+        object_type, _, stages = self._pipeline(script)
+        _, tie_attr = PAGE_KEYS[object_type]
+        limit = int(re.search(r"\$pageLimit = (\d+)", script).group(1))
+        filters = [LdapFilter(_unquote(f)) for f in re.findall(r"\$pageSearcher\.Filter = ('(?:[^']|'')*')", script)]
+        root = re.search(r"DirectoryEntry\('LDAP://((?:[^']|'')*)'\)", script)
+        base_dn = _unquote("'" + root.group(1) + "'").replace("\\/", "/") if root else None
+        page = []
+        tie = re.search(r"\$_\.Tie -gt ('(?:[^']|'')*')", script)
+        if tie:
+            # Objects sharing the cursor's name after its tiebreak, then the rest from the seek on
+            same_name, after_tie = filters[0], _unquote(tie.group(1)).lower()
+            name = same_name.lower_bound("name", "=")
+            candidates = takewhile(lambda o: o["Name"].lower() == name.lower(), self._scan(object_type, name))
+            ties = sorted((o for o in candidates if (o.get(tie_attr) or "").lower() > after_tie
+                           and _in_base(o, base_dn) and same_name.matches(o)),
+                          key=lambda o: (o.get(tie_attr) or "").lower())
+            page.extend(ties[:limit])
+        seek = filters[-1]
+        if len(page) < limit:
+            page.extend(_take(self._matching(object_type, seek.matches, seek.lower_bound("name"), base_dn), limit - len(page)))
+        select = next((s for s in stages if s.startswith("Select-Object")), None)
+        if select is None:
+            raise FakeDirectoryError("Paged read without Select-Object")
+        fields = self._fields(select.partition(" ")[2])
+        rows = [self._project(o, fields) for o in page]
+        # paging.page_output: the rows plus the searcher's hit count and last in-page key
+        last = page[limit - 2] if len(page) == limit else None
+        return json.dumps({"Hits": len(page), "Last": [last["Name"], last.get(tie_attr)] if last else None,
+                           "Rows": rows}), len(rows)
+
+    def _detail(self, script: str):
+        """Scripts reading objects by -Identity into variables and emitting a hashtable"""
+        if "New-ADUser" in script:
+            self._create(re.search(r"New-ADUser(.*)", script).group(1))
+        variables = {}
+        for match in re.finditer(r'\$(\w+)\s*=\s*(Get-AD\w+)\s+-Identity\s+"([^"]*)"', script):
+            name, cmdlet, identity = match.group(1).lower(), match.group(2), match.group(3)
+            if cmdlet == "Get-ADGroupMember":
+                continue
+            object_type = _CMDLET_TYPES.get(cmdlet)
+            obj = self.directory.find(object_type, identity) if object_type else None
+            if obj is None:
+                raise FakeDirectoryError(f"Cannot find an object with identity: '{identity}'")
+            variables[name] = obj
+        self._apply_writes(script)
+        for name, obj in list(variables.items()):
+            variables[name] = self.directory.find(obj["_type"], obj["SamAccountName"] if "SamAccountName" in obj else obj["DistinguishedName"]) or obj
+        members = re.search(r'\$(\w+)\s*=\s*@\(Get-ADGroupMember\s+-Identity\s+"([^"]*)"', script)
+        if members:
+            group = self.directory.find("groups", members.group(2))
+            variables[members.group(1).lower()] = self._member_names(group) if group else []
+        for name, source, attribute in re.findall(r"^\s*\$(\w+)\s*=\s*\$(\w+)\.(\w+)\s*$", script, re.MULTILINE):
+            if source.lower() in variables:
+                variables[name.lower()] = _attribute(variables[source.lower()], attribute)
+        body = re.search(r"=\s*@\{\{?\s*\n(.*?)\n\s*\}\}?", script, re.DOTALL)
+        if body and variables:
+            first = next(iter(variables.values()))
+            return json.dumps(self._project(first, self._hashtable_fields(body.group(1)), variables)), 1
+        # Existence checks and single writes that only report a message
+        message = re.search(r'Write-Output "([^"]*)"', script)
+        if message:
+            return message.group(1), len(variables)
+        raise FakeDirectoryError("Script not recognised by the fake directory backend")
+
+    def _create(self, arguments: str):
+        """New-ADUser -Name "..." -SamAccountName "..." -Enabled $x [-Path "..."] [-Attribute "..."]..."""
+        parameters = {name: _compile_expression(value)(None, None) if value in ("$true", "$false") else _unquote(value)
+                      for name, value in re.findall(r'-(\w+)\s+("(?:[^"`]|`.)*"|\$\w+)', arguments)}
+        parameters.pop("AccountPassword", None)
+        parent = parameters.pop("Path", None) or f"CN=Users,{self.directory.base_dn}"
+        if parent.lower().startswith("ou=") and self.directory.find("ous", parent) is None:
+            raise FakeDirectoryError(f"Directory object not found: '{parent}'")
+        self.directory.add_user(parameters.pop("Name"), parameters.pop("SamAccountName"), parent, **parameters)
+
+    def _update(self, script: str):
+        """users.build_update_script: apply the differing attributes with Set-ADUser @set and report both states"""
+        identity = _unquote(re.search(r'Get-ADUser -Identity ("(?:[^"`]|`.)*")', script).group(1))
+        user = self.directory.find("users", identity)
+        if user is None:
+            return json.dumps({"NotFound": True}), 0
+        expected = re.search(r'\[string\]\$user\.uSNChanged -ne ("(?:[^"`]|`.)*")', script)
+        if expected and str(user["uSNChanged"]) != _unquote(expected.group(1)):
+            return json.dumps({"PreconditionFailed": True, "ETag": str(user["uSNChanged"])}), 0
+        fields = self._hashtable_fields(re.search(r"\$before = @\{\s*\n(.*?)\n\s*\}", script, re.DOTALL).group(1))
+        before = self._project(user, fields, {"user": user})
+        changes, applied = {}, []
+        for field, literal in re.findall(r'if \(\$before\.(\w+) -cne (\$true|\$false|"(?:[^"`]|`.)*")\)', script):
+            value = _compile_expression(literal)(user, None)
+            # -cne: a case-only difference is still written
+            if before.get(field) != value:
+                changes[field] = value
+                applied.append(field)
+        if "$set['AccountPassword']" in script:
+            changes["PasswordLastSet"] = datetime.now(timezone.utc).replace(microsecond=0)
+            applied.append("Password")
+        if changes:
+            self.directory.update(user, **changes)
+        after = self._project(user, fields, {"user": user})
+        return json.dumps({"Before": before, "After": after, "Applied": applied, "ETag": str(user["uSNChanged"])}), 1
+
+    def _apply_writes(self, script: str):
+        directory = self.directory
+        for identity, parameter, value in re.findall(
+                r'Set-ADUser\s+-Identity\s+"([^"]*)"\s+-(Enabled|ChangePasswordAtLogon)\s+(\$true|\$false)', script):
+            user = directory.find("users", identity)
+            if user is None:
+                raise FakeDirectoryError(f"Cannot find an object with identity: '{identity}'")
+            # ChangePasswordAtLogon clears pwdLastSet, which AD reports as an expired password
+            directory.update(user, **{"Enabled" if parameter == "Enabled" else "PasswordExpired": value == "$true"})
+        for cmdlet, identity in re.findall(r'\b(Enable-ADAccount|Disable-ADAccount|Remove-ADUser)\s+-Identity\s+"([^"]*)"', script):
+            user = directory.find("users", identity)
+            if user is None:
+                raise FakeDirectoryError(f"Cannot find an object with identity: '{identity}'")
+            if cmdlet == "Remove-ADUser":
+                directory.delete(user)
+            else:
+                directory.set_enabled(user, cmdlet == "Enable-ADAccount")
+        for cmdlet, group_id, member_id in re.findall(
+                r'\b(Add-ADGroupMember|Remove-ADGroupMember)\s+-Identity\s+"([^"]*)"\s+-Members\s+"([^"]*)"', script):
+            group = directory.find("groups", group_id)
+            member = directory.find("users", member_id) or directory.find("groups", member_id) or directory.find("computers", member_id)
+            if group is None or member is None:
+                raise FakeDirectoryError(f"Cannot find an object with identity: '{group_id if group is None else member_id}'")
+            directory.set_membership(group, member, add=cmdlet == "Add-ADGroupMember")
+
+    def _member_names(self, group: dict) -> list:
+        """Get-ADGroupMember | Select -Expand SamAccountName: direct members including primary-group ones"""
+        names = []
+        for dn in group["Members"]:
+            rdn = dn.split(",", 1)[0].split("=", 1)[1]
+            for object_type in ("users", "groups", "computers"):
+                member = self.directory.find(object_type, rdn)
+                if member is not None:
+                    names.append(member["SamAccountName"])
+                    break
+        return names
+
+    def _batch(self, script: str):
+        filters = re.search(r"foreach \(\$filter in @\((.*?)\)\)\s*\{", script).group(1)
+        object_type, arguments, _ = self._pipeline(script)
+        body = re.search(r"\$results\.Add\(@\{\s*\n(.*?)\n\s*\}\)", script, re.DOTALL).group(1)
+        fields = self._hashtable_fields(body)
+        results = []
+        for literal in _split_top_level(filters, ","):
+            compiled = LdapFilter(_unquote(literal))
+            # Batch filters are indexed equality matches on a DC, so only returned objects are charged
+            for obj in self.directory.scan(object_type):
+                if compiled.matches(obj):
+                    variables = {"o": obj, "members": self._member_names(obj) if object_type == "groups" else []}
+                    results.append(self._project(obj, fields, variables))
+        return json.dumps(results), len(results)
+
+    def _bulk(self, script: str):
+        ids = [_unquote(i) for i in _split_top_level(re.search(r"foreach \(\$id in @\((.*?)\)\)\s*\{", script).group(1), ",")]
+        action = re.search(r"\b(Enable-ADAccount|Disable-ADAccount|Remove-ADUser|Move-ADObject)\b", script).group(1)
+        message = re.search(r'Message = "([^"]*)"', script).group(1)
+        target = re.search(r'-TargetPath "((?:[^"`]|`.)*)"', script)
+        results = []
+        for identity in ids:
+            user = self.directory.find("users", identity)
+            if user is None:
+                results.append({"Message": "User not found", "SamAccountName": identity,
+                                "Error": f"User '{identity}' does not exist in Active Directory", "Success": False})
+                continue
+            result = {"Message": message, "SamAccountName": user["SamAccountName"], "Name": user["Name"]}
+            if action == "Enable-ADAccount":
+                self.directory.set_enabled(user, True)
+                result["Enabled"] = True
+            elif action == "Disable-ADAccount":
+                self.directory.set_enabled(user, False)
+                result["Enabled"] = False
+            elif action == "Remove-ADUser":
+                self.directory.delete(user)
+                result["DistinguishedName"] = user["DistinguishedName"]
+            else:
+                target_ou = _unquote('"' + target.group(1) + '"')
+                result.update(PreviousLocation=user["DistinguishedName"], TargetOU=target_ou)
+                self.directory.move(user, target_ou)
+            result["Success"] = True
+            results.append(result)
+        return json.dumps(results), len(results)
+
+    def _count(self, script: str):
+        ldap = LdapFilter(re.search(r'\$searcher\.Filter = "([^"]*)"', script).group(1))
+        object_type = next(t for t in OBJECT_TYPES if ldap.matches({"_type": t, "Enabled": True}))
+        count = sum(1 for obj in self._scan(object_type) if ldap.matches(obj))
+        return str(count), 0
+
+    def _aggregates(self, script: str):
+        stale_days = int(re.search(r"AddDays\(-(\d+)\)", script).group(1))
+        cutoff = datetime.now(timezone.utc) - timedelta(days=stale_days)
+        enabled = disabled = locked = 0
+        per_ou = {}
+        for user in self._scan("users"):
+            if user["Enabled"]:
+                enabled += 1
+            else:
+                disabled += 1
+            locked += bool(user["LockedOut"])
+            parent = user["DistinguishedName"].split(",", 1)[1]
+            per_ou[parent] = per_ou.get(parent, 0) + 1
+        stale = sum(1 for c in self._scan("computers") if c["LastLogonDate"] is None or c["LastLogonDate"] <= cutoff)
+        return json.dumps({"Enabled": enabled, "Disabled": disabled, "Locked": locked, "StaleComputers": stale,
+                           "UsersPerOU": per_ou}), 0
+
+    def _group_members(self):
+        groups, primary = [], {}
+        for group in self._scan("groups"):
+            groups.append({"SamAccountName": group["SamAccountName"], "DistinguishedName": group["DistinguishedName"],
+                           "Rid": str(group["Rid"]), "Members": group["Members"]})
+        primary[str(_DOMAIN_USERS_RID)] = self.directory.count("users")
+        primary[str(_DOMAIN_COMPUTERS_RID)] = self.directory.count("computers")
+        return json.dumps({"Groups": groups, "PrimaryGroupCounts": primary}), len(groups)
+
+    def _principals(self):
+        principals = [
+            {"SamAccountName": obj["SamAccountName"], "DistinguishedName": obj["DistinguishedName"],
+             "PrimaryGroupId": str(obj["primaryGroupID"]), "Type": "computer" if object_type == "computers" else "user"}
+            for object_type in ("users", "computers")
+            for obj in self._scan(object_type)
+        ]
+        return json.dumps(principals), len(principals)
+
+    def _sync(self, script: str):
+        object_type, arguments, stages = self._pipeline(script)
+        since = re.search(r"\(uSNChanged>=(\d+)\)", arguments)
+        select = next(s for s in stages if s.startswith("Select-Object"))
+        fields = self._fields(select.partition(" ")[2])
+        if since:
+            usn = int(since.group(1))
+            objects, deleted = self.directory.changed_since(object_type, usn), self.directory.deleted_since(object_type, usn)
+        else:
+            objects, deleted = list(self._scan(object_type)), []
+        changed = [self._project(o, fields) for o in objects]
+        return json.dumps({"HighestCommittedUSN": self.directory.usn, "Changed": changed, "Deleted": deleted}), len(changed)
+
+
+def _in_base(obj: dict, base_dn: str = None) -> bool:
+    return not base_dn or obj["DistinguishedName"].lower().endswith("," + base_dn.lower())
+
+
+def _take(rows, count: int):
+    for i, row in enumerate(rows):
+        if i >= count:
+            return
+        yield row
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_fake_backend() -> FakeDirectoryBackend:
+    """The shared fake directory, generated on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = FakeDirectoryBackend(
+                objects=FAKE_DIRECTORY_CONFIG["objects"],
+                latency_ms=FAKE_DIRECTORY_CONFIG["latency_ms"],
+                per_object_us=FAKE_DIRECTORY_CONFIG["per_object_us"],
+                domain=FAKE_DIRECTORY_CONFIG["domain"],
+            )
+            logger.info(f"Fake directory backend ready: {_backend.directory.sizes}")
+        return _backend
@@ -0,0 +1,157 @@
+from .paging import PAGE_KEYS
+
+# Attributes a client can ask for with ?fields=, per object type. Each field maps
+# to the AD property it needs loaded and, when the raw value is not what the API
+# returns, the PowerShell expression producing it ($o is the AD object).
+# "detail" and "list" are the fields returned when no projection is requested.
+_NEVER = "if ($o.{0}) {{ $o.{0}.ToString('yyyy-MM-dd HH:mm:ss') }} else {{ 'Never' }}"
+_TIMESTAMP = "$o.{0}.ToString('yyyy-MM-dd HH:mm:ss')"
+
+FIELD_CATALOG = {
+    "users": {
+        "fields": {
+            "Name": ("Name", None),
+            "SamAccountName": ("SamAccountName", None),
+            "Enabled": ("Enabled", None),
+            "LastLogonDate": ("LastLogonDate", _NEVER.format("LastLogonDate")),
+            "Description": ("Description", None),
+            "EmailAddress": ("EmailAddress", None),
+            "GivenName": ("GivenName", None),
+            "Surname": ("Surname", None),
+            "DisplayName": ("DisplayName", None),
+            "UserPrincipalName": ("UserPrincipalName", None),
+            "Department": ("Department", None),
+            "Title": ("Title", None),
+            "OfficePhone": ("OfficePhone", None),
+            "Manager": ("Manager", None),
+            "DistinguishedName": ("DistinguishedName", None),
+            "Created": ("Created", _TIMESTAMP.format("Created")),
+            "Modified": ("Modified", _TIMESTAMP.format("Modified")),
+            "PasswordLastSet": ("PasswordLastSet", _NEVER.format("PasswordLastSet")),
+            "AccountExpirationDate": ("AccountExpirationDate", _NEVER.format("AccountExpirationDate")),
+            "LockedOut": ("LockedOut", None),
+            "PasswordExpired": ("PasswordExpired", None),
+            "PasswordNeverExpires": ("PasswordNeverExpires", None),
+            "MemberOf": ("MemberOf", None),
+            # Update sequence number of the last change on the connected DC, served as the ETag
+            "uSNChanged": ("uSNChanged", None),
+        },
+        "detail": ("Name", "SamAccountName", "Enabled", "LastLogonDate", "Description", "EmailAddress", "GivenName",
+                   "Surname", "DisplayName", "UserPrincipalName", "Department", "Title", "OfficePhone", "Manager",
+                   "DistinguishedName", "Created", "Modified", "PasswordLastSet", "AccountExpirationDate", "LockedOut",
+                   "PasswordExpired", "PasswordNeverExpires", "MemberOf"),
+        "list": ("Name", "SamAccountName", "Enabled", "LastLogonDate", "Description", "Department", "GivenName",
+                 "Surname", "DisplayName", "UserPrincipalName"),
+    },
+    "groups": {
+        "fields": {
+            "Name": ("Name", None),
+            "SamAccountName": ("SamAccountName", None),
+            "Description": ("Description", None),
+            # Filled by a separate Get-ADGroupMember call, only made when requested
+            "Members": (None, "$members"),
+            "DistinguishedName": ("DistinguishedName", None),
+            "GroupCategory": ("GroupCategory", "[string]$o.GroupCategory"),
+            "GroupScope": ("GroupScope", "[string]$o.GroupScope"),
+            "ManagedBy": ("ManagedBy", None),
+        },
+        "detail": ("Name", "SamAccountName", "Description", "Members", "DistinguishedName"),
+    },
+    "computers": {
+        "fields": {
+            "Name": ("Name", None),
+            "SamAccountName": ("SamAccountName", None),
+            "Description": ("Description", None),
+            "Enabled": ("Enabled", None),
+            "OperatingSystem": ("OperatingSystem", None),
+            "OperatingSystemVersion": ("OperatingSystemVersion", None),
+            "DNSHostName": ("DNSHostName", None),
+            "IPv4Address": ("IPv4Address", None),
+            "LastLogonDate": ("LastLogonDate", None),
+            "DistinguishedName": ("DistinguishedName", None),
+        },
+        "list": ("Name", "SamAccountName", "Description", "Enabled", "OperatingSystem", "LastLogonDate",
+                 "DistinguishedName"),
+    },
+    "ous": {
+        "fields": {
+            "Name": ("Name", None),
+            "DistinguishedName": ("DistinguishedName", None),
+            "Description": ("Description", None),
+            "ManagedBy": ("ManagedBy", None),
+            "Created": ("Created", _TIMESTAMP.format("Created")),
+        },
+        "detail": ("Name", "DistinguishedName", "Description"),
+    },
+}
+
+
+class UnknownField(ValueError):
+    """Raised when ?fields= names an attribute the endpoint does not expose"""
+
+
+def resolve_fields(object_type: str, fields: str = None, view: str = "detail") -> tuple:
+    """Canonical field names for a ?fields= value, or the view's defaults when it is empty.
+
+    Names are matched case-insensitively. List views always keep their paging
+    keys, which the continuation token is built from.
+    """
+    catalog = FIELD_CATALOG[object_type]
+    if not fields or not fields.strip():
+        return catalog[view]
+    known = {name.lower(): name for name in catalog["fields"]}
+    selected = []
+    for raw in fields.split(","):
+        name = raw.strip()
+        if not name:
+            continue
+        canonical = known.get(name.lower())
+        if canonical is None:
+            raise UnknownField(f"Unknown field '{name}' for {object_type}, expected any of {', '.join(catalog['fields'])}")
+        if canonical not in selected:
+            selected.append(canonical)
+    if view == "list":
+        selected = [k for k in PAGE_KEYS[object_type] if k not in selected] + selected
+    return tuple(selected)
+
+
+def is_default(object_type: str, selected: tuple, view: str = "detail") -> bool:
+    return tuple(selected) == FIELD_CATALOG[object_type][view]
+
+
+def properties(object_type: str, selected: tuple) -> str:
+    """-Properties parameter loading just what the selected fields read"""
+    catalog = FIELD_CATALOG[object_type]["fields"]
+    needed = []
+    for field in selected:
+        prop = catalog[field][0]
+        if prop and prop not in needed:
+            needed.append(prop)
+    return f"-Properties {', '.join(needed)}" if needed else ""
+
+
+def hashtable_entries(object_type: str, selected: tuple, var: str) -> str:
+    """Body of a @{...} literal building the selected fields from the object in var"""
+    catalog = FIELD_CATALOG[object_type]["fields"]
+    lines = []
+    for field in selected:
+        expression = catalog[field][1] or f"$o.{field}"
+        lines.append(f"{field} = {expression.replace('$o', var)}")
+    return "\n".join(lines)
+
+
+def select_list(object_type: str, selected: tuple) -> str:
+    """Select-Object argument for the selected fields, with calculated properties where needed"""
+    catalog = FIELD_CATALOG[object_type]["fields"]
+    parts = []
+    for field in selected:
+        expression = catalog[field][1]
+        if expression is None:
+            parts.append(field)
+        else:
+            parts.append(f"@{{Name='{field}'; Expression={{{expression.replace('$o', '$_')}}}}}")
+    return ", ".join(parts)
+
+
+def project(record: dict, selected: tuple) -> dict:
+    return {field: record.get(field) for field in selected}
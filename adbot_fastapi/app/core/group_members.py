@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import time
+
+from .config import GROUP_MEMBER_COUNTS_CONFIG
+from .powershell_client import read_remote_ps_async
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# One paged search over every group, reading `member` with ranged retrieval so
+# groups above MaxValRange (1500 values by default) are followed range by range,
+# plus one paged search counting primary-group members, which `member` omits.
+GROUP_MEMBERS_SCRIPT = '''
+try {
+    $searcher = New-Object System.DirectoryServices.DirectorySearcher
+    $searcher.PageSize = 1000
+    $searcher.Filter = "(objectClass=group)"
+    foreach ($p in @("samaccountname", "distinguishedname", "objectsid", "member;range=0-*")) {
+        [void]$searcher.PropertiesToLoad.Add($p)
+    }
+    $groups = New-Object System.Collections.Generic.List[object]
+    foreach ($r in $searcher.FindAll()) {
+        $dn = [string]$r.Properties["distinguishedname"][0]
+        $members = New-Object System.Collections.Generic.List[string]
+        $attr = $r.Properties.PropertyNames | Where-Object { $_ -like "member*" } | Select-Object -First 1
+        if ($attr) {
+            foreach ($v in $r.Properties[$attr]) { $members.Add([string]$v) }
+        }
+        while ($attr -and $attr -like "member;range=*" -and -not $attr.EndsWith("-*")) {
+            $low = [int]($attr.Split("-")[-1]) + 1
+            $entry = [ADSI]("LDAP://" + $dn.Replace("/", "\\/"))
+            $ranged = New-Object System.DirectoryServices.DirectorySearcher($entry, "(objectClass=*)", @("member;range=$low-*"), "Base")
+            $next = $ranged.FindOne()
+            $attr = $next.Properties.PropertyNames | Where-Object { $_ -like "member;range=*" } | Select-Object -First 1
+            if ($attr) {
+                foreach ($v in $next.Properties[$attr]) { $members.Add([string]$v) }
+            }
+        }
+        $sid = New-Object System.Security.Principal.SecurityIdentifier($r.Properties["objectsid"][0], 0)
+        $groups.Add([PSCustomObject]@{
+            SamAccountName = [string]$r.Properties["samaccountname"][0]
+            DistinguishedName = $dn
+            Rid = $sid.Value.Split("-")[-1]
+            Members = $members.ToArray()
+        })
+    }
+    $primary = @{}
+    $userSearcher = New-Object System.DirectoryServices.DirectorySearcher
+    $userSearcher.PageSize = 1000
+    $userSearcher.Filter = "(&(objectClass=user)(primaryGroupID=*))"
+    [void]$userSearcher.PropertiesToLoad.Add("primarygroupid")
+    foreach ($u in $userSearcher.FindAll()) {
+        $id = [string]$u.Properties["primarygroupid"][0]
+        $primary[$id] = 1 + [int]$primary[$id]
+    }
+    @{
+        Groups = $groups.ToArray()
+        PrimaryGroupCounts = $primary
+    } | ConvertTo-Json -Depth 4 -Compress
+} catch {
+    Write-Error "PowerShell Error: $($_.Exception.Message)"
+    exit 1
+}
+'''
+
+
+# Every user and computer with the group its primaryGroupID points at, for
+# resolving member DNs to SamAccountNames and adding primary-group edges
+MEMBER_PRINCIPALS_SCRIPT = '''
+try {
+    $searcher = New-Object System.DirectoryServices.DirectorySearcher
+    $searcher.PageSize = 1000
+    $searcher.Filter = "(objectClass=user)"
+    foreach ($p in @("samaccountname", "distinguishedname", "primarygroupid", "objectclass")) {
+        [void]$searcher.PropertiesToLoad.Add($p)
+    }
+    $principals = foreach ($r in $searcher.FindAll()) {
+        [PSCustomObject]@{
+            SamAccountName = [string]$r.Properties["samaccountname"][0]
+            DistinguishedName = [string]$r.Properties["distinguishedname"][0]
+            PrimaryGroupId = [string]$r.Properties["primarygroupid"][0]
+            Type = if ($r.Properties["objectclass"] -contains "computer") { "computer" } else { "user" }
+        }
+    }
+    ConvertTo-Json -InputObject @($principals) -Depth 2 -Compress
+} catch {
+    Write-Error "PowerShell Error: $($_.Exception.Message)"
+    exit 1
+}
+'''
+
+
+async def fetch_group_members() -> list:
+    """Direct members of every group as [{SamAccountName, DistinguishedName, Rid, Members, PrimaryMembers}]"""
+    stdout, stderr, rc = await read_remote_ps_async(GROUP_MEMBERS_SCRIPT)
+    if rc != 0:
+        raise RuntimeError(f"Failed to read group members: {stderr}")
+    payload = json.loads(stdout) if stdout and stdout.strip() else {}
+    groups = payload.get("Groups") or []
+    if isinstance(groups, dict):
+        groups = [groups]
+    primary = payload.get("PrimaryGroupCounts") or {}
+    for group in groups:
+        members = group.get("Members") or []
+        group["Members"] = [members] if isinstance(members, str) else members
+        group["PrimaryMembers"] = int(primary.get(str(group.get("Rid")), 0))
+    return groups
+
+
+async def fetch_member_principals() -> list:
+    """Every user and computer as [{SamAccountName, DistinguishedName, PrimaryGroupId, Type}]"""
+    stdout, stderr, rc = await read_remote_ps_async(MEMBER_PRINCIPALS_SCRIPT)
+    if rc != 0:
+        raise RuntimeError(f"Failed to read member principals: {stderr}")
+    principals = json.loads(stdout) if stdout and stdout.strip() else []
+    return [principals] if isinstance(principals, dict) else principals
+
+
+def count_members(groups: list) -> dict:
+    return {g["SamAccountName"]: len(g["Members"]) + g["PrimaryMembers"] for g in groups}
+
+
+class MemberCountCache:
+    """Stale-while-revalidate holder for the member counts of all groups"""
+
+    def __init__(self, ttl: float, enabled: bool = True):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.counts = None
+        self.fetched_at = None
+        self.stale = False
+        self.last_error = None
+        self._refresh_task = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self.counts is not None and not self.stale and time.time() - self.fetched_at < self.ttl
+
+    async def refresh(self) -> dict:
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                counts = count_members(await fetch_group_members())
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self.counts, self.fetched_at, self.stale, self.last_error = counts, time.time(), False, None
+            logger.info(f"Group member counts refreshed: {len(counts)} groups in {(time.perf_counter() - started) * 1000:.0f}ms")
+            return counts
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"Background member count refresh failed: {str(e)}")
+
+    async def get(self, force: bool = False) -> tuple:
+        """Return (counts, served_from_cache); stale counts are returned while a refresh runs"""
+        if not self.enabled or force or self.counts is None:
+            tracing.cache_event("group-member-counts", False)
+            return await self.refresh(), False
+        if not self._fresh() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.get_running_loop().create_task(self._background_refresh())
+        tracing.cache_event("group-member-counts", True)
+        return self.counts, True
+
+    def mark_stale(self, object_type: str = None, *_):
+        """Directory cache listener: group changes make the counts stale but keep serving them"""
+        if object_type in (None, "groups"):
+            self.stale = True
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "groups": len(self.counts) if self.counts is not None else None,
+            "age_seconds": round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+            "ttl_seconds": self.ttl,
+            "stale": self.stale or (self.fetched_at is not None and time.time() - self.fetched_at >= self.ttl),
+            "refreshing": self._refresh_task is not None and not self._refresh_task.done(),
+            "last_error": self.last_error,
+        }
+
+
+member_counts = MemberCountCache(
+    ttl=GROUP_MEMBER_COUNTS_CONFIG["ttl"],
+    enabled=GROUP_MEMBER_COUNTS_CONFIG["cache_enabled"],
+)
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from .config import JOBS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ("succeeded", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    message TEXT,
+    checkpoint TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class UnknownJobKind(ValueError):
+    """Raised when a job is submitted for a kind no handler is registered for"""
+
+
+class JobStore:
+    """SQLite persistence for jobs and their partial results"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _row(row) -> dict:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("params", "checkpoint", "result"):
+            job[field] = json.loads(job[field]) if job[field] is not None else None
+        return job
+
+    def create(self, kind: str, params: dict) -> dict:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), time.time()),
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields):
+        for field in ("checkpoint", "result"):
+            if field in fields and fields[field] is not None:
+                fields[field] = json.dumps(fields[field])
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            job = self._row(row)
+            if job is not None:
+                job["items_count"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM job_items WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+        return job
+
+    def list(self, status: str = None, limit: int = 50) -> list:
+        query, args = "SELECT * FROM jobs", ()
+        if status:
+            query, args = query + " WHERE status = ?", (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_at DESC LIMIT ?", (*args, limit)).fetchall()
+        return [self._row(r) for r in rows]
+
+    def unfinished(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def add_items(self, job_id: str, items: list, checkpoint: dict = None) -> int:
+        """Append partial results, and optionally the resume point they reach, in one transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                start = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq), -1) + 1 FROM job_items WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                self._conn.executemany(
+                    "INSERT INTO job_items (job_id, seq, data) VALUES (?, ?, ?)",
+                    [(job_id, start + i, json.dumps(item)) for i, item in enumerate(items)],
+                )
+                if checkpoint is not None:
+                    self._conn.execute("UPDATE jobs SET checkpoint = ? WHERE id = ?", (json.dumps(checkpoint), job_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return start + len(items)
+
+    def items(self, job_id: str, offset: int = 0, limit: int = None) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM job_items WHERE job_id = ? ORDER BY seq LIMIT ? OFFSET ?",
+                (job_id, -1 if limit is None else limit, offset),
+            ).fetchall()
+        return [json.loads(r["data"]) for r in rows]
+
+
+class JobContext:
+    """What a handler sees of its job: parameters, resume state and progress reporting"""
+
+    def __init__(self, manager, job: dict):
+        self._manager = manager
+        self.id = job["id"]
+        self.params = job["params"]
+        self.checkpoint = job["checkpoint"] or {}
+        self.completed = job["completed"]
+        self.total = job["total"]
+        self.items_count = job["items_count"]
+
+    def progress(self, completed: int = None, total: int = None, message: str = None):
+        if completed is not None:
+            self.completed = completed
+        if total is not None:
+            self.total = total
+        self._manager._update(self.id, completed=self.completed, total=self.total, message=message)
+
+    def add_items(self, items: list, checkpoint: dict = None):
+        """Store partial results; a checkpoint saved with them is where a resumed job picks up"""
+        self.items_count = self._manager.store.add_items(self.id, items, checkpoint)
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+
+    def items(self) -> list:
+        return self._manager.store.items(self.id)
+
+
+class JobManager:
+    """Bounded pool of asyncio workers running registered job handlers.
+
+    Jobs are persisted in SQLite. Jobs still queued or running when the process
+    stops are picked up again by start(); handlers use their checkpoint and the
+    stored items to skip work already done.
+    """
+
+    def __init__(self, db_path: str, workers: int = 4, max_attempts: int = 3):
+        self.db_path = db_path
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self._store = None
+        self._handlers = {}
+        self._queue = None
+        self._workers = []
+        self._running = {}
+        self._subscribers = {}
+        self._stopping = False
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore(self.db_path)
+        return self._store
+
+    def register_handler(self, kind: str, handler, description: str = ""):
+        """handler(job: JobContext) is a coroutine; its return value becomes the job result"""
+        self._handlers[kind] = {"handler": handler, "description": description}
+
+    def kinds(self) -> dict:
+        return {kind: h["description"] for kind, h in self._handlers.items()}
+
+    def _publish(self, job_id: str):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers:
+            job = self.store.get(job_id)
+            for queue in subscribers:
+                queue.put_nowait(job)
+
+    def _update(self, job_id: str, **fields):
+        self.store.update(job_id, **fields)
+        self._publish(job_id)
+
+    def submit(self, kind: str, params: dict = None) -> dict:
+        if kind not in self._handlers:
+            raise UnknownJobKind(f"Unknown job kind '{kind}', expected one of {', '.join(self._handlers)}")
+        job = self.store.create(kind, params or {})
+        if self._queue is not None:
+            self._queue.put_nowait(job["id"])
+        logger.info(f"Job {job['id']} ({kind}) queued")
+        return job
+
+    def get(self, job_id: str) -> dict:
+        return self.store.get(job_id)
+
+    def list(self, status: str = None, limit: int = 50) -> list:
+        return self.store.list(status, limit)
+
+    def items(self, job_id: str, offset: int = 0, limit: int = None) -> list:
+        return self.store.items(job_id, offset, limit)
+
+    def cancel(self, job_id: str) -> dict:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATES:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        else:
+            self._update(job_id, status="cancelled", finished_at=time.time())
+        return self.store.get(job_id)
+
+    async def _execute(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATES:
+            return
+        attempts = job["attempts"] + 1
+        if attempts > self.max_attempts:
+            self._update(job_id, status="failed", error=f"Gave up after {self.max_attempts} attempts", finished_at=time.time())
+            return
+        self._update(job_id, status="running", attempts=attempts, started_at=time.time())
+        handler = self._handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise UnknownJobKind(f"No handler registered for job kind '{job['kind']}'")
+            result = await handler["handler"](JobContext(self, self.store.get(job_id)))
+            self._update(job_id, status="succeeded", result=result, finished_at=time.time())
+            logger.info(f"Job {job_id} ({job['kind']}) succeeded")
+        except asyncio.CancelledError:
+            if not self._stopping:
+                self._update(job_id, status="cancelled", finished_at=time.time())
+                logger.info(f"Job {job_id} ({job['kind']}) cancelled")
+            # On shutdown the job stays "running" so the next start() resumes it
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job['kind']}) failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            task = asyncio.create_task(self._execute(job_id))
+            self._running[job_id] = task
+            try:
+                # wait() rather than await so a cancelled job does not stop the worker
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise
+            finally:
+                self._running.pop(job_id, None)
+
+    def start(self):
+        if self._workers:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue()
+        resumed = self.store.unfinished()
+        for job in resumed:
+            self._queue.put_nowait(job["id"])
+        if resumed:
+            logger.info(f"Resuming {len(resumed)} unfinished jobs")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        self._stopping = True
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def watch(self, job_id: str, keepalive: float = 15):
+        """Yield the job on every change until it finishes; None when idle for keepalive seconds"""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            job = self.store.get(job_id)
+            yield job
+            while job["status"] not in TERMINAL_STATES:
+                try:
+                    job = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield job
+        finally:
+            self._subscribers[job_id].discard(queue)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
+
+
+job_manager = JobManager(
+    db_path=JOBS_CONFIG["db_path"],
+    workers=JOBS_CONFIG["workers"],
+    max_attempts=JOBS_CONFIG["max_attempts"],
+)
@@ -0,0 +1,123 @@
+# Attributes indexed in a default AD schema (searchFlags bit 0). Anything else
+# is evaluated against every candidate the indexed clauses leave behind.
+INDEXED_ATTRIBUTES = {
+    "anr", "name", "cn", "samaccountname", "displayname", "givenname", "sn",
+    "mail", "userprincipalname", "objectcategory", "objectclass",
+}
+
+# Attributes ANR expands to that the mirror keeps, for matching cached records the same way
+ANR_RECORD_FIELDS = ("Name", "SamAccountName", "DisplayName", "GivenName", "Surname")
+
+# LDAP_MATCHING_RULE_BIT_AND, used to test userAccountControl flags
+UAC_BIT_AND = "1.2.840.113556.1.4.803"
+UAC_ACCOUNTDISABLE = 2
+
+
+def escape_ldap_value(value: str) -> str:
+    """RFC 4515 escaping for an assertion value"""
+    return (
+        value.replace("\\", "\\5c")
+        .replace("*", "\\2a")
+        .replace("(", "\\28")
+        .replace(")", "\\29")
+        .replace("\0", "\\00")
+    )
+
+
+def ps_double_quoted(value: str) -> str:
+    """Escape a value for a double-quoted PowerShell string"""
+    return value.replace("`", "``").replace('"', '`"').replace("$", "`$")
+
+
+def _anr_matches(record: dict, term: str) -> bool:
+    term = term.lower()
+    values = [(record.get(f) or "").lower() for f in ANR_RECORD_FIELDS]
+    if any(v.startswith(term) for v in values):
+        return True
+    # ANR also tries "first last" and "last first" against givenName/sn
+    first, _, last = term.partition(" ")
+    if last:
+        given, surname = (record.get("GivenName") or "").lower(), (record.get("Surname") or "").lower()
+        return (given.startswith(first) and surname.startswith(last)) or (surname.startswith(first) and given.startswith(last))
+    return False
+
+
+class CompiledQuery:
+    """An LDAP filter plus search base/scope, with a Python predicate for mirrored records"""
+
+    def __init__(self, search_base: str = None, search_scope: str = None):
+        self.search_base = search_base
+        self.search_scope = search_scope
+        self.clauses = []
+
+    def add(self, attribute: str, ldap: str, match: str, predicate=None):
+        self.clauses.append({
+            "attribute": attribute,
+            "filter": ldap,
+            "match": match,
+            "indexed": attribute.lower() in INDEXED_ATTRIBUTES,
+            "predicate": predicate,
+        })
+        return self
+
+    @property
+    def ldap_filter(self) -> str:
+        parts = [c["filter"] for c in self.clauses]
+        return parts[0] if len(parts) == 1 else f"(&{''.join(parts)})"
+
+    def cmdlet_parameters(self) -> str:
+        params = f'-LDAPFilter "{ps_double_quoted(self.ldap_filter)}"'
+        if self.search_base:
+            params += f' -SearchBase "{ps_double_quoted(self.search_base)}" -SearchScope {self.search_scope}'
+        return params
+
+    def matches(self, record: dict) -> bool:
+        if self.search_base:
+            dn = (record.get("DistinguishedName") or "").lower()
+            if not dn.endswith("," + self.search_base.lower()):
+                return False
+        return all(c["predicate"](record) for c in self.clauses if c["predicate"] is not None)
+
+    def explain(self) -> dict:
+        indexed = [c["attribute"] for c in self.clauses if c["indexed"]]
+        return {
+            "ldap_filter": self.ldap_filter,
+            "search_base": self.search_base,
+            "search_scope": self.search_scope,
+            "clauses": [{k: v for k, v in c.items() if k != "predicate"} for c in self.clauses],
+            "index_candidates": indexed,
+            "unindexed": [c["attribute"] for c in self.clauses if not c["indexed"]],
+            "full_scan": not set(indexed) - {"objectCategory", "objectClass"},
+        }
+
+
+def compile_user_query(search: str = None, enabled: bool = None, department: str = None, ou: str = None) -> CompiledQuery:
+    """Translate the ADUserSearch fields into an index-friendly LDAP query"""
+    query = CompiledQuery(search_base=ou, search_scope="Subtree" if ou else None)
+    query.add("objectCategory", "(objectCategory=person)", "equality")
+    # objectCategory=person also matches contacts, which Get-ADUser never returns
+    query.add("objectClass", "(objectClass=user)", "equality")
+    term = (search or "").strip()
+    if term:
+        query.add(
+            "anr",
+            f"(anr={escape_ldap_value(term)})",
+            "ambiguous name resolution (prefix on name, sAMAccountName, displayName, givenName, sn)",
+            lambda r, term=term: _anr_matches(r, term),
+        )
+    if enabled is not None:
+        bit_test = f"(userAccountControl:{UAC_BIT_AND}:={UAC_ACCOUNTDISABLE})"
+        query.add(
+            "userAccountControl",
+            f"(!{bit_test})" if enabled else bit_test,
+            "bitwise AND on ACCOUNTDISABLE",
+            lambda r, enabled=enabled: r.get("Enabled") == enabled,
+        )
+    if department:
+        query.add(
+            "department",
+            f"(department={escape_ldap_value(department)})",
+            "equality",
+            lambda r, dept=department.lower(): (r.get("Department") or "").lower() == dept,
+        )
+    return query
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from .config import MEMBERSHIP_GRAPH_CONFIG
+from .group_members import fetch_group_members, fetch_member_principals
+
+logger = logging.getLogger(__name__)
+
+
+def _rdn_value(dn: str) -> str:
+    """CN of a DN, used as the name of members that are neither users, computers nor groups"""
+    first = dn.split(",", 1)[0]
+    return first.split("=", 1)[1] if "=" in first else first
+
+
+class MembershipGraph:
+    """Group -> member edges for the whole directory with cached transitive closures.
+
+    Nodes are keyed by lower-cased DN. Closures are breadth-first walks that
+    skip nodes already visited, so nesting cycles terminate, and each closure
+    records the depth at which a node was first reached (1 = direct member).
+    Changing an edge only drops the closures that could include it: the
+    effective members of the group and everything above it, and the effective
+    groups of the member and everything below it.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.by_name = {}
+        self.members = {}
+        self.parents = {}
+        self._member_closures = {}
+        self._group_closures = {}
+
+    def load(self, groups: list, principals: list):
+        nodes, by_name, rids = {}, {}, {}
+        for group in groups:
+            key = (group.get("DistinguishedName") or "").lower()
+            nodes[key] = {"SamAccountName": group.get("SamAccountName"), "DistinguishedName": group.get("DistinguishedName"), "type": "group"}
+            by_name[(group.get("SamAccountName") or "").lower()] = key
+            rids[str(group.get("Rid"))] = key
+        for principal in principals:
+            key = (principal.get("DistinguishedName") or "").lower()
+            nodes[key] = {"SamAccountName": principal.get("SamAccountName"), "DistinguishedName": principal.get("DistinguishedName"),
+                          "type": principal.get("Type") or "user"}
+            by_name[(principal.get("SamAccountName") or "").lower()] = key
+        members, parents = {}, {}
+        for group in groups:
+            key = (group.get("DistinguishedName") or "").lower()
+            members[key] = set()
+            for dn in group.get("Members") or []:
+                member = dn.lower()
+                if member not in nodes:
+                    nodes[member] = {"SamAccountName": _rdn_value(dn), "DistinguishedName": dn, "type": "other"}
+                members[key].add(member)
+                parents.setdefault(member, set()).add(key)
+        for principal in principals:
+            group = rids.get(str(principal.get("PrimaryGroupId")))
+            if group is not None:
+                member = (principal.get("DistinguishedName") or "").lower()
+                members[group].add(member)
+                parents.setdefault(member, set()).add(group)
+        self.nodes, self.by_name, self.members, self.parents = nodes, by_name, members, parents
+        self._member_closures, self._group_closures = {}, {}
+
+    def resolve(self, samaccountname: str):
+        return self.by_name.get((samaccountname or "").lower())
+
+    @staticmethod
+    def _walk(start: str, edges: dict) -> dict:
+        depths = {}
+        queue = deque((n, 1) for n in edges.get(start, ()))
+        while queue:
+            node, depth = queue.popleft()
+            if node in depths or node == start:
+                continue
+            depths[node] = depth
+            queue.extend((n, depth + 1) for n in edges.get(node, ()) if n not in depths)
+        return depths
+
+    def effective_members(self, group: str) -> dict:
+        """Every node reachable below the group, with the depth it was first reached at"""
+        closure = self._member_closures.get(group)
+        if closure is None:
+            closure = self._member_closures[group] = self._walk(group, self.members)
+        return closure
+
+    def effective_groups(self, node: str) -> dict:
+        """Every group the node is a member of directly or through nesting"""
+        closure = self._group_closures.get(node)
+        if closure is None:
+            closure = self._group_closures[node] = self._walk(node, self.parents)
+        return closure
+
+    def _drop_closures(self, group: str, member: str):
+        for key in [group, *self._walk(group, self.parents)]:
+            self._member_closures.pop(key, None)
+        for key in [member, *self._walk(member, self.members)]:
+            self._group_closures.pop(key, None)
+
+    def add_edge(self, group: str, member: str):
+        self.members.setdefault(group, set()).add(member)
+        self.parents.setdefault(member, set()).add(group)
+        self._drop_closures(group, member)
+
+    def remove_edge(self, group: str, member: str):
+        self._drop_closures(group, member)
+        self.members.get(group, set()).discard(member)
+        self.parents.get(member, set()).discard(group)
+
+    def describe(self, closure: dict) -> list:
+        return sorted(
+            ({**self.nodes[key], "depth": depth} for key, depth in closure.items()),
+            key=lambda n: (n["depth"], (n["SamAccountName"] or "").lower()),
+        )
+
+    def stats(self) -> dict:
+        return {
+            "groups": len(self.members),
+            "nodes": len(self.nodes),
+            "edges": sum(len(m) for m in self.members.values()),
+            "cached_closures": len(self._member_closures) + len(self._group_closures),
+        }
+
+
+class MembershipGraphService:
+    """Loads the membership graph in bulk, keeps it current and serves closures from it.
+
+    The graph is rebuilt after `ttl` seconds or after group changes the API did
+    not apply itself, and the previous graph keeps serving while that runs.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.graph = None
+        self.loaded_at = None
+        self.stale = False
+        self.last_error = None
+        self._applied = set()
+        self._refresh_task = None
+        self._lock = asyncio.Lock()
+        self._graph_lock = threading.Lock()
+
+    async def refresh(self) -> MembershipGraph:
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                groups, principals = await asyncio.gather(fetch_group_members(), fetch_member_principals())
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            graph = MembershipGraph()
+            graph.load(groups, principals)
+            with self._graph_lock:
+                self.graph, self.loaded_at, self.stale, self.last_error = graph, time.time(), False, None
+            logger.info(f"Membership graph loaded: {graph.stats()} in {(time.perf_counter() - started) * 1000:.0f}ms")
+            return graph
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"Background membership graph refresh failed: {str(e)}")
+
+    async def _ensure(self, force: bool = False):
+        if force or self.graph is None:
+            await self.refresh()
+        elif (self.stale or time.time() - self.loaded_at >= self.ttl) and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.get_running_loop().create_task(self._background_refresh())
+
+    async def _resolve(self, samaccountname: str, force: bool):
+        await self._ensure(force)
+        node = self.graph.resolve(samaccountname)
+        if node is None and self.stale and not force:
+            # Possibly created since the last load; wait for the rebuild once
+            await self.refresh()
+            node = self.graph.resolve(samaccountname)
+        return node
+
+    async def effective_members(self, samaccountname: str, force: bool = False):
+        """Members of a group through any level of nesting, or None for an unknown group"""
+        node = await self._resolve(samaccountname, force)
+        if node is None or node not in self.graph.members:
+            return None
+        with self._graph_lock:
+            return self.graph.describe(self.graph.effective_members(node))
+
+    async def effective_groups(self, samaccountname: str, force: bool = False):
+        """Groups an object belongs to through any level of nesting, or None when it is unknown"""
+        node = await self._resolve(samaccountname, force)
+        if node is None:
+            return None
+        with self._graph_lock:
+            return self.graph.describe(self.graph.effective_groups(node))
+
+    def _apply(self, group_sam: str, member_sam: str, add: bool):
+        self._applied.add(group_sam.lower())
+        if self.graph is None:
+            return
+        with self._graph_lock:
+            group, member = self.graph.resolve(group_sam), self.graph.resolve(member_sam)
+            if group is None or member is None:
+                self.stale = True
+            elif add:
+                self.graph.add_edge(group, member)
+            else:
+                self.graph.remove_edge(group, member)
+
+    def member_added(self, group_sam: str, member_sam: str):
+        """Apply a membership the API just added, without reloading the graph"""
+        self._apply(group_sam, member_sam, add=True)
+
+    def member_removed(self, group_sam: str, member_sam: str):
+        self._apply(group_sam, member_sam, add=False)
+
+    def on_invalidate(self, object_type: str = None, identity: str = None):
+        """Directory cache listener: group changes not applied through member_added/removed trigger a rebuild"""
+        if object_type not in (None, "groups"):
+            return
+        if identity is not None and identity.lower() in self._applied:
+            self._applied.discard(identity.lower())
+            return
+        self.stale = True
+
+    def status(self) -> dict:
+        return {
+            "loaded": self.graph is not None,
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "ttl_seconds": self.ttl,
+            "stale": self.stale or (self.loaded_at is not None and time.time() - self.loaded_at >= self.ttl),
+            "refreshing": self._refresh_task is not None and not self._refresh_task.done(),
+            "last_error": self.last_error,
+            **(self.graph.stats() if self.graph is not None else {}),
+        }
+
+
+membership_graph = MembershipGraphService(ttl=MEMBERSHIP_GRAPH_CONFIG["ttl"])
@@ -0,0 +1,228 @@
+import contextvars
+import re
+import threading
+import time
+
+from .config import METRICS_CONFIG
+
+# Hot-path instrumentation exported in the Prometheus text format, plus the
+# per-request phase totals sent back in the Server-Timing header. Routes are
+# labelled with their template (/users/{samaccountname}), AD operations with
+# the first AD cmdlet of the script, so label sets stay bounded.
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+OBJECT_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_OPERATION = re.compile(r"\b((?:Get|Set|New|Remove|Add|Enable|Disable|Move|Rename|Unlock|Search)-AD\w+)")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_string(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_string(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, value_sum) in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, counts):
+                    bucket = _label_string(self.labels, key, 'le="%g"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket} {count}")
+                bucket = _label_string(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{bucket} {total}")
+                lines.append(f"{self.name}_count{_label_string(self.labels, key)} {total}")
+                lines.append(f"{self.name}_sum{_label_string(self.labels, key)} {value_sum:.6f}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "adbot_http_request_duration_seconds", "Time to handle an HTTP request", ("route", "method", "status"))
+powershell_phase_duration = Histogram(
+    "adbot_powershell_phase_duration_seconds",
+    "Time spent per phase of a PowerShell call: queue, acquire, connect, import, prepare, remote",
+    ("route", "operation", "phase"))
+powershell_calls = Counter(
+    "adbot_powershell_calls_total", "PowerShell calls by outcome (ok, error, exception)", ("route", "operation", "outcome"))
+powershell_output_bytes = Histogram(
+    "adbot_powershell_output_bytes", "Size of PowerShell output received", ("route", "operation"), BYTES_BUCKETS)
+response_phase_duration = Histogram(
+    "adbot_response_phase_duration_seconds", "Python-side time per phase: parse, serialize", ("route", "phase"))
+response_objects = Histogram(
+    "adbot_response_objects", "Objects parsed from PowerShell output per parse", ("route", "operation"), OBJECT_BUCKETS)
+
+REGISTRY = [http_request_duration, powershell_phase_duration, powershell_calls, powershell_output_bytes,
+            response_phase_duration, response_objects]
+
+
+class RequestTimings:
+    """Phase totals of one HTTP request, shared by every PowerShell call it makes"""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.phases = {}
+        self.calls = 0
+        self.operation = None
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        return route_of(self.scope)
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def note_call(self, operation: str):
+        with self._lock:
+            self.calls += 1
+            self.operation = operation
+
+    def server_timing(self, total: float) -> str:
+        with self._lock:
+            entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items()]
+            if self.calls:
+                entries.append(f'ps;desc="{self.calls} PowerShell call{"" if self.calls == 1 else "s"}"')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_request = contextvars.ContextVar("adbot_request_timings", default=None)
+
+
+def route_of(scope: dict) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def current_route() -> str:
+    timings = _request.get()
+    return timings.route if timings is not None else "background"
+
+
+def operation_of(script: str) -> str:
+    """AD operation label of a script: its first AD cmdlet"""
+    match = _OPERATION.search(script)
+    if match:
+        return match.group(1)
+    return "DirectorySearcher" if "DirectorySearcher" in script else "script"
+
+
+def record_call(operation: str, timings: dict, outcome: str, output_bytes: int = None):
+    """Record the phases of one PowerShell call in the histograms and the current request"""
+    if not METRICS_CONFIG["enabled"]:
+        return
+    route = current_route()
+    request = _request.get()
+    for phase, seconds in timings.items():
+        powershell_phase_duration.observe(seconds, route=route, operation=operation, phase=phase)
+        if request is not None:
+            request.add(phase, seconds)
+    powershell_calls.inc(route=route, operation=operation, outcome=outcome)
+    if output_bytes is not None:
+        powershell_output_bytes.observe(output_bytes, route=route, operation=operation)
+    if request is not None:
+        request.note_call(operation)
+
+
+def record_response_phase(phase: str, seconds: float, objects: int = None):
+    """Python-side parse/serialize time; objects counts what a parse produced"""
+    if not METRICS_CONFIG["enabled"]:
+        return
+    route = current_route()
+    response_phase_duration.observe(seconds, route=route, phase=phase)
+    request = _request.get()
+    if request is not None:
+        request.add(phase, seconds)
+    if objects is not None:
+        operation = request.operation if request is not None and request.operation else "unknown"
+        response_objects.observe(objects, route=route, operation=operation)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request and adding the Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_CONFIG["enabled"]:
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings(scope)
+        token = _request.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if METRICS_CONFIG["server_timing"]:
+                    header = timings.server_timing(time.perf_counter() - started).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request.reset(token)
+            http_request_duration.observe(time.perf_counter() - started, route=route_of(scope),
+                                          method=scope["method"], status=str(status))
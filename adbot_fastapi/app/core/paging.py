@@ -0,0 +1,208 @@
+import base64
+import hashlib
+import json
+import unicodedata
+
+from .ldap_query import escape_ldap_value
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Listings are ordered by Name, with a second attribute that is unique within
+# the object type so that pages never overlap or skip objects sharing a Name
+PAGE_KEYS = {
+    "users": ("Name", "SamAccountName"),
+    "groups": ("Name", "SamAccountName"),
+    "computers": ("Name", "SamAccountName"),
+    "ous": ("Name", "DistinguishedName"),
+}
+
+
+class InvalidCursor(ValueError):
+    """Raised for a continuation token that is malformed or was issued for another listing"""
+
+
+def _filters_digest(filters: dict) -> str:
+    return hashlib.sha256(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def encode_cursor(object_type: str, record: dict, filters: dict) -> str:
+    """Opaque continuation token pointing just past record"""
+    name_attr, tie_attr = PAGE_KEYS[object_type]
+    payload = {
+        "t": object_type,
+        "k": [record.get(name_attr) or "", record.get(tie_attr) or ""],
+        "f": _filters_digest(filters),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, object_type: str, filters: dict) -> tuple:
+    """Return the (Name, tiebreak) pair a token points past"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        after = tuple(str(k) for k in payload["k"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if payload.get("t") != object_type or len(after) != 2:
+        raise InvalidCursor(f"Cursor was not issued for {object_type}")
+    if payload.get("f") != _filters_digest(filters):
+        raise InvalidCursor("Cursor was issued for different filters")
+    return after
+
+
+def resolve_page(object_type: str, limit: int = None, cursor: str = None, filters: dict = None):
+    """Page size and seek position for a request; (None, None) when the caller wants the full list"""
+    if limit is None and cursor is None:
+        return None, None
+    after = decode_cursor(cursor, object_type, filters or {}) if cursor else None
+    # Larger limits are clamped rather than rejected, since /users took any limit before paging
+    size = DEFAULT_PAGE_SIZE if limit is None else limit
+    return max(1, min(size, MAX_PAGE_SIZE)), after
+
+
+def _ps_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def keyset_ldap(after: tuple) -> str:
+    """The seek clause of a page after the cursor, as shown in a query plan"""
+    return f"(name>={escape_ldap_value(after[0])})"
+
+
+def page_search(object_type: str, base_filter: str, after: tuple = None, page_size: int = None,
+                search_base: str = None, search_scope: str = None) -> str:
+    """DirectorySearcher statements collecting the ObjectGUIDs of one page, in order, into $pageGuids.
+
+    The DC sorts on name (indexed) and stops after page_size + 1 entries, so a
+    page reads only its own objects wherever it starts. The seek is split in
+    two searches: objects sharing the cursor's Name that sort after its
+    tiebreak, then objects with a greater Name. Empty for an unpaged listing.
+    """
+    if page_size is None:
+        return ""
+    _, tie_attr = PAGE_KEYS[object_type]
+    tie = tie_attr.lower()
+    limit = page_size + 1
+    lines = [
+        "$pageSearcher = New-Object System.DirectoryServices.DirectorySearcher",
+        "$pageSearcher.Sort = New-Object System.DirectoryServices.SortOption('name', 'Ascending')",
+        f"foreach ($p in @('objectguid', 'name', '{tie}')) {{ [void]$pageSearcher.PropertiesToLoad.Add($p) }}",
+        f"$pageLimit = {limit}",
+        "$pageGuids = New-Object System.Collections.Generic.List[object]",
+        "$pageKeys = New-Object System.Collections.Generic.List[object]",
+    ]
+    if search_base:
+        root = _ps_literal("LDAP://" + search_base.replace("/", "\\/"))
+        lines.append(f"$pageSearcher.SearchRoot = New-Object System.DirectoryServices.DirectoryEntry({root})")
+        lines.append(f"$pageSearcher.SearchScope = '{search_scope or 'Subtree'}'")
+    seek = base_filter
+    if after is not None:
+        name = escape_ldap_value(after[0])
+        lines += [
+            f"$pageSearcher.Filter = {_ps_literal(f'(&{base_filter}(name={name}))')}",
+            f"$pageTies = foreach ($r in $pageSearcher.FindAll()) {{ [PSCustomObject]@{{ "
+            f"Name = [string]$r.Properties['name'][0]; Tie = [string]$r.Properties['{tie}'][0]; "
+            f"Guid = $r.Properties['objectguid'][0] }} }}",
+            f"$pageTies | Where-Object {{ $_.Tie -gt {_ps_literal(after[1])} }} | Sort-Object Tie | "
+            f"Select-Object -First $pageLimit | ForEach-Object {{ $pageGuids.Add($_.Guid); $pageKeys.Add(@($_.Name, $_.Tie)) }}",
+        ]
+        seek = f"(&{base_filter}(name>={name})(!(name={name})))"
+    lines += [
+        f"$pageSearcher.Filter = {_ps_literal(seek)}",
+        "if ($pageGuids.Count -lt $pageLimit) {",
+        "    $pageSearcher.SizeLimit = $pageLimit - $pageGuids.Count",
+        "    foreach ($r in $pageSearcher.FindAll()) {",
+        "        $pageGuids.Add($r.Properties['objectguid'][0])",
+        f"        $pageKeys.Add(@([string]$r.Properties['name'][0], [string]$r.Properties['{tie}'][0]))",
+        "    }",
+        "}",
+        "$pageOrder = @{}",
+        "$pageClauses = for ($i = 0; $i -lt $pageGuids.Count; $i++) {",
+        "    $pageOrder[[string](New-Object Guid (,[byte[]]$pageGuids[$i]))] = $i",
+        "    '(objectGUID=' + (($pageGuids[$i] | ForEach-Object { '\\{0:x2}' -f $_ }) -join '') + ')'",
+        "}",
+        "$pageFilter = if ($pageGuids.Count) { '(|' + ($pageClauses -join '') + ')' } else { '(!(objectClass=*))' }",
+    ]
+    return "\n".join(lines)
+
+
+def page_source(filter_parameters: str, page_size: int = None) -> str:
+    """Filter parameters of the Get-AD* statement: the page's GUIDs when paged, else the listing's own"""
+    return "-LDAPFilter $pageFilter" if page_size is not None else filter_parameters
+
+
+def page_output(variable: str, page_size: int = None) -> str:
+    """Statements writing the listing as JSON: the rows, or for a page the rows with the searcher's hits.
+
+    The cmdlet can return fewer objects than the searcher found (an object
+    deleted in between, or one the cmdlet does not read), so whether more
+    pages follow and where the next starts come from the search itself.
+    """
+    if page_size is None:
+        return (f'if ({variable}.Count -eq 0) {{ Write-Output "[]" }} '
+                f'else {{ {variable} | ConvertTo-Json -Depth 2 }}')
+    return (f"[PSCustomObject]@{{ Hits = $pageGuids.Count; "
+            f"Last = $(if ($pageGuids.Count -gt {page_size}) {{ ,$pageKeys[{page_size - 1}] }}); "
+            f"Rows = @({variable}) }} | ConvertTo-Json -Depth 3")
+
+
+def page_result(parsed, page_size: int = None) -> tuple:
+    """Split page_output's JSON into (rows, searcher hits, (Name, tiebreak) of the page's last hit)"""
+    if page_size is None:
+        return parsed, None, None
+    last = parsed.get("Last")
+    return parsed.get("Rows"), parsed.get("Hits"), tuple(last) if last else None
+
+
+def page_order(page_size: int = None) -> str:
+    """Pipeline stage ordering the fetched objects: the DC's page order, or Name for a full listing"""
+    if page_size is None:
+        return "Sort-Object Name"
+    return "Sort-Object { $pageOrder[[string]$_.ObjectGUID] }"
+
+
+def collation_key(value: str) -> tuple:
+    """Sort key approximating the DC's string ordering for name and the tiebreaks.
+
+    AD compares these case-insensitively under Windows word sort: accents are
+    secondary, and hyphens and apostrophes are ignored at the primary level.
+    The casefolded value breaks primary ties deterministically.
+    """
+    folded = (value or "").casefold()
+    primary = "".join(
+        ch for ch in unicodedata.normalize("NFKD", folded)
+        if not unicodedata.combining(ch) and ch not in "-'\u2019"
+    )
+    return primary, folded
+
+
+def _sort_key(object_type: str, record: dict) -> tuple:
+    name_attr, tie_attr = PAGE_KEYS[object_type]
+    return collation_key(record.get(name_attr)), collation_key(record.get(tie_attr))
+
+
+def paginate(object_type: str, records: list, page_size: int, after: tuple = None) -> list:
+    """In-memory equivalent of page_search for lists served from the mirror"""
+    ordered = sorted(records, key=lambda r: _sort_key(object_type, r))
+    if after is not None:
+        seek = (collation_key(after[0]), collation_key(after[1]))
+        ordered = [r for r in ordered if _sort_key(object_type, r) > seek]
+    return ordered[:page_size + 1]
+
+
+def build_page(object_type: str, rows: list, page_size: int, filters: dict = None, hits: int = None, last: tuple = None):
+    """Trim the look-ahead row and return (rows, paging fields for the response).
+
+    hits and last come from page_result when the page was read from the DC;
+    without them the rows themselves decide, as for mirror pages.
+    """
+    has_more = (len(rows) if hits is None else hits) > page_size
+    rows = rows[:page_size]
+    next_token = None
+    if has_more and last is not None:
+        name_attr, tie_attr = PAGE_KEYS[object_type]
+        next_token = encode_cursor(object_type, {name_attr: last[0], tie_attr: last[1]}, filters or {})
+    elif has_more and rows:
+        next_token = encode_cursor(object_type, rows[-1], filters or {})
+    return rows, {"next_token": next_token, "has_more": has_more, "page_size": page_size}
@@ -1,34 +1,167 @@
-from pypsrp.client import Client
-from .config import WINRM_CONFIG
+from .config import PS_EXECUTOR_CONFIG, SINGLEFLIGHT_CONFIG
+from .backends import get_backend
+from .singleflight import SingleFlight
+from . import metrics, profiling, tracing
+from .backends import backend_name
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import concurrent.futures
+import contextvars
 import logging
+import threading
+import time
+import weakref
 
 logger = logging.getLogger(__name__)
 
-def execute_remote_ps(command: str):
-    client = None
-    try:
-        logger.info(f"Connecting to {WINRM_CONFIG['server']} as {WINRM_CONFIG['username']}")
-        client = Client(
-            server=WINRM_CONFIG["server"],
-            username=WINRM_CONFIG["username"],
-            password=WINRM_CONFIG["password"],
-            ssl=WINRM_CONFIG["ssl"],
-            cert_validation=WINRM_CONFIG["cert_validation"],
-            auth=WINRM_CONFIG["auth"],
-            transport=WINRM_CONFIG["transport"]
-        )
-        logger.info(f"Executing command: {command}")
-        stdout, stderr, rc = client.execute_ps(command)
-        logger.info(f"Command completed with return code: {rc}")
-        if stderr:
-            logger.warning(f"PowerShell stderr: {stderr}")
-        return stdout, stderr, rc
-    except Exception as e:
-        logger.error(f"Error executing PowerShell command: {str(e)}")
-        raise
-    finally:
-        if client:
+# pypsrp is blocking, so async callers share a bounded executor; the per-server
+# semaphores make excess requests queue on the event loop instead of on threads
+_executor = None
+_server_limits = weakref.WeakKeyDictionary()
+# Concurrent identical read scripts share one execution
+read_flight = SingleFlight("powershell-reads", enabled=SINGLEFLIGHT_CONFIG["enabled"])
+
+def execute_remote_ps(command: str, timings: dict = None, retry: bool = False):
+    """Run a script on the backend; retry=True only for read-only scripts (see SessionPool.execute)"""
+    pool = get_backend()
+    timings = {} if timings is None else timings
+    operation = metrics.operation_of(command)
+    profile = profiling.active()
+    # The fake backend recognises scripts by shape, so it cannot run instrumented ones
+    instrumented = profile is not None and backend_name() != "fake"
+    with tracing.span(f"powershell {operation}", _span_attributes(pool, operation), client=True) as span:
+        try:
+            logger.info(f"Executing command on pooled session to {pool.config['server']}: {command}")
+            stdout, stderr, rc = pool.execute(profiling.instrument(command) if instrumented else command, timings=timings, retry=retry)
+            logger.info(f"Command completed with return code: {rc}")
+            if stderr:
+                logger.warning(f"PowerShell stderr: {stderr}")
+            output_bytes = len(stdout.encode("utf-8")) if stdout else 0
+            metrics.record_call(operation, timings, "error" if rc else "ok", output_bytes)
+            span.set_attributes({"adbot.powershell.had_errors": bool(rc), "adbot.powershell.output_bytes": output_bytes})
+            if profile is not None:
+                remote = None
+                if instrumented:
+                    stdout, remote = profiling.extract(stdout)
+                profile.add(operation, timings, remote,
+                            note=None if instrumented else "Stage timing needs the WinRM backend")
+            return stdout, stderr, rc
+        except Exception as e:
+            logger.error(f"Error executing PowerShell command: {str(e)}")
+            metrics.record_call(operation, timings, "exception")
+            raise
+        finally:
+            _trace_phases(span, timings)
+
+def _span_attributes(pool, operation: str) -> dict:
+    return {"adbot.operation": operation, "adbot.backend": backend_name(), "server.address": pool.config["server"]}
+
+def _trace_phases(span, timings: dict):
+    span.set_attributes({f"adbot.phase.{phase}_ms": round(seconds * 1000, 2) for phase, seconds in timings.items()})
+
+def _execute_queued(command: str, queued_at: float, retry: bool = False):
+    return execute_remote_ps(command, {"queue": time.perf_counter() - queued_at}, retry)
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PS_EXECUTOR_CONFIG["max_workers"], thread_name_prefix="winrm")
+    return _executor
+
+def _server_semaphore(server: str) -> asyncio.Semaphore:
+    loop_limits = _server_limits.setdefault(asyncio.get_running_loop(), {})
+    if server not in loop_limits:
+        loop_limits[server] = asyncio.Semaphore(PS_EXECUTOR_CONFIG["per_server_limit"])
+    return loop_limits[server]
+
+async def execute_remote_ps_async(command: str, retry: bool = False):
+    """Async counterpart of execute_remote_ps with a per-server concurrency limit"""
+    pool = get_backend()
+    queued_at = time.perf_counter()
+    async with _server_semaphore(pool.config["server"]):
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so timings reach the request that made the call
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_get_executor(), context.run, _execute_queued, command, queued_at, retry)
+
+async def read_remote_ps_async(command: str):
+    """execute_remote_ps_async for scripts that only read: identical scripts in flight run once"""
+    pool = get_backend()
+    # A profiled read gets instrumented output, so it never shares an execution with plain ones
+    key = (pool.config["server"], command, profiling.active() is not None)
+    return await read_flight.do(key, lambda: execute_remote_ps_async(command, retry=True))
+
+async def stream_remote_ps_async(command: str, buffer: int = 256):
+    """Async generator over the output objects of a command as the remote pipeline emits them.
+
+    A worker thread drains the pipeline into a bounded queue, so a slow consumer
+    holds back the remote side instead of letting output pile up in memory.
+    The pooled session and the per-server slot are held until the stream ends.
+    """
+    pool = get_backend()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=buffer)
+    done = object()
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+
+    operation = metrics.operation_of(command)
+    queued_at = time.perf_counter()
+
+    def produce():
+        logger.info(f"Streaming command on pooled session to {pool.config['server']}: {command}")
+        timings = {"queue": time.perf_counter() - queued_at}
+        started = time.perf_counter()
+        count = size = 0
+        with tracing.span(f"powershell stream {operation}", _span_attributes(pool, operation), client=True) as span:
             try:
-                client.close()
-            except:
-                pass 
\ No newline at end of file
+                stream = pool.stream(command, timings=timings)
+                try:
+                    for item in stream:
+                        if stop.is_set() or not put(item):
+                            break
+                        count += 1
+                        size += len(item)
+                finally:
+                    stream.close()
+                logger.info(f"Streamed {count} objects")
+                timings["remote"] = time.perf_counter() - started - sum(v for k, v in timings.items() if k != "queue")
+                metrics.record_call(operation, timings, "ok", size)
+                put(done)
+            except Exception as e:
+                logger.error(f"Error streaming PowerShell command: {str(e)}")
+                metrics.record_call(operation, timings, "exception")
+                span.record_exception(e)
+                put(e)
+            _trace_phases(span, timings)
+            span.set_attributes({"adbot.objects": count, "adbot.powershell.output_bytes": size})
+
+    async with _server_semaphore(pool.config["server"]):
+        producer = loop.run_in_executor(_get_executor(), contextvars.copy_context().run, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            await asyncio.gather(producer, return_exceptions=True)
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,225 @@
+import contextvars
+import json
+import re
+import threading
+from urllib.parse import parse_qs
+
+from .config import PROFILING_CONFIG
+
+# Opt-in remote profiling. For a request sent with ?profile=true or an
+# X-ADBot-Profile: true header, every Get-AD*/Search-AD* pipeline in the
+# scripts it runs is rewritten so that each stage runs on its own over the
+# previous stage's materialised output, timed with a Stopwatch, and every
+# `... | ConvertTo-Json` statement is timed as a stage of its own. The
+# per-stage totals come back as one marker line at the end of the output,
+# which is stripped before the caller sees stdout. Because stages no longer
+# stream into each other, `Select-Object -First` cannot stop the upstream
+# cmdlet early: stage times show what each stage costs over the full set.
+
+PROFILE_HEADER = "x-adbot-profile"
+PROFILE_MARKER = "ADBOT-PROFILE:"
+_TRUE = ("1", "true", "yes", "on")
+
+_PIPELINE = re.compile(r"^(?P<indent>\s*)(?:(?P<target>\$\w+)\s*=\s*)?(?P<pipeline>(?:Get|Search)-AD\w+\b.*)$")
+_TO_JSON = re.compile(r"^(?P<indent>\s*)(?P<statement>(?:\$\w+(?:\.\w+(?:\(\))?)*\s*\|\s*)?ConvertTo-Json\b.*)$")
+
+_PROLOGUE = '''$__adbotProfile = [ordered]@{}
+$__adbotWatch = New-Object System.Diagnostics.Stopwatch
+$__adbotTotal = [System.Diagnostics.Stopwatch]::StartNew()
+function __AdbotStage($name, $ms, $objects) {
+    if (-not $__adbotProfile.Contains($name)) { $__adbotProfile[$name] = @{ Ms = 0.0; Calls = 0; Objects = 0 } }
+    $entry = $__adbotProfile[$name]
+    $entry.Ms += $ms
+    $entry.Calls += 1
+    $entry.Objects += $objects
+}
+'''
+
+_EPILOGUE = f'''
+$__adbotStages = @($__adbotProfile.GetEnumerator() | ForEach-Object {{
+    @{{ Stage = $_.Key; Ms = [math]::Round($_.Value.Ms, 2); Calls = $_.Value.Calls; Objects = $_.Value.Objects }}
+}})
+Write-Output ("{PROFILE_MARKER}" + (ConvertTo-Json -InputObject @{{ TotalMs = [math]::Round($__adbotTotal.Elapsed.TotalMilliseconds, 2); Stages = $__adbotStages }} -Depth 3 -Compress))
+'''
+
+
+def split_pipeline(statement: str) -> list:
+    """Split a PowerShell pipeline on | outside quotes, braces and parentheses"""
+    stages, depth, quote, current = [], 0, None, []
+    for ch in statement:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch in "({":
+            depth += 1
+        elif ch in ")}":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            stages.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    stages.append("".join(current).strip())
+    return [s for s in stages if s]
+
+
+def _label(index: int, stage: str) -> str:
+    text = re.sub(r"\s+", " ", stage)
+    text = text if len(text) <= 120 else text[:117] + "..."
+    return f"[{index}] {text}".replace("'", "''")
+
+
+def instrument(script: str) -> str:
+    """The script with per-stage timing around each AD pipeline and JSON conversion"""
+    lines = script.splitlines()
+    out, statement_index, i = [], 0, 0
+    while i < len(lines):
+        line = lines[i]
+        match = _PIPELINE.match(line)
+        if match:
+            statement = line
+            while statement.rstrip().endswith("|") and i + 1 < len(lines):
+                i += 1
+                statement += " " + lines[i].strip()
+            match = _PIPELINE.match(statement)
+            indent, target = match.group("indent"), match.group("target")
+            statement_index += 1
+            for n, stage in enumerate(split_pipeline(match.group("pipeline"))):
+                piped = stage if n == 0 else f"$__adbotPipe | {stage}"
+                label = _label(statement_index, stage)
+                out.append(f"{indent}$__adbotWatch.Restart(); $__adbotPipe = @({piped}); "
+                           f"__AdbotStage '{label}' $__adbotWatch.Elapsed.TotalMilliseconds $__adbotPipe.Count")
+            # Re-collecting through the pipeline restores scalar/$null results for 1 or 0 objects
+            out.append(f"{indent}{target} = $__adbotPipe | Write-Output" if target else f"{indent}$__adbotPipe")
+            i += 1
+            continue
+        match = _TO_JSON.match(line)
+        if match:
+            statement_index += 1
+            label = _label(statement_index, "ConvertTo-Json")
+            out.append(f"{match.group('indent')}$__adbotWatch.Restart(); $__adbotJson = {match.group('statement')}; "
+                       f"__AdbotStage '{label}' $__adbotWatch.Elapsed.TotalMilliseconds 1; $__adbotJson")
+            i += 1
+            continue
+        out.append(line)
+        i += 1
+    return _PROLOGUE + "\n".join(out) + _EPILOGUE
+
+
+def extract(stdout: str) -> tuple:
+    """Split the profile marker line off the output: (stdout, remote profile or None)"""
+    if not stdout or PROFILE_MARKER not in stdout:
+        return stdout, None
+    head, _, tail = stdout.rpartition(PROFILE_MARKER)
+    marker_line, _, rest = tail.partition("\n")
+    try:
+        profile = json.loads(marker_line)
+    except ValueError:
+        return stdout, None
+    return (head.rstrip("\n") + ("\n" + rest if rest else "")), profile
+
+
+class RequestProfile:
+    """Per-request record of every profiled PowerShell call"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, operation: str, timings: dict, remote: dict = None, note: str = None):
+        entry = {
+            "operation": operation,
+            "phases_ms": {phase: round(seconds * 1000, 2) for phase, seconds in timings.items()},
+            "stages": [],
+        }
+        if remote is not None:
+            stages = remote.get("Stages") or []
+            stages = [stages] if isinstance(stages, dict) else stages
+            entry["remote_total_ms"] = remote.get("TotalMs")
+            entry["stages"] = [
+                {"stage": s.get("Stage"), "ms": s.get("Ms"), "calls": s.get("Calls"), "objects": s.get("Objects")}
+                for s in stages
+            ]
+            timed = sum(s["ms"] or 0 for s in entry["stages"])
+            if remote.get("TotalMs") is not None:
+                entry["untimed_ms"] = round(remote["TotalMs"] - timed, 2)
+        if note:
+            entry["note"] = note
+        with self._lock:
+            self.calls.append(entry)
+
+    def report(self) -> dict:
+        with self._lock:
+            calls = list(self.calls)
+        report = {"powershell_calls": calls}
+        if not calls:
+            report["note"] = "No PowerShell ran for this request; it was served from a cache or the mirror"
+        return report
+
+
+_profile = contextvars.ContextVar("adbot_request_profile", default=None)
+
+
+def active() -> RequestProfile:
+    """The current request's profile when profiling was requested, else None"""
+    return _profile.get()
+
+
+def requested(scope: dict) -> bool:
+    for name, value in scope.get("headers") or []:
+        if name == PROFILE_HEADER.encode() and value.decode("latin-1").strip().lower() in _TRUE:
+            return True
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return any(v.strip().lower() in _TRUE for v in query.get("profile", []))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware adding "_profile" to JSON object responses of profiled requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_CONFIG["enabled"] or not requested(scope):
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        start = None
+        body = []
+
+        async def send_with_profile(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                if not content_type.startswith(b"application/json"):
+                    # Streams and other bodies pass through untouched
+                    await send(message)
+                    return
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            body.append(message.get("body", b""))
+            if message.get("more_body"):
+                return
+            payload = b"".join(body)
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                data["_profile"] = profile.report()
+                payload = json.dumps(data, default=str).encode("utf-8")
+            headers = [(k, v) for k, v in start.get("headers", []) if k != b"content-length"]
+            headers.append((b"content-length", str(len(payload)).encode()))
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": payload})
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _profile.reset(token)
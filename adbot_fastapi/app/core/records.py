@@ -0,0 +1,167 @@
+import json
+import sys
+import time
+from collections.abc import Mapping
+
+from fastapi.responses import JSONResponse
+
+from . import metrics, tracing
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, the stdlib encoder is the fallback
+    orjson = None
+
+
+class DirectoryRecord(Mapping):
+    """Compact read-mostly mapping for one directory object.
+
+    Attributes live in __slots__ rather than a per-object dict, values of
+    attributes that repeat across objects (departments, operating systems,
+    descriptions) are interned so every record shares one string, and keys
+    absent from the source stay absent from to_dict(), so the public JSON shape
+    is exactly what ConvertTo-Json produced.
+    """
+
+    FIELDS = ()
+    INTERNED = frozenset()
+    __slots__ = ("_extra",)
+
+    def __init__(self, data: dict = None):
+        self._extra = None
+        for key, value in (data or {}).items():
+            self[key] = value
+
+    def __setitem__(self, key: str, value):
+        if isinstance(value, str) and key in self.INTERNED:
+            value = sys.intern(value)
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __getitem__(self, key: str):
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self}
+
+    def project(self, fields) -> "DirectoryRecord":
+        """New record of the same type holding only the given fields (values are shared)"""
+        record = type(self)()
+        for field in fields:
+            record[field] = self.get(field)
+        return record
+
+
+def _record_type(name: str, fields: tuple, interned: tuple) -> type:
+    return type(name, (DirectoryRecord,), {
+        "__slots__": fields,
+        "FIELDS": fields,
+        "INTERNED": frozenset(interned),
+    })
+
+
+# Field order follows the Select-Object projections, so to_dict() keeps the key
+# order clients saw before. The superset covers the sync mirror's extra columns.
+UserRecord = _record_type(
+    "UserRecord",
+    ("Name", "SamAccountName", "Enabled", "LastLogonDate", "Description", "Department", "GivenName", "Surname",
+     "DisplayName", "UserPrincipalName", "EmailAddress", "LockedOut", "DistinguishedName", "ObjectGUID", "uSNChanged"),
+    ("Department", "Description", "LastLogonDate"),
+)
+GroupRecord = _record_type(
+    "GroupRecord",
+    ("Name", "SamAccountName", "Description", "DistinguishedName", "Members", "ObjectGUID", "uSNChanged"),
+    ("Description",),
+)
+ComputerRecord = _record_type(
+    "ComputerRecord",
+    ("Name", "SamAccountName", "Description", "Enabled", "OperatingSystem", "LastLogonDate", "DistinguishedName",
+     "ObjectGUID", "uSNChanged"),
+    ("Description", "OperatingSystem"),
+)
+OURecord = _record_type(
+    "OURecord",
+    ("Name", "DistinguishedName", "Description"),
+    ("Description",),
+)
+
+RECORD_TYPES = {
+    "users": UserRecord,
+    "groups": GroupRecord,
+    "computers": ComputerRecord,
+    "ous": OURecord,
+}
+
+
+def from_rows(object_type: str, rows) -> list:
+    """Convert parsed ConvertTo-Json output (one object or a list) into records"""
+    if rows is None:
+        return []
+    if isinstance(rows, dict):
+        rows = [rows]
+    record_type = RECORD_TYPES[object_type]
+    return [record_type(row) for row in rows]
+
+
+def to_dicts(rows) -> list:
+    return [r.to_dict() if isinstance(r, DirectoryRecord) else r for r in rows]
+
+
+def _default(obj):
+    if isinstance(obj, DirectoryRecord):
+        return obj.to_dict()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def loads(data):
+    """Parse PowerShell JSON output"""
+    with tracing.span("parse PowerShell output") as span:
+        started = time.perf_counter()
+        parsed = orjson.loads(data) if orjson is not None else json.loads(data)
+        objects = len(parsed) if isinstance(parsed, list) else int(parsed is not None)
+        metrics.record_response_phase("parse", time.perf_counter() - started, objects)
+        span.set_attribute("adbot.objects", objects)
+    return parsed
+
+
+def dumps(obj) -> bytes:
+    """Serialize a response payload that may contain records"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class RecordJSONResponse(JSONResponse):
+    """JSONResponse that serializes records directly, skipping jsonable_encoder"""
+
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = dumps(content)
+        metrics.record_response_phase("serialize", time.perf_counter() - started)
+        return body
@@ -0,0 +1,361 @@
+import asyncio
+import bisect
+import json
+import logging
+import re
+import threading
+import time
+
+from .config import SEARCH_INDEX_CONFIG
+from .directory_sync import directory_sync
+from .powershell_client import read_remote_ps_async
+
+logger = logging.getLogger(__name__)
+
+_GUID = "@{Name='ObjectGUID'; Expression={$_.ObjectGUID.ToString()}}"
+
+# Indexed fields per object type with their ranking weight; "summary" is what a hit returns
+INDEX_FIELDS = {
+    "users": {
+        "fields": {"SamAccountName": 1.0, "Name": 1.0, "DisplayName": 0.9, "EmailAddress": 0.7, "Department": 0.5},
+        "summary": ("Name", "SamAccountName", "DisplayName", "EmailAddress", "Department", "Enabled"),
+        "cmdlet": "Get-ADUser",
+        "properties": "DisplayName, EmailAddress, Department, Enabled",
+        "select": "Name, SamAccountName, DisplayName, EmailAddress, Department, Enabled, " + _GUID,
+    },
+    "groups": {
+        "fields": {"SamAccountName": 1.0, "Name": 1.0, "DisplayName": 0.9, "EmailAddress": 0.7},
+        "summary": ("Name", "SamAccountName", "DisplayName", "EmailAddress", "Description"),
+        "cmdlet": "Get-ADGroup",
+        "properties": "DisplayName, mail, Description",
+        "select": "Name, SamAccountName, DisplayName, @{Name='EmailAddress'; Expression={$_.mail}}, Description, " + _GUID,
+    },
+    "computers": {
+        "fields": {"Name": 1.0, "SamAccountName": 1.0},
+        "summary": ("Name", "SamAccountName", "Description", "OperatingSystem", "Enabled"),
+        "cmdlet": "Get-ADComputer",
+        "properties": "Description, OperatingSystem, Enabled",
+        "select": "Name, SamAccountName, Description, OperatingSystem, Enabled, " + _GUID,
+    },
+}
+
+_WORD_SPLIT = re.compile(r"[^0-9a-z]+")
+
+
+def _tokens(value: str) -> set:
+    """The whole value plus its words, so both "j.doe@corp" and "doe" match by prefix"""
+    value = value.lower().strip()
+    if not value:
+        return set()
+    return {value, *(w for w in _WORD_SPLIT.split(value) if w)}
+
+
+def _trigrams(value: str) -> set:
+    value = value.lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class _TypeIndex:
+    """Prefix (sorted token list) and trigram postings for one object type"""
+
+    def __init__(self, object_type: str):
+        self.object_type = object_type
+        self.spec = INDEX_FIELDS[object_type]
+        self._reset()
+        self.built_at = None
+        self.source = None
+        self._loading = False
+
+    def _reset(self):
+        self.docs = {}
+        self.postings = {}
+        self.sorted_tokens = []
+        self.trigram_postings = {}
+        self.doc_terms = {}
+        self.sam_keys = {}
+
+    def _add_token(self, token: str, key: str, weight: float):
+        docs = self.postings.get(token)
+        if docs is None:
+            docs = self.postings[token] = {}
+            if not self._loading:
+                bisect.insort(self.sorted_tokens, token)
+        docs[key] = max(weight, docs.get(key, 0))
+
+    def _drop_token(self, token: str, key: str):
+        docs = self.postings.get(token)
+        if docs is None:
+            return
+        docs.pop(key, None)
+        if not docs:
+            del self.postings[token]
+            if self._loading:
+                return
+            i = bisect.bisect_left(self.sorted_tokens, token)
+            if i < len(self.sorted_tokens) and self.sorted_tokens[i] == token:
+                del self.sorted_tokens[i]
+
+    def remove(self, key: str):
+        tokens, grams = self.doc_terms.pop(key, (set(), set()))
+        for token in tokens:
+            self._drop_token(token, key)
+        for gram in grams:
+            docs = self.trigram_postings.get(gram)
+            if docs is not None:
+                docs.discard(key)
+                if not docs:
+                    del self.trigram_postings[gram]
+        doc = self.docs.pop(key, None)
+        sam = (doc or {}).get("SamAccountName")
+        if sam and self.sam_keys.get(sam.lower()) == key:
+            del self.sam_keys[sam.lower()]
+
+    def remove_sam(self, sam: str):
+        key = self.sam_keys.get(sam.lower())
+        if key is not None:
+            self.remove(key)
+
+    def upsert(self, record: dict):
+        sam = record.get("SamAccountName")
+        if not sam:
+            return
+        # Keyed by ObjectGUID, so a renamed object replaces its document instead of leaving the old name behind
+        key = record.get("ObjectGUID") or sam.lower()
+        self.remove(key)
+        self.remove_sam(sam)
+        tokens, grams = set(), set()
+        for field, weight in self.spec["fields"].items():
+            value = record.get(field)
+            if not isinstance(value, str):
+                continue
+            for token in _tokens(value):
+                self._add_token(token, key, weight)
+                tokens.add(token)
+            grams |= _trigrams(value)
+        trigram_postings = self.trigram_postings
+        for gram in grams:
+            docs = trigram_postings.get(gram)
+            if docs is None:
+                docs = trigram_postings[gram] = set()
+            docs.add(key)
+        self.doc_terms[key] = (tokens, grams)
+        self.docs[key] = {field: record.get(field) for field in self.spec["summary"]}
+        self.sam_keys[sam.lower()] = key
+
+    def load(self, records: list, source: str):
+        """Rebuild from scratch; tokens are sorted once at the end rather than inserted one by one"""
+        self._reset()
+        self._loading = True
+        try:
+            for record in records:
+                self.upsert(record)
+        finally:
+            self._loading = False
+        self.sorted_tokens = sorted(self.postings)
+        self.built_at = time.time()
+        self.source = source
+
+    def _score_term(self, term: str) -> dict:
+        """Best score per document for one query term"""
+        scores = {}
+        i = bisect.bisect_left(self.sorted_tokens, term)
+        while i < len(self.sorted_tokens) and self.sorted_tokens[i].startswith(term):
+            token = self.sorted_tokens[i]
+            closeness = 100 if token == term else 60 + 30 * len(term) / len(token)
+            for key, weight in self.postings[token].items():
+                scores[key] = max(scores.get(key, 0), weight * closeness)
+            i += 1
+        grams = _trigrams(term)
+        if grams:
+            shared = {}
+            for gram in grams:
+                for key in self.trigram_postings.get(gram, ()):
+                    shared[key] = shared.get(key, 0) + 1
+            for key, count in shared.items():
+                ratio = count / len(grams)
+                if ratio >= 0.5 and key not in scores:
+                    scores[key] = 30 * ratio
+        return scores
+
+    def search(self, terms: list) -> dict:
+        combined = None
+        for term in terms:
+            scores = self._score_term(term)
+            if combined is None:
+                combined = scores
+            else:
+                combined = {k: combined[k] + s for k, s in scores.items() if k in combined}
+            if not combined:
+                return {}
+        return combined or {}
+
+    def status(self) -> dict:
+        return {
+            "documents": len(self.docs),
+            "tokens": len(self.sorted_tokens),
+            "trigrams": len(self.trigram_postings),
+            "built_at": self.built_at,
+            "source": self.source,
+        }
+
+
+def _apply_delta(index: _TypeIndex, removed: list, changed: list):
+    for sam in removed:
+        if sam:
+            index.remove_sam(sam)
+    for record in changed:
+        index.upsert(record)
+
+
+def _object_script(object_type: str, filter_string: str) -> str:
+    spec = INDEX_FIELDS[object_type]
+    return f'''
+    try {{
+        $objects = @({spec["cmdlet"]} -Filter "{filter_string}" -Properties {spec["properties"]} |
+                     Select-Object {spec["select"]})
+        ConvertTo-Json -InputObject $objects -Depth 2 -Compress
+    }} catch {{
+        Write-Error "PowerShell Error: $($_.Exception.Message)"
+        exit 1
+    }}
+    '''
+
+
+class SearchIndex:
+    """Ranked prefix/trigram search over users, groups and computers.
+
+    Each type is loaded on first use, from the sync mirror when it is seeded or
+    by one enumeration over WinRM otherwise, and is rebuilt in the background
+    once older than refresh_interval. Mutating endpoints keep it current through
+    the directory cache invalidation hook.
+    """
+
+    def __init__(self, object_types, refresh_interval: float = 300):
+        self.refresh_interval = refresh_interval
+        self.indexes = {t: _TypeIndex(t) for t in object_types}
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._pending = set()
+        self._deltas = {}
+
+    async def _fetch(self, object_type: str, filter_string: str = "*") -> list:
+        stdout, stderr, rc = await read_remote_ps_async(_object_script(object_type, filter_string))
+        if rc != 0:
+            raise RuntimeError(f"Failed to load {object_type} for the search index: {stderr}")
+        data = json.loads(stdout) if stdout and stdout.strip() else []
+        return [data] if isinstance(data, dict) else data
+
+    async def build(self, object_type: str):
+        if directory_sync.is_ready(object_type):
+            records, source = directory_sync.mirrors[object_type].raw_records(), "mirror"
+        else:
+            records, source = await self._fetch(object_type), "enumeration"
+        # Built off the event loop into a fresh index, then swapped in. Sync deltas that
+        # arrive meanwhile are replayed on it, since the mirror snapshot predates them.
+        self._deltas[object_type] = []
+        try:
+            index = _TypeIndex(object_type)
+            await asyncio.to_thread(index.load, records, source)
+        finally:
+            deltas = self._deltas.pop(object_type)
+        with self._lock:
+            if source == "mirror":
+                for removed, changed in deltas:
+                    _apply_delta(index, removed, changed)
+            self.indexes[object_type] = index
+        logger.info(f"Search index for {object_type} built from {source}: {len(records)} objects")
+
+    async def _ensure_built(self, object_type: str):
+        index = self.indexes[object_type]
+        if index.built_at is None:
+            lock = self._build_locks.setdefault(object_type, asyncio.Lock())
+            async with lock:
+                if index.built_at is None:
+                    await self.build(object_type)
+        elif index.source != "mirror" and time.time() - index.built_at > self.refresh_interval:
+            # Serve the current index and rebuild behind it
+            self._schedule(self._rebuild(object_type), ("build", object_type))
+
+    async def _rebuild(self, object_type: str):
+        try:
+            await self.build(object_type)
+        except Exception as e:
+            logger.warning(f"Search index rebuild for {object_type} failed: {str(e)}")
+
+    async def refresh_object(self, object_type: str, identity: str):
+        """Re-read one object after a mutation; drop it if it no longer exists"""
+        escaped = identity.replace("'", "''").replace("`", "``").replace('"', '`"').replace("$", "`$")
+        try:
+            records = await self._fetch(object_type, f"SamAccountName -eq '{escaped}'")
+        except Exception as e:
+            logger.warning(f"Search index refresh of {object_type}/{identity} failed: {str(e)}")
+            with self._lock:
+                self.indexes[object_type].built_at = 0
+            return
+        with self._lock:
+            index = self.indexes[object_type]
+            index.remove_sam(identity)
+            for record in records:
+                index.upsert(record)
+
+    def _schedule(self, coro, marker):
+        if marker in self._pending:
+            coro.close()
+            return
+        self._pending.add(marker)
+        task = asyncio.get_running_loop().create_task(coro)
+        task.add_done_callback(lambda _: self._pending.discard(marker))
+
+    def on_invalidate(self, object_type: str, identity: str = None):
+        """Directory cache listener: refresh the changed object, or the whole type if unknown"""
+        index = self.indexes.get(object_type)
+        if index is None or index.built_at is None or index.source == "mirror":
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            index.built_at = 0
+            return
+        if identity:
+            self._schedule(self.refresh_object(object_type, identity), ("object", object_type, identity.lower()))
+        else:
+            index.built_at = 0
+
+    def on_sync(self, object_type: str, changed: list, removed: list, full: bool):
+        """Directory sync listener: apply mirror deltas to an index built from the mirror"""
+        index = self.indexes.get(object_type)
+        if object_type in self._deltas and not full:
+            self._deltas[object_type].append((removed, changed))
+            return
+        if index is None or index.source != "mirror":
+            return
+        if full:
+            self._schedule(self._rebuild(object_type), ("build", object_type))
+            return
+        with self._lock:
+            _apply_delta(index, removed, changed)
+
+    async def search(self, query: str, object_types=None, limit: int = 20) -> list:
+        terms = query.lower().split()
+        if not terms:
+            return []
+        object_types = object_types or list(self.indexes)
+        await asyncio.gather(*(self._ensure_built(t) for t in object_types))
+        hits = []
+        with self._lock:
+            for object_type in object_types:
+                index = self.indexes[object_type]
+                for key, score in index.search(terms).items():
+                    hits.append({"type": object_type, "score": round(score, 1), **index.docs[key]})
+        hits.sort(key=lambda h: (-h["score"], (h.get("Name") or "").lower()))
+        return hits[:limit]
+
+    def status(self) -> dict:
+        with self._lock:
+            return {t: index.status() for t, index in self.indexes.items()}
+
+
+search_index = SearchIndex(
+    object_types=SEARCH_INDEX_CONFIG["object_types"],
+    refresh_interval=SEARCH_INDEX_CONFIG["refresh_interval"],
+)
@@ -0,0 +1,560 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from pypsrp.exceptions import InvalidRunspacePoolStateError, WinRMTransportError
+from pypsrp.powershell import PowerShell, RunspacePool
+from pypsrp.complex_objects import PSInvocationState, RunspacePoolState
+from pypsrp.wsman import WSMan
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from .config import WINRM_CONFIG, WINRM_POOL_CONFIG, WINRM_WARMUP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the underlying connection is unusable rather than the script failing
+CONNECTION_ERRORS = (WinRMTransportError, InvalidRunspacePoolStateError, RequestsConnectionError)
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no session becomes available before the acquire timeout"""
+
+
+def _add_timing(timings: dict, phase: str, seconds: float):
+    """Accumulate a phase duration into the optional per-call timings dict"""
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+def _opening_time(timings: dict) -> float:
+    return timings.get("connect", 0.0) + timings.get("import", 0.0) if timings is not None else 0.0
+
+
+# Shared PowerShell functions defined once per runspace at warm-up
+_warmup_helpers = {}
+_helpers_version = 0
+_helpers_lock = threading.Lock()
+
+
+def register_warmup_helper(name: str, body: str):
+    """Register a PowerShell function that every warmed runspace should define.
+
+    Sessions opened before the registration pick it up on their next checkout.
+    """
+    global _helpers_version
+    with _helpers_lock:
+        _warmup_helpers[name] = body
+        _helpers_version += 1
+
+
+def _helper_definitions() -> tuple:
+    with _helpers_lock:
+        definitions = "\n".join(
+            f"function global:{name} {{\n{body}\n}}" for name, body in _warmup_helpers.items()
+        )
+        return definitions, _helpers_version
+
+
+def build_preamble() -> str:
+    """What a request script needs in front of it when it runs on a cold runspace"""
+    modules = "\n".join(f"Import-Module {module} -ErrorAction Stop" for module in WINRM_WARMUP_CONFIG["modules"])
+    definitions, _ = _helper_definitions()
+    return f"{modules}\n{definitions}\n"
+
+
+class PooledSession:
+    """A long-lived WSMan connection with an opened runspace pool"""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.wsman = None
+        self.runspace_pool = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.uses = 0
+        self.warmed = False
+        self.import_ms = None
+        self.helpers_version = 0
+
+    def open(self):
+        logger.info(f"Opening WinRM session to {self.config['server']} as {self.config['username']}")
+        self.wsman = WSMan(
+            server=self.config["server"],
+            username=self.config["username"],
+            password=self.config["password"],
+            ssl=self.config["ssl"],
+            cert_validation=self.config["cert_validation"],
+            auth=self.config["auth"],
+        )
+        self.runspace_pool = RunspacePool(self.wsman)
+        self.runspace_pool.open()
+        self.last_checked = time.monotonic()
+
+    def warm_up(self):
+        """Import the configured modules once and define the shared helpers in this runspace"""
+        imports = "\n".join(
+            f"Import-Module {module} -ErrorAction Stop" for module in WINRM_WARMUP_CONFIG["modules"]
+        )
+        stdout, stderr, had_errors = self.execute_ps(f'''
+        $importTimer = [System.Diagnostics.Stopwatch]::StartNew()
+        {imports}
+        $importTimer.Stop()
+        Write-Output $importTimer.Elapsed.TotalMilliseconds
+        ''')
+        if had_errors:
+            raise RuntimeError(f"Runspace warm-up failed: {stderr.error if stderr else stdout}")
+        try:
+            self.import_ms = float(stdout.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            self.import_ms = None
+        self.warmed = True
+        self.sync_helpers()
+
+    def sync_helpers(self):
+        definitions, version = _helper_definitions()
+        if version == self.helpers_version:
+            return
+        if definitions:
+            _, stderr, had_errors = self.execute_ps(definitions)
+            if had_errors:
+                raise RuntimeError(f"Defining warm-up helpers failed: {stderr.error if stderr else ''}")
+        self.helpers_version = version
+
+    @property
+    def is_open(self) -> bool:
+        return self.runspace_pool is not None and self.runspace_pool.state == RunspacePoolState.OPENED
+
+    def execute_ps(self, script: str):
+        """Run a script in the session runspace, same return shape as Client.execute_ps"""
+        powershell = PowerShell(self.runspace_pool)
+        powershell.add_script(script)
+        powershell.invoke()
+        self.uses += 1
+        self.last_used = time.monotonic()
+        return "\n".join(str(s) for s in powershell.output), powershell.streams, powershell.had_errors
+
+    def stream_ps(self, script: str):
+        """Run a script and yield its output objects as each WSMan receive delivers them.
+
+        Delivered objects are dropped from the pipeline buffer once yielded, so
+        memory stays bounded by one receive. Closing the generator early stops
+        the remote pipeline.
+        """
+        powershell = PowerShell(self.runspace_pool)
+        powershell.add_script(script)
+        powershell.begin_invoke()
+        try:
+            while powershell.state == PSInvocationState.RUNNING:
+                powershell.poll_invoke()
+                batch = powershell.output[:]
+                del powershell.output[:]
+                for item in batch:
+                    yield str(item)
+            for item in powershell.output:
+                yield str(item)
+            if powershell.had_errors:
+                errors = "; ".join(str(e) for e in powershell.streams.error)
+                raise RuntimeError(errors or "PowerShell pipeline reported errors")
+        finally:
+            if powershell.state == PSInvocationState.RUNNING:
+                try:
+                    powershell.stop()
+                except Exception as e:
+                    logger.warning(f"Stopping streamed pipeline failed: {str(e)}")
+            self.uses += 1
+            self.last_used = time.monotonic()
+
+    def ping(self) -> bool:
+        """Cheap round trip to make sure the runspace still answers"""
+        try:
+            stdout, _, had_errors = self.execute_ps("Write-Output 'pong'")
+            return not had_errors and stdout.strip() == "pong"
+        except Exception as e:
+            logger.warning(f"Session health check failed: {str(e)}")
+            return False
+        finally:
+            self.last_checked = time.monotonic()
+
+    def close(self):
+        try:
+            if self.runspace_pool is not None and self.is_open:
+                self.runspace_pool.close()
+        except Exception:
+            pass
+        try:
+            if self.wsman is not None:
+                self.wsman.close()
+        except Exception:
+            pass
+        self.runspace_pool = None
+        self.wsman = None
+
+
+class SessionPool:
+    """Bounded, thread-safe pool of PooledSession objects for one server/credential pair"""
+
+    def __init__(self, config: dict, min_size: int = 1, max_size: int = 8, idle_timeout: float = 300,
+                 health_check_interval: float = 60, acquire_timeout: float = 30):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "evicted_idle": 0,
+            "discarded_unhealthy": 0,
+            "reconnects": 0,
+            "waits": 0,
+            "warmups": 0,
+            "warmup_failures": 0,
+            "warm_calls": 0,
+            "cold_calls": 0,
+        }
+        self._import_ms_total = 0.0
+        self._import_ms_avoided = 0.0
+
+    def _new_session(self, timings: dict = None) -> PooledSession:
+        session = PooledSession(self.config)
+        started = time.perf_counter()
+        session.open()
+        _add_timing(timings, "connect", time.perf_counter() - started)
+        with self._cond:
+            self._stats["created"] += 1
+        if WINRM_WARMUP_CONFIG["enabled"]:
+            started = time.perf_counter()
+            try:
+                session.warm_up()
+                _add_timing(timings, "import", time.perf_counter() - started)
+                with self._cond:
+                    self._stats["warmups"] += 1
+                    self._import_ms_total += session.import_ms or 0.0
+            except Exception as e:
+                # Keep the session: scripts will carry the import preamble instead
+                logger.warning(f"Runspace warm-up failed, falling back to per-call imports: {str(e)}")
+                with self._cond:
+                    self._stats["warmup_failures"] += 1
+        return session
+
+    def _prepare(self, session: PooledSession, script: str, timings: dict = None) -> str:
+        """Return the script to send on this session, prefixing imports when it is cold"""
+        started = time.perf_counter()
+        try:
+            return self._prepare_script(session, script)
+        finally:
+            _add_timing(timings, "prepare", time.perf_counter() - started)
+
+    def _prepare_script(self, session: PooledSession, script: str) -> str:
+        if session.warmed:
+            session.sync_helpers()
+            with self._cond:
+                self._stats["warm_calls"] += 1
+                if self._stats["warmups"]:
+                    self._import_ms_avoided += self._import_ms_total / self._stats["warmups"]
+            return script
+        with self._cond:
+            self._stats["cold_calls"] += 1
+        return build_preamble() + script
+
+    def _evict_idle_locked(self, now: float) -> list:
+        """Pop sessions idle for longer than idle_timeout, keeping min_size around"""
+        expired = []
+        keep = []
+        for session in self._idle:
+            if now - session.last_used > self.idle_timeout and self._size - len(expired) > self.min_size:
+                expired.append(session)
+            else:
+                keep.append(session)
+        self._idle = keep
+        self._size -= len(expired)
+        self._stats["evicted_idle"] += len(expired)
+        return expired
+
+    def acquire(self, timings: dict = None) -> PooledSession:
+        """Check out a session; timings, when given, gets acquire/connect/import durations"""
+        started, opening = time.perf_counter(), _opening_time(timings)
+        try:
+            return self._acquire(timings)
+        finally:
+            # Time spent opening a new session is reported as connect/import, not as waiting
+            _add_timing(timings, "acquire", time.perf_counter() - started - (_opening_time(timings) - opening))
+
+    def _acquire(self, timings: dict = None) -> PooledSession:
+        deadline = time.monotonic() + self.acquire_timeout
+        expired = []
+        try:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Session pool is closed")
+                    expired.extend(self._evict_idle_locked(time.monotonic()))
+                    if self._idle:
+                        session = self._idle.pop()
+                        self._stats["reused"] += 1
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        session = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhaustedError(
+                            f"No WinRM session available for {self.config['server']} after {self.acquire_timeout}s"
+                        )
+                    self._stats["waits"] += 1
+                    self._cond.wait(remaining)
+        finally:
+            for stale in expired:
+                stale.close()
+
+        if session is None:
+            try:
+                return self._new_session(timings)
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        if not session.is_open or (
+            time.monotonic() - session.last_checked > self.health_check_interval and not session.ping()
+        ):
+            with self._cond:
+                self._stats["discarded_unhealthy"] += 1
+            return self.reconnect(session, timings)
+        return session
+
+    def reconnect(self, session: PooledSession, timings: dict = None) -> PooledSession:
+        """Replace a broken session with a fresh one, keeping its slot in the pool"""
+        session.close()
+        with self._cond:
+            self._stats["reconnects"] += 1
+        try:
+            return self._new_session(timings)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, session: PooledSession, discard: bool = False):
+        with self._cond:
+            if discard or self._closed or not session.is_open:
+                self._size -= 1
+                closing = True
+            else:
+                self._idle.append(session)
+                closing = False
+            self._cond.notify()
+        if closing:
+            session.close()
+
+    def _invoke(self, session: PooledSession, prepared: str, timings: dict = None):
+        started = time.perf_counter()
+        try:
+            return session.execute_ps(prepared)
+        finally:
+            _add_timing(timings, "remote", time.perf_counter() - started)
+
+    def execute(self, script: str, timings: dict = None, retry: bool = False):
+        """Run a script on a pooled session, reconnecting once if the connection went stale.
+
+        A connection lost before the script is invoked is always retried on a
+        fresh session. Once invoked the script may already have run remotely,
+        so a loss then is retried only with retry=True, which read-only
+        callers pass; writes such as New-ADUser are not safe to run twice.
+
+        When a timings dict is passed, the durations of the call's phases are
+        added to it: acquire, connect and import (new sessions only), prepare
+        and remote (the script run, including ConvertTo-Json and transfer).
+        """
+        session = self.acquire(timings)
+        invoked = False
+        try:
+            try:
+                prepared = self._prepare(session, script, timings)
+                invoked = True
+                result = self._invoke(session, prepared, timings)
+            except CONNECTION_ERRORS as e:
+                if invoked and not retry:
+                    raise
+                logger.warning(f"WinRM session lost ({str(e)}), reconnecting")
+                lost, session = session, None
+                # reconnect frees the slot itself when it fails
+                session = self.reconnect(lost, timings)
+                result = self._invoke(session, self._prepare(session, script, timings), timings)
+        except Exception:
+            if session is not None:
+                self.release(session, discard=True)
+            raise
+        self.release(session)
+        return result
+
+    def stream(self, script: str, timings: dict = None):
+        """Yield output objects of a script as they arrive.
+
+        Unlike execute() there is no retry on a lost connection, since part of
+        the output may already have been handed to the caller.
+        """
+        session = self.acquire(timings)
+        discard = False
+        try:
+            yield from session.stream_ps(self._prepare(session, script, timings))
+        except CONNECTION_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.release(session, discard=discard)
+
+    @contextmanager
+    def session(self):
+        session = self.acquire()
+        discard = False
+        try:
+            yield session
+        except CONNECTION_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.release(session, discard=discard)
+
+    def warm(self):
+        """Open sessions until min_size are idle and ready"""
+        with self._cond:
+            missing = max(min(self.min_size, self.max_size) - self._size, 0)
+            self._size += missing
+        opened = []
+        try:
+            for _ in range(missing):
+                opened.append(self._new_session())
+        finally:
+            with self._cond:
+                self._size -= missing - len(opened)
+                self._idle.extend(opened)
+                self._cond.notify_all()
+        return len(opened)
+
+    def evict_idle(self) -> int:
+        with self._cond:
+            expired = self._evict_idle_locked(time.monotonic())
+        for session in expired:
+            session.close()
+        return len(expired)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for session in idle:
+            session.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            import_ms = self._import_ms_total / self._stats["warmups"] if self._stats["warmups"] else None
+            return {
+                "server": self.config["server"],
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                **self._stats,
+                "import_ms_avoided_per_call": round(import_ms, 1) if import_ms is not None else None,
+                "import_ms_avoided_total": round(self._import_ms_avoided, 1),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_key(config: dict) -> tuple:
+    password_hash = hashlib.sha256((config.get("password") or "").encode()).hexdigest()
+    return (config["server"], config["username"], password_hash, config["auth"])
+
+
+def get_session_pool(config: dict = None) -> SessionPool:
+    """Return the shared pool for a server/credential pair, creating it on first use"""
+    config = config or WINRM_CONFIG
+    key = _pool_key(config)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SessionPool(config, **WINRM_POOL_CONFIG)
+            _pools[key] = pool
+        return pool
+
+
+def warm_up_pools(config: dict = None) -> dict:
+    """Startup warm-up: open min_size warmed sessions before the first request arrives"""
+    pool = get_session_pool(config)
+    opened = pool.warm()
+    return {"server": pool.config["server"], "sessions_opened": opened}
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def evict_idle_pools() -> int:
+    """Close sessions idle past idle_timeout in every pool; returns how many were closed"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return sum(pool.evict_idle() for pool in pools)
+
+
+class IdleReaper:
+    """Background task evicting idle sessions, so they close even when no request arrives to do it"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                closed = await asyncio.to_thread(evict_idle_pools)
+                if closed:
+                    logger.info(f"Closed {closed} idle WinRM session(s)")
+            except Exception as e:
+                logger.warning(f"Idle session eviction failed: {str(e)}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Checking at half the timeout closes a session at most 1.5x idle_timeout after its last use
+idle_reaper = IdleReaper(interval=max(1.0, WINRM_POOL_CONFIG["idle_timeout"] / 2))
+
+
+def pool_stats() -> list:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
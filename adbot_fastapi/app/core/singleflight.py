@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Run one call per key at a time and hand its result to every concurrent caller.
+
+    The shared call runs in its own task, so a caller that goes away (e.g. a
+    closed browser tab) does not cancel the work the other callers wait on.
+    Results are not kept once the call finishes; this only merges overlapping
+    requests, caching is the directory cache's job.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"executed": 0, "coalesced": 0, "failed": 0}
+
+    def _finished(self, key, task: asyncio.Task):
+        with self._lock:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+            if task.cancelled():
+                return
+            if task.exception() is not None:
+                self._stats["failed"] += 1
+
+    async def do(self, key, fn):
+        """Await fn() for key, joining a call already in flight for the same key"""
+        if not self.enabled:
+            with self._lock:
+                self._stats["executed"] += 1
+            return await fn()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._inflight.get(key)
+            if task is not None and task.get_loop() is loop and not task.done():
+                self._stats["coalesced"] += 1
+            else:
+                task = loop.create_task(fn())
+                self._inflight[key] = task
+                self._stats["executed"] += 1
+                task.add_done_callback(lambda t, key=key: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    def forget(self, *_):
+        """Stop handing out calls already in flight, e.g. after a write they may predate.
+
+        Current waiters still get their result; later callers start a new call.
+        Takes any arguments so it can be registered as a cache listener.
+        """
+        with self._lock:
+            self._inflight.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            executed, coalesced = self._stats["executed"], self._stats["coalesced"]
+            return {
+                "enabled": self.enabled,
+                **self._stats,
+                "in_flight": len(self._inflight),
+                "coalesced_ratio": round(coalesced / (executed + coalesced), 3) if executed + coalesced else 0.0,
+            }
@@ -0,0 +1,63 @@
+import json
+import logging
+
+from fastapi.responses import StreamingResponse
+
+from .powershell_client import stream_remote_ps_async
+from .records import dumps
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Appended to a listing pipeline so every object leaves the runspace as its own
+# compressed JSON line instead of being collected into one array first
+NDJSON_PIPELINE = "ForEach-Object { $_ | ConvertTo-Json -Depth 2 -Compress }"
+
+
+def wants_ndjson(accept: str = None) -> bool:
+    """True when the Accept header asks for newline-delimited JSON"""
+    return bool(accept) and NDJSON_MEDIA_TYPE in accept.lower()
+
+
+def stream_script(pipeline: str) -> str:
+    """Wrap a listing pipeline so its objects are written one JSON line at a time.
+
+    Sorting would hold the whole result set in the runspace, so streamed
+    listings come back in directory order.
+    """
+    return f'''
+    try {{
+        {pipeline} | {NDJSON_PIPELINE}
+    }} catch {{
+        Write-Error "PowerShell Error: $($_.Exception.Message)"
+        exit 1
+    }}
+    '''
+
+
+async def _remote_lines(script: str, label: str):
+    try:
+        async for line in stream_remote_ps_async(script):
+            line = line.strip()
+            if line:
+                yield line + "\n"
+    except Exception as e:
+        # Headers are already sent, so the error travels as the last line
+        logger.error(f"Streaming {label} failed: {str(e)}")
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+async def _record_lines(records):
+    for record in records:
+        yield dumps(record) + b"\n"
+
+
+def ndjson_from_remote(script: str, label: str) -> StreamingResponse:
+    """Forward each line the remote pipeline emits to the client as soon as it arrives"""
+    return StreamingResponse(_remote_lines(script, label), media_type=NDJSON_MEDIA_TYPE)
+
+
+def ndjson_from_records(records) -> StreamingResponse:
+    """Stream already materialised records, such as mirror rows, one per line"""
+    return StreamingResponse(_record_lines(records), media_type=NDJSON_MEDIA_TYPE)
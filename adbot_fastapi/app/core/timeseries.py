@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from .config import TIMESERIES_CONFIG
+from .dashboard_stats import dashboard_stats
+
+logger = logging.getLogger(__name__)
+
+# Every sample is folded into each tier on write, so a query reads one
+# pre-aggregated row per bucket instead of downsampling raw points.
+# (bucket seconds, retention seconds)
+TIERS = (
+    (60, 2 * 86400),
+    (3600, 90 * 86400),
+    (86400, 5 * 365 * 86400),
+)
+
+# Upper bound on points per /dashboard/history series; the finest tier within it is used
+MAX_POINTS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    metric TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    last REAL NOT NULL,
+    PRIMARY KEY (metric, resolution, bucket)
+) WITHOUT ROWID;
+"""
+
+_UPSERT = """
+INSERT INTO series (metric, resolution, bucket, count, sum, min, max, last) VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+ON CONFLICT (metric, resolution, bucket) DO UPDATE SET
+    count = count + 1,
+    sum = sum + excluded.sum,
+    min = MIN(min, excluded.min),
+    max = MAX(max, excluded.max),
+    last = excluded.last
+"""
+
+_RANGE = re.compile(r"^\s*(\d+)\s*([mhdw])\s*$", re.IGNORECASE)
+_RANGE_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+class InvalidRange(ValueError):
+    """Raised when ?range= is not a duration such as 90m, 24h, 30d or 12w"""
+
+
+def parse_range(value: str) -> int:
+    """Duration string to seconds"""
+    match = _RANGE.match(value or "")
+    if not match or int(match.group(1)) == 0:
+        raise InvalidRange(f"Invalid range '{value}', expected a duration such as 90m, 24h, 30d or 12w")
+    return int(match.group(1)) * _RANGE_UNITS[match.group(2).lower()]
+
+
+def pick_resolution(range_seconds: int) -> int:
+    """Finest tier that keeps the whole range and stays within MAX_POINTS"""
+    for resolution, retention in TIERS:
+        if range_seconds <= retention and range_seconds / resolution <= MAX_POINTS:
+            return resolution
+    return TIERS[-1][0]
+
+
+class TimeSeriesStore:
+    """SQLite store of metric samples downsampled into fixed tiers with per-tier retention"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def record(self, samples: dict, at: float = None):
+        """Fold {metric: value} taken at `at` into every tier"""
+        at = at or time.time()
+        rows = [
+            (metric, resolution, int(at // resolution) * resolution, value, value, value, value)
+            for metric, value in samples.items()
+            for resolution, _ in TIERS
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(_UPSERT, rows)
+            self._conn.execute("COMMIT")
+
+    def prune(self, now: float = None) -> int:
+        """Drop buckets older than their tier's retention"""
+        now = now or time.time()
+        deleted = 0
+        with self._lock:
+            for resolution, retention in TIERS:
+                deleted += self._conn.execute(
+                    "DELETE FROM series WHERE resolution = ? AND bucket < ?", (resolution, now - retention)
+                ).rowcount
+        return deleted
+
+    def metrics(self) -> list:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT metric FROM series ORDER BY metric")]
+
+    def query(self, metric: str, range_seconds: int, now: float = None) -> dict:
+        now = now or time.time()
+        resolution = pick_resolution(range_seconds)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT bucket, count, sum, min, max, last FROM series "
+                "WHERE metric = ? AND resolution = ? AND bucket >= ? ORDER BY bucket",
+                (metric, resolution, int((now - range_seconds) // resolution) * resolution),
+            ).fetchall()
+        return {
+            "resolution_seconds": resolution,
+            "points": [
+                {"t": bucket, "avg": round(total / count, 2), "min": low, "max": high, "last": last}
+                for bucket, count, total, low, high, last in rows
+            ],
+        }
+
+
+class StatsSampler:
+    """Background task recording the dashboard statistics at a fixed interval"""
+
+    def __init__(self, db_path: str, interval: float, enabled: bool = True):
+        self.db_path = db_path
+        self.interval = interval
+        self.enabled = enabled
+        self._store = None
+        self._task = None
+        self.last_sample_at = None
+        self.last_error = None
+        self._recorded_at = {}
+
+    @property
+    def store(self) -> TimeSeriesStore:
+        if self._store is None:
+            self._store = TimeSeriesStore(self.db_path)
+        return self._store
+
+    async def _current(self, cached) -> tuple:
+        """(value, fetched_at) of a dashboard cache, refreshed first if older than one interval"""
+        if cached.value is None or cached.stale or time.time() - cached.fetched_at >= self.interval:
+            await cached.get(force=True)
+        return cached.value, cached.fetched_at
+
+    async def collect(self) -> list:
+        """[(source, at, {metric: value})] for the totals and aggregates, each stamped with when it was read"""
+        counts, counted_at = await self._current(dashboard_stats.counts)
+        batches = [("counts", counted_at, dict(counts))]
+        try:
+            if dashboard_stats.mirror.ready:
+                (aggregates, _), aggregated_at = await dashboard_stats.get_aggregates(), time.time()
+            else:
+                aggregates, aggregated_at = await self._current(dashboard_stats.aggregates)
+        except Exception as e:
+            logger.warning(f"Dashboard aggregates not sampled: {str(e)}")
+        else:
+            samples = {f"users_{name}": value for name, value in aggregates["users"].items()}
+            samples["computers_stale"] = aggregates["computers"]["stale"]
+            batches.append(("aggregates", aggregated_at, samples))
+        return batches
+
+    async def sample_once(self):
+        try:
+            for source, at, samples in await self.collect():
+                # A value already recorded would be counted twice in its bucket
+                if self._recorded_at.get(source) != at:
+                    await asyncio.to_thread(self.store.record, samples, at)
+                    self._recorded_at[source] = at
+            self.last_sample_at, self.last_error = time.time(), None
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Dashboard stats sample failed: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await self.sample_once()
+            await asyncio.to_thread(self.store.prune)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None,
+            "interval_seconds": self.interval,
+            "last_sample_at": datetime.fromtimestamp(self.last_sample_at, timezone.utc).isoformat() if self.last_sample_at else None,
+            "last_error": self.last_error,
+        }
+
+
+stats_sampler = StatsSampler(
+    db_path=TIMESERIES_CONFIG["db_path"],
+    interval=TIMESERIES_CONFIG["interval"],
+    enabled=TIMESERIES_CONFIG["enabled"],
+)
@@ -0,0 +1,155 @@
+import contextlib
+import logging
+
+from .config import TRACING_CONFIG
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+except ImportError:  # optional, tracing is a no-op without the OpenTelemetry SDK
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+# OpenTelemetry spans for HTTP routes, PowerShell calls and output parsing,
+# plus cache hit/miss events on the current span. Incoming W3C traceparent
+# headers are honoured, so a client that sends the trace context it got back
+# from the auth API (traceresponse header) sees the login and the dashboard
+# loads that follow in one trace. Sampling is decided once per trace.
+
+_provider = None
+_tracer = None
+
+
+class _NoopSpan:
+    def set_attribute(self, *_):
+        pass
+
+    def set_attributes(self, *_):
+        pass
+
+    def add_event(self, *_, **__):
+        pass
+
+    def record_exception(self, *_, **__):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def _exporter():
+    kind = TRACING_CONFIG["exporter"]
+    if kind == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("TRACING_EXPORTER=otlp needs opentelemetry-exporter-otlp-proto-http; spans are not exported")
+            return None
+        return OTLPSpanExporter(endpoint=TRACING_CONFIG["otlp_endpoint"])
+    if kind == "file":
+        out = open(TRACING_CONFIG["file"], "a", encoding="utf-8", buffering=1)
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    if kind == "console":
+        return ConsoleSpanExporter()
+    return None
+
+
+def setup():
+    """Install the tracer provider; safe to call more than once"""
+    global _provider, _tracer
+    if _tracer is not None or not TRACING_CONFIG["enabled"]:
+        return
+    if trace is None:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing is off")
+        return
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": TRACING_CONFIG["service_name"]}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_CONFIG["sample_ratio"])),
+    )
+    exporter = _exporter()
+    if exporter is not None:
+        _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer("adbot")
+    logger.info(f"Tracing enabled: exporter={TRACING_CONFIG['exporter']}, "
+                f"sample_ratio={TRACING_CONFIG['sample_ratio']}")
+
+
+def shutdown():
+    """Flush spans still queued for export"""
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _provider = _tracer = None
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+@contextlib.contextmanager
+def span(name: str, attributes: dict = None, client: bool = False):
+    """A child span of the current one, or a no-op stand-in when tracing is off"""
+    if _tracer is None:
+        yield _NOOP
+        return
+    kind = trace.SpanKind.CLIENT if client else trace.SpanKind.INTERNAL
+    with _tracer.start_as_current_span(name, kind=kind, attributes=attributes) as current:
+        yield current
+
+
+def event(name: str, attributes: dict = None):
+    """Add an event to the current span"""
+    if _tracer is not None:
+        trace.get_current_span().add_event(name, attributes or {})
+
+
+def cache_event(cache: str, hit: bool, object_type: str = None):
+    if _tracer is not None:
+        attributes = {"adbot.cache": cache}
+        if object_type:
+            attributes["adbot.object_type"] = object_type
+        event("cache.hit" if hit else "cache.miss", attributes)
+
+
+def _traceresponse(context) -> bytes:
+    return f"00-{context.trace_id:032x}-{context.span_id:016x}-{int(context.trace_flags):02x}".encode()
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per request and returning its context as traceresponse"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _tracer is None:
+            await self.app(scope, receive, send)
+            return
+        carrier = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        parent = propagate.extract(carrier)
+        method = scope["method"]
+        with _tracer.start_as_current_span(
+            method, context=parent, kind=trace.SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope.get("path", "")},
+        ) as current:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    current.set_attribute("http.response.status_code", status)
+                    if status >= 500:
+                        current.set_status(trace.Status(trace.StatusCode.ERROR))
+                    header = (b"traceresponse", _traceresponse(current.get_span_context()))
+                    message = {**message, "headers": [*message.get("headers", []), header]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    current.set_attribute("http.route", route)
+                    current.update_name(f"{method} {route}")
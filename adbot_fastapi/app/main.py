@@ -1,8 +1,64 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routers import testconnection, users, groups, computers, ous, dashboard
+from app.routers import testconnection, users, groups, computers, ous, dashboard, cache, sync, search, jobs, metrics
+from app.core.config import WINRM_WARMUP_CONFIG, DIRECTORY_SYNC_CONFIG, POWERSHELL_BACKEND_CONFIG
+from app.core.directory_cache import directory_cache
+from app.core.directory_sync import directory_sync
+from app.core.search_index import search_index
+from app.core.group_members import member_counts
+from app.core.membership_graph import membership_graph
+from app.core.dashboard_stats import dashboard_stats
+from app.core.timeseries import stats_sampler
+from app.core.jobs import job_manager
+from app.core.metrics import MetricsMiddleware
+from app.core.profiling import ProfilingMiddleware
+from app.core import tracing
+from app.core.powershell_client import shutdown_executor, read_flight
+from app.core.session_pool import close_all_pools, warm_up_pools, idle_reaper
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tracing.setup()
+    if POWERSHELL_BACKEND_CONFIG["backend"] == "fake":
+        logger.info("Using the fake directory backend; WinRM is not used")
+    elif WINRM_WARMUP_CONFIG["on_startup"]:
+        try:
+            result = await asyncio.to_thread(warm_up_pools)
+            logger.info(f"WinRM warm-up complete: {result}")
+        except Exception as e:
+            # The API still starts; sessions will be opened on first use
+            logger.warning(f"WinRM warm-up failed: {str(e)}")
+    directory_cache.add_listener(search_index.on_invalidate)
+    directory_cache.add_listener(member_counts.mark_stale)
+    directory_cache.add_listener(membership_graph.on_invalidate)
+    directory_cache.add_listener(dashboard_stats.mark_stale)
+    # A read started before a write must not be shared with requests made after it
+    directory_cache.add_listener(read_flight.forget)
+    directory_sync.add_listener(search_index.on_sync)
+    directory_sync.add_listener(dashboard_stats.mirror.on_sync)
+    if DIRECTORY_SYNC_CONFIG["enabled"]:
+        directory_cache.add_listener(directory_sync.request_sync)
+        directory_sync.start()
+    job_manager.start()
+    stats_sampler.start()
+    idle_reaper.start()
+    yield
+    await idle_reaper.stop()
+    await stats_sampler.stop()
+    await job_manager.stop()
+    await directory_sync.stop()
+    shutdown_executor()
+    close_all_pools()
+    tracing.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,7 +66,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "traceresponse"],
 )
+app.add_middleware(ProfilingMiddleware)
+# Outermost, so the timings and the server span cover the whole request
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
 
 @app.get("/")
 def read_root():
@@ -23,6 +84,11 @@ app.include_router(groups.router)
 app.include_router(computers.router)
 app.include_router(ous.router)
 app.include_router(dashboard.router)
+app.include_router(cache.router)
+app.include_router(sync.router)
+app.include_router(search.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class BatchGetRequest(BaseModel):
+    """Schema for reading many objects in one request"""
+    identities: list[str] = Field(..., min_length=1, description="SamAccountNames to look up")
+    fields: Optional[list[str]] = Field(None, description="Attributes to return; SamAccountName is always included")
@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class JobSubmit(BaseModel):
+    """Schema for submitting a background job"""
+    kind: str = Field(..., description="Job kind, see GET /jobs/kinds")
+    params: Optional[dict] = Field(None, description="Parameters for the job handler")
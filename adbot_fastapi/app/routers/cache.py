@@ -0,0 +1,30 @@
+from fastapi import APIRouter, HTTPException, Query
+import logging
+from typing import Optional
+from app.core.directory_cache import directory_cache, OBJECT_TYPES
+from app.core.powershell_client import read_flight
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """Hit/miss counters and entry counts of the directory cache, and coalesced read counters"""
+    return {
+        "cache": directory_cache.stats(),
+        "singleflight": read_flight.stats(),
+        "status": "success"
+    }
+
+@router.delete("/cache")
+def invalidate_cache(object_type: Optional[str] = Query(None, description="users, groups, computers or ous; all when omitted")):
+    """Explicitly drop cached directory reads"""
+    if object_type is not None and object_type not in OBJECT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown object type '{object_type}', expected one of {', '.join(OBJECT_TYPES)}")
+    removed = directory_cache.invalidate(object_type)
+    return {
+        "message": "Cache invalidated",
+        "object_type": object_type or "all",
+        "entries_removed": removed,
+        "status": "success"
+    }
@@ -1,45 +1,100 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Header
 import json
 import logging
-from app.core.powershell_client import execute_remote_ps
+from app.core.powershell_client import read_remote_ps_async
+from app.core.directory_cache import directory_cache
+from app.core.directory_sync import directory_sync
+from app.core.jobs import job_manager
+from app.core import paging, batch_get, streaming, records, fields as field_projection
+from typing import Optional
 from app.models.computer_schemas import ADComputerCreate, ADComputerUpdate, ADComputerResponse
+from app.models.batch_schemas import BatchGetRequest
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.get("/computers")
-def list_computers():
-    """List all Active Directory computers"""
+async def list_computers(
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size, at most {paging.MAX_PAGE_SIZE}; the full list when omitted"),
+    cursor: Optional[str] = Query(None, description="next_token from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated attributes to return; Name and SamAccountName are always included"),
+    accept: Optional[str] = Header(None)
+):
+    """List all Active Directory computers; streamed as NDJSON for Accept: application/x-ndjson"""
     try:
-        ps_command = '''
-        try {
-            Import-Module ActiveDirectory -ErrorAction Stop
-            $computers = Get-ADComputer -Filter * -Properties Name, SamAccountName, Description, Enabled, OperatingSystem, LastLogonDate, DistinguishedName |
-                         Select-Object Name, SamAccountName, Description, Enabled, OperatingSystem, LastLogonDate, DistinguishedName |
-                         Sort-Object Name
-            if ($computers.Count -eq 0) {
-                Write-Output "[]"
-            } else {
-                $computers | ConvertTo-Json -Depth 2
+        selected = field_projection.resolve_fields("computers", fields, view="list")
+    except field_projection.UnknownField as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if streaming.wants_ndjson(accept):
+        if directory_sync.covers("computers", selected):
+            return streaming.ndjson_from_records(directory_sync.records("computers", fields=selected))
+        return streaming.ndjson_from_remote(streaming.stream_script(
+            f"Get-ADComputer -Filter * {field_projection.properties('computers', selected)} | "
+            f"Select-Object {field_projection.select_list('computers', selected)}"
+        ), "computers")
+    return records.RecordJSONResponse(await _list_computers_page(limit, cursor, selected))
+
+async def _list_computers_page(limit: Optional[int], cursor: Optional[str], selected: tuple = None) -> dict:
+    """One page, or the full list, of computers as records; shared with the computers.list job"""
+    selected = selected or field_projection.FIELD_CATALOG["computers"]["list"]
+    try:
+        page_size, after = paging.resolve_page("computers", limit, cursor)
+    except paging.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        if directory_sync.covers("computers", selected):
+            data = directory_sync.records("computers", fields=selected)
+            page = {}
+            if page_size:
+                data, page = paging.build_page("computers", paging.paginate("computers", data, page_size, after), page_size)
+            return {
+                "computers": data,
+                "count": len(data),
+                "status": "success",
+                **page
+            }
+        cache_key = ("list", page_size, cursor, selected) if page_size else ("list", selected)
+        generation = directory_cache.generation("computers")
+        cached = directory_cache.get("computers", cache_key)
+        if cached is not None:
+            data, page = cached if page_size else (cached, {})
+            return {
+                "computers": data,
+                "count": len(data),
+                "status": "success",
+                **page
             }
-        } catch {
+        ps_command = f'''
+        try {{
+            {paging.page_search("computers", "(objectCategory=computer)", after, page_size)}
+            $computers = Get-ADComputer {paging.page_source("-Filter *", page_size)} {field_projection.properties("computers", selected)} |
+                         {paging.page_order(page_size)} |
+                         Select-Object {field_projection.select_list("computers", selected)}
+            {paging.page_output("$computers", page_size)}
+        }} catch {{
             Write-Error "PowerShell Error: $($_.Exception.Message)"
             exit 1
-        }
+        }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to get computers: {stderr}")
         if not stdout or stdout.strip() == "":
             return {"computers": [], "count": 0}
         try:
-            data = json.loads(stdout)
-            if isinstance(data, dict):
-                data = [data]
+            rows, hits, last = paging.page_result(records.loads(stdout), page_size)
+            data = records.from_rows("computers", rows)
+            page = {}
+            if page_size:
+                data, page = paging.build_page("computers", data, page_size, hits=hits, last=last)
+                directory_cache.set("computers", cache_key, (data, page), generation=generation)
+            else:
+                directory_cache.set("computers", cache_key, data, generation=generation)
             return {
                 "computers": data,
                 "count": len(data),
-                "status": "success"
+                "status": "success",
+                **page
             }
         except json.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Failed to parse computer data")
@@ -47,13 +102,25 @@ def list_computers():
         logger.error(f"Error listing computers: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _list_computers_job(job):
+    """Job handler for computers.list: the full list, page by page, resumable from the last page"""
+    cursor = job.checkpoint.get("cursor")
+    while True:
+        page = await _list_computers_page(paging.MAX_PAGE_SIZE, cursor)
+        cursor = page.get("next_token")
+        job.add_items(records.to_dicts(page.get("computers", [])), checkpoint={"cursor": cursor})
+        job.progress(job.items_count, message=f"{job.items_count} computers fetched")
+        if not page.get("has_more"):
+            return {"count": job.items_count}
+
+job_manager.register_handler("computers.list", _list_computers_job, "All computers")
+
 @router.get("/computers/domain/{domain_name}")
-def list_computers_by_domain(domain_name: str):
+async def list_computers_by_domain(domain_name: str):
     """List all AD computers under a specific domain distinguished name (e.g., DC=adbot,DC=local)"""
     try:
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             $computers = Get-ADComputer -Filter * -SearchBase "{domain_name}" -Properties Name, SamAccountName, Description, Enabled, OperatingSystem, LastLogonDate, DistinguishedName |
                          Select-Object Name, SamAccountName, Description, Enabled, OperatingSystem, LastLogonDate, DistinguishedName |
                          Sort-Object Name
@@ -67,7 +134,7 @@ def list_computers_by_domain(domain_name: str):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to get computers for domain: {stderr}")
         if not stdout or stdout.strip() == "":
@@ -86,4 +153,20 @@ def list_computers_by_domain(domain_name: str):
             raise HTTPException(status_code=500, detail="Failed to parse computer data")
     except Exception as e:
         logger.error(f"Error listing computers for domain: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/computers/batch-get")
+async def batch_get_computers(request: BatchGetRequest):
+    """Get many computers in one round trip; identities that do not exist map to null"""
+    try:
+        result = await batch_get.get_many("computers", request.identities, request.fields)
+    except batch_get.BatchGetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error batch getting computers: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "computers": result.pop("items"),
+        **result,
+        "status": "success"
+    }
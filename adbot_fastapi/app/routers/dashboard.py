@@ -1,7 +1,7 @@
-from fastapi import APIRouter, HTTPException
-import json
+from fastapi import APIRouter, HTTPException, Query
 import logging
-from app.core.powershell_client import execute_remote_ps
+from app.core.dashboard_stats import dashboard_stats
+from app.core.timeseries import stats_sampler, parse_range, InvalidRange
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -16,47 +16,63 @@ def health_check():
     }
 
 @router.get("/dashboard/stats")
-def get_dashboard_stats():
+async def get_dashboard_stats(
+    refresh: bool = Query(False, description="Recount from AD instead of serving cached totals")
+):
     """Get basic statistics about the Active Directory environment"""
     try:
-        ps_command = '''
-        try {
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
-            # Get counts for different AD objects
-            $userCount = (Get-ADUser -Filter *).Count
-            $groupCount = (Get-ADGroup -Filter *).Count
-            $computerCount = (Get-ADComputer -Filter *).Count
-            $ouCount = (Get-ADOrganizationalUnit -Filter *).Count
-            
-            # Create stats object
-            $stats = @{
-                total_users = $userCount
-                total_groups = $groupCount
-                total_computers = $computerCount
-                total_ous = $ouCount
-            }
-            
-            $stats | ConvertTo-Json
-        } catch {
-            Write-Error "PowerShell Error: $($_.Exception.Message)"
-            exit 1
+        data, cached = await dashboard_stats.get_counts(force=refresh)
+        return {
+            "data": data,
+            "cached": cached,
+            "cache": dashboard_stats.counts.status(),
+            "status": "success"
         }
-        '''
-        
-        stdout, stderr, rc = execute_remote_ps(ps_command)
-        if rc != 0:
-            raise HTTPException(status_code=500, detail=f"Failed to get dashboard stats: {stderr}")
-        
-        try:
-            data = json.loads(stdout)
-            return {
-                "data": data,
-                "status": "success"
-            }
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500, detail="Failed to parse dashboard stats")
-            
     except Exception as e:
         logger.error(f"Error getting dashboard stats: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/dashboard/aggregates")
+async def get_dashboard_aggregates(
+    refresh: bool = Query(False, description="Recompute from AD instead of serving cached aggregates")
+):
+    """Enabled/disabled/locked users, stale computers and users per OU"""
+    try:
+        data, source = await dashboard_stats.get_aggregates(force=refresh)
+        return {
+            "data": data,
+            "source": source,
+            "cache": dashboard_stats.status()["aggregates"],
+            "status": "success"
+        }
+    except Exception as e:
+        logger.error(f"Error getting dashboard aggregates: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/dashboard/history")
+async def get_dashboard_history(
+    metric: str = Query(..., description="Sampled metric, e.g. total_users or users_locked"),
+    range_: str = Query("24h", alias="range", description="How far back to go: 90m, 24h, 30d, 12w")
+):
+    """Pre-aggregated history of a dashboard metric, read from the local time-series store"""
+    try:
+        range_seconds = parse_range(range_)
+    except InvalidRange as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        known = stats_sampler.store.metrics()
+        if metric not in known:
+            raise HTTPException(status_code=404, detail=f"No samples for metric '{metric}', available: {', '.join(known)}")
+        series = stats_sampler.store.query(metric, range_seconds)
+        return {
+            "metric": metric,
+            "range": range_,
+            **series,
+            "sampler": stats_sampler.status(),
+            "status": "success"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting dashboard history: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,22 +1,29 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Header
 import json
 import logging
-from app.core.powershell_client import execute_remote_ps
+from app.core.powershell_client import execute_remote_ps_async, read_remote_ps_async
+from app.core.directory_cache import directory_cache
+from app.core.directory_sync import directory_sync
+from app.core.jobs import job_manager
+from app.core.group_members import member_counts
+from app.core.membership_graph import membership_graph
+from app.core import paging, batch_get, streaming, records, fields as field_projection
+from typing import Optional
 from app.models.group_schemas import (
     ADGroupCreate, ADGroupUpdate, ADGroupResponse,
     ADGroupMember, ADGroupMove, ADGroupList
 )
+from app.models.batch_schemas import BatchGetRequest
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.get("/groups/{samaccountname}/protection-status")
-def get_group_protection_status(samaccountname: str):
+async def get_group_protection_status(samaccountname: str):
     """Check if a group is protected from accidental deletion"""
     try:
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             $group = Get-ADGroup -Identity "{samaccountname}" -Properties ProtectedFromAccidentalDeletion
             $protectionStatus = @{{
                 ProtectedFromAccidentalDeletion = $group.ProtectedFromAccidentalDeletion
@@ -29,7 +36,7 @@ def get_group_protection_status(samaccountname: str):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=404, detail=f"Group not found: {stderr}")
         
@@ -56,118 +63,104 @@ def test_groups_endpoint():
     }
 
 @router.get("/groups/member-counts")
-def get_group_member_counts():
+async def get_group_member_counts(
+    refresh: bool = Query(False, description="Re-read the counts from AD instead of serving cached ones")
+):
     """Get member counts for all groups efficiently"""
     try:
-        ps_command = '''
-        try {
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
-            # Get all groups first
-            $groups = Get-ADGroup -Filter * -Properties Name, SamAccountName
-            $memberCounts = @{}
-            
-            # Process groups in batches to avoid timeout
-            $batchSize = 10
-            for ($i = 0; $i -lt $groups.Count; $i += $batchSize) {
-                $batch = $groups | Select-Object -Skip $i -First $batchSize
-                foreach ($group in $batch) {
-                    try {
-                        $memberCount = (Get-ADGroupMember -Identity $group.SamAccountName -ErrorAction SilentlyContinue).Count
-                        $memberCounts[$group.SamAccountName] = $memberCount
-                    } catch {
-                        $memberCounts[$group.SamAccountName] = 0
-                    }
-                }
-            }
-            
-            # Convert to array format for JSON
-            $result = @()
-            foreach ($group in $groups) {
-                $result += [PSCustomObject]@{
-                    SamAccountName = $group.SamAccountName
-                    MemberCount = $memberCounts[$group.SamAccountName]
-                }
-            }
-            
-            if ($result.Count -eq 0) {
-                Write-Output "[]"
-            } else {
-                $result | ConvertTo-Json -Depth 2
-            }
-        } catch {
-            Write-Error "PowerShell Error: $($_.Exception.Message)"
-            exit 1
+        counts, cached = await member_counts.get(force=refresh)
+        return {
+            "member_counts": counts,
+            "cached": cached,
+            "cache": member_counts.status(),
+            "status": "success"
         }
-        '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
-        if rc != 0:
-            raise HTTPException(status_code=500, detail=f"Failed to get member counts: {stderr}")
-        
-        if not stdout or stdout.strip() == "":
-            return {"member_counts": {}, "status": "success"}
-            
-        try:
-            data = json.loads(stdout)
-            if isinstance(data, dict):
-                data = [data]
-            
-            # Convert to dictionary for easy lookup
-            member_counts = {}
-            for item in data:
-                member_counts[item.get('SamAccountName', '')] = item.get('MemberCount', 0)
-            
-            return {
-                "member_counts": member_counts,
-                "status": "success"
-            }
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {str(e)}")
-            logger.error(f"Raw output: {stdout}")
-            # Return empty member counts instead of failing
-            return {"member_counts": {}, "status": "success", "note": "Using fallback due to parsing error"}
-            
     except Exception as e:
         logger.error(f"Error getting member counts: {str(e)}")
         # Return empty member counts instead of failing
         return {"member_counts": {}, "status": "success", "note": "Using fallback due to error"}
 
 @router.get("/groups")
-def list_groups():
-    """List all Active Directory groups"""
+async def list_groups(
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size, at most {paging.MAX_PAGE_SIZE}; the full list when omitted"),
+    cursor: Optional[str] = Query(None, description="next_token from the previous page"),
+    accept: Optional[str] = Header(None)
+):
+    """List all Active Directory groups; streamed as NDJSON for Accept: application/x-ndjson"""
+    if streaming.wants_ndjson(accept):
+        if directory_sync.is_ready("groups"):
+            return streaming.ndjson_from_records({**g, "Members": []} for g in directory_sync.records("groups"))
+        return streaming.ndjson_from_remote(streaming.stream_script(
+            "Get-ADGroup -Filter * -Properties Name, SamAccountName, Description, DistinguishedName | "
+            "Select-Object Name, SamAccountName, Description, DistinguishedName, @{Name='Members'; Expression={@()}}"
+        ), "groups")
+    return records.RecordJSONResponse(await _list_groups_page(limit, cursor))
+
+async def _list_groups_page(limit: Optional[int], cursor: Optional[str]) -> dict:
+    """One page, or the full list, of groups as records; shared with the groups.list job"""
+    try:
+        page_size, after = paging.resolve_page("groups", limit, cursor)
+    except paging.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        ps_command = '''
-        try {
-            Import-Module ActiveDirectory -ErrorAction Stop
-            $groups = Get-ADGroup -Filter * -Properties Name, SamAccountName, Description, DistinguishedName |
-                      Select-Object Name, SamAccountName, Description, DistinguishedName |
-                      Sort-Object Name
-            if ($groups.Count -eq 0) {
-                Write-Output "[]"
-            } else {
-                $groups | ConvertTo-Json -Depth 2
+        if directory_sync.is_ready("groups"):
+            data = directory_sync.records("groups")
+            for group in data:
+                group['Members'] = []
+            page = {}
+            if page_size:
+                data, page = paging.build_page("groups", paging.paginate("groups", data, page_size, after), page_size)
+            return {
+                "groups": data,
+                "count": len(data),
+                "status": "success",
+                **page
+            }
+        cache_key = ("list", page_size, cursor) if page_size else ("list",)
+        generation = directory_cache.generation("groups")
+        cached = directory_cache.get("groups", cache_key)
+        if cached is not None:
+            data, page = cached if page_size else (cached, {})
+            return {
+                "groups": data,
+                "count": len(data),
+                "status": "success",
+                **page
             }
-        } catch {
+        ps_command = f'''
+        try {{
+            {paging.page_search("groups", "(objectCategory=group)", after, page_size)}
+            $groups = Get-ADGroup {paging.page_source("-Filter *", page_size)} -Properties Name, SamAccountName, Description, DistinguishedName |
+                      {paging.page_order(page_size)} |
+                      Select-Object Name, SamAccountName, Description, DistinguishedName
+            {paging.page_output("$groups", page_size)}
+        }} catch {{
             Write-Error "PowerShell Error: $($_.Exception.Message)"
             exit 1
-        }
+        }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to get groups: {stderr}")
         if not stdout or stdout.strip() == "":
             return {"groups": [], "count": 0}
         try:
-            data = json.loads(stdout)
-            if isinstance(data, dict):
-                data = [data]
+            rows, hits, last = paging.page_result(records.loads(stdout), page_size)
+            data = records.from_rows("groups", rows)
             # Add empty Members array to each group for frontend compatibility
             for group in data:
                 group['Members'] = []
+            page = {}
+            if page_size:
+                data, page = paging.build_page("groups", data, page_size, hits=hits, last=last)
+                directory_cache.set("groups", cache_key, (data, page), generation=generation)
+            else:
+                directory_cache.set("groups", cache_key, data, generation=generation)
             return {
                 "groups": data,
                 "count": len(data),
-                "status": "success"
+                "status": "success",
+                **page
             }
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error: {str(e)}")
@@ -177,26 +170,71 @@ def list_groups():
         logger.error(f"Error listing groups: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _list_groups_job(job):
+    """Job handler for groups.list: the full list, page by page, resumable from the last page"""
+    cursor = job.checkpoint.get("cursor")
+    while True:
+        page = await _list_groups_page(paging.MAX_PAGE_SIZE, cursor)
+        cursor = page.get("next_token")
+        job.add_items(records.to_dicts(page.get("groups", [])), checkpoint={"cursor": cursor})
+        job.progress(job.items_count, message=f"{job.items_count} groups fetched")
+        if not page.get("has_more"):
+            return {"count": job.items_count}
+
+job_manager.register_handler("groups.list", _list_groups_job, "All groups")
+
+@router.get("/groups/{samaccountname}/effective-members")
+async def get_group_effective_members(
+    samaccountname: str,
+    refresh: bool = Query(False, description="Reload the membership graph from AD first")
+):
+    """Members of a group through any level of nesting, resolved from the membership graph"""
+    try:
+        members = await membership_graph.effective_members(samaccountname, force=refresh)
+    except Exception as e:
+        logger.error(f"Error getting effective members: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if members is None:
+        raise HTTPException(status_code=404, detail=f"Group not found: {samaccountname}")
+    return {
+        "group": samaccountname,
+        "members": members,
+        "count": len([m for m in members if m["type"] != "group"]),
+        "nested_groups": len([m for m in members if m["type"] == "group"]),
+        "graph": membership_graph.status(),
+        "status": "success"
+    }
+
 @router.get("/groups/{samaccountname}")
-def get_group(samaccountname: str):
+async def get_group(
+    samaccountname: str,
+    fields: Optional[str] = Query(None, description="Comma-separated attributes to return; members are only read when Members is listed")
+):
     """Get details of a specific AD group, including members"""
     try:
-        ps_command = f'''
-        try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            $group = Get-ADGroup -Identity "{samaccountname}" -Properties *
-            if ($group) {{
+        selected = field_projection.resolve_fields("groups", fields)
+    except field_projection.UnknownField as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    projected = not field_projection.is_default("groups", selected)
+    try:
+        generation = directory_cache.generation("groups")
+        cached = directory_cache.get("groups", directory_cache.detail_key(samaccountname))
+        if cached is not None and all(f in cached for f in selected):
+            return {"group": field_projection.project(cached, selected) if projected else cached, "status": "success"}
+        read_members = "Members" in selected
+        members_script = f'''
                 try {{
                     $members = @(Get-ADGroupMember -Identity "{samaccountname}" -ErrorAction SilentlyContinue | Select-Object -ExpandProperty SamAccountName)
                 }} catch {{
                     $members = @()
-                }}
+                }}''' if read_members else ""
+        group_info = field_projection.hashtable_entries("groups", selected, "$group")
+        ps_command = f'''
+        try {{
+            $group = Get-ADGroup -Identity "{samaccountname}" {field_projection.properties("groups", selected)}
+            if ($group) {{{members_script}
                 $groupInfo = @{{
-                    Name = $group.Name
-                    SamAccountName = $group.SamAccountName
-                    Description = $group.Description
-                    Members = $members
-                    DistinguishedName = $group.DistinguishedName
+{group_info}
                 }}
                 $groupInfo | ConvertTo-Json -Depth 3
             }} else {{
@@ -208,20 +246,38 @@ def get_group(samaccountname: str):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=404, detail=f"Group not found: {stderr}")
         try:
             data = json.loads(stdout)
+            if not projected:
+                directory_cache.set("groups", directory_cache.detail_key(samaccountname), data, generation=generation)
             return {"group": data, "status": "success"}
         except json.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Failed to parse group data")
     except Exception as e:
         logger.error(f"Error getting group: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/groups/batch-get")
+async def batch_get_groups(request: BatchGetRequest):
+    """Get many groups in one round trip; identities that do not exist map to null"""
+    try:
+        result = await batch_get.get_many("groups", request.identities, request.fields)
+    except batch_get.BatchGetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error batch getting groups: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "groups": result.pop("items"),
+        **result,
+        "status": "success"
+    }
     
 @router.post("/groups")
-def create_group(group: ADGroupCreate):
+async def create_group(group: ADGroupCreate):
     """Create a new AD group"""
     try:
         desc_param = f'-Description "{group.description}"' if group.description else ''
@@ -229,7 +285,6 @@ def create_group(group: ADGroupCreate):
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             New-ADGroup -Name "{group.name}" -SamAccountName "{group.samaccountname}" -GroupScope Global {desc_param} {path_param}
             Write-Output "Group created successfully"
         }} catch {{
@@ -237,12 +292,13 @@ def create_group(group: ADGroupCreate):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to create group: {stderr}")
+        directory_cache.invalidate_object("groups", group.samaccountname)
         # Get the created group details
         try:
-            group_details = get_group(group.samaccountname)
+            group_details = await get_group(group.samaccountname, fields=None)
             return {"message": "Group created successfully", "group": group_details["group"]}
         except:
             return {"message": stdout.strip() or "Group created successfully"}
@@ -279,7 +335,7 @@ def create_group(group: ADGroupCreate):
 #         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/groups/{samaccountname}")
-def update_group(samaccountname: str, group: ADGroupUpdate):
+async def update_group(samaccountname: str, group: ADGroupUpdate):
     """Update an AD group (name, description)"""
     try:
         set_params = []
@@ -292,7 +348,6 @@ def update_group(samaccountname: str, group: ADGroupUpdate):
         set_params_str = ' '.join(set_params)
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             Set-ADGroup -Identity "{samaccountname}" {set_params_str}
             Write-Output "Group updated successfully"
         }} catch {{
@@ -300,12 +355,13 @@ def update_group(samaccountname: str, group: ADGroupUpdate):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to update group: {stderr}")
+        directory_cache.invalidate_object("groups", samaccountname)
         # Get updated group details
         try:
-            group_details = get_group(samaccountname)
+            group_details = await get_group(samaccountname, fields=None)
             return {"message": "Group updated successfully", "group": group_details["group"]}
         except:
             return {"message": stdout.strip() or "Group updated successfully"}
@@ -314,12 +370,12 @@ def update_group(samaccountname: str, group: ADGroupUpdate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/groups/{samaccountname}")
-def delete_group(samaccountname: str):
+async def delete_group(samaccountname: str):
     """Delete an AD group"""
     try:
         # Get group info before deletion
         try:
-            group_details = get_group(samaccountname)
+            group_details = await get_group(samaccountname, fields=None)
             group_info = group_details["group"]
         except:
             group_info = None
@@ -327,8 +383,6 @@ def delete_group(samaccountname: str):
         # First, try to remove protection from accidental deletion
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             # Check if group exists and get its current protection status
             $group = Get-ADGroup -Identity "{samaccountname}" -Properties ProtectedFromAccidentalDeletion
             if ($group.ProtectedFromAccidentalDeletion) {{
@@ -345,22 +399,22 @@ def delete_group(samaccountname: str):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to delete group: {stderr}")
+        directory_cache.invalidate_object("groups", samaccountname)
         return {"message": "Group deleted successfully", "deleted_group": group_info, "status": "success"}
     except Exception as e:
         logger.error(f"Error deleting group: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/groups/{samaccountname}/members")
-def add_user_to_group(samaccountname: str, member: ADGroupMember):
+async def add_user_to_group(samaccountname: str, member: ADGroupMember):
     """Add a user to a group"""
     try:
         # First check if the user exists
         check_user_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             $user = Get-ADUser -Identity "{member.user_samaccountname}" -ErrorAction SilentlyContinue
             if ($user) {{
                 Write-Output "User exists"
@@ -374,14 +428,13 @@ def add_user_to_group(samaccountname: str, member: ADGroupMember):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(check_user_command)
+        stdout, stderr, rc = await execute_remote_ps_async(check_user_command)
         if rc != 0:
             raise HTTPException(status_code=404, detail=f"User not found: {member.user_samaccountname}")
         
         # Then add the user to the group
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             Add-ADGroupMember -Identity "{samaccountname}" -Members "{member.user_samaccountname}"
             Write-Output "User added to group successfully"
         }} catch {{
@@ -389,9 +442,12 @@ def add_user_to_group(samaccountname: str, member: ADGroupMember):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to add user to group: {stderr}")
+        membership_graph.member_added(samaccountname, member.user_samaccountname)
+        directory_cache.invalidate("groups", directory_cache.detail_key(samaccountname))
+        directory_cache.invalidate("users", directory_cache.detail_key(member.user_samaccountname))
         
         return {
             "message": "User added to group successfully",
@@ -404,12 +460,11 @@ def add_user_to_group(samaccountname: str, member: ADGroupMember):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/groups/{samaccountname}/members/{user_samaccountname}")
-def remove_user_from_group(samaccountname: str, user_samaccountname: str):
+async def remove_user_from_group(samaccountname: str, user_samaccountname: str):
     """Remove a user from a group"""
     try:
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             Remove-ADGroupMember -Identity "{samaccountname}" -Members "{user_samaccountname}" -Confirm:$false
             Write-Output "User removed from group successfully"
         }} catch {{
@@ -417,9 +472,12 @@ def remove_user_from_group(samaccountname: str, user_samaccountname: str):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to remove user from group: {stderr}")
+        membership_graph.member_removed(samaccountname, user_samaccountname)
+        directory_cache.invalidate("groups", directory_cache.detail_key(samaccountname))
+        directory_cache.invalidate("users", directory_cache.detail_key(user_samaccountname))
         
         return {
             "message": "User removed from group successfully",
@@ -432,11 +490,11 @@ def remove_user_from_group(samaccountname: str, user_samaccountname: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/groups/{samaccountname}/move")
-def move_group(samaccountname: str, move_request: ADGroupMove):
+async def move_group(samaccountname: str, move_request: ADGroupMove):
     """Move a group to a different OU"""
     try:
         # Get current group details to find the distinguished name
-        group_details = get_group(samaccountname)
+        group_details = await get_group(samaccountname, fields=None)
         if "group" not in group_details or "DistinguishedName" not in group_details["group"]:
             raise HTTPException(status_code=404, detail="Could not find group to move or group details are incomplete.")
         
@@ -444,7 +502,6 @@ def move_group(samaccountname: str, move_request: ADGroupMove):
 
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             Move-ADObject -Identity "{distinguished_name}" -TargetPath "{move_request.target_ou}"
             Write-Output "Group moved successfully"
         }} catch {{
@@ -452,9 +509,10 @@ def move_group(samaccountname: str, move_request: ADGroupMove):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to move group: {stderr}")
+        directory_cache.invalidate_object("groups", samaccountname)
         
         return {
             "message": "Group moved successfully",
@@ -0,0 +1,88 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+import json
+import logging
+from typing import Optional
+from app.core.jobs import job_manager, UnknownJobKind
+from app.models.job_schemas import JobSubmit
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/jobs/kinds")
+def list_job_kinds():
+    """Job kinds that can be submitted"""
+    return {
+        "kinds": job_manager.kinds(),
+        "status": "success"
+    }
+
+@router.post("/jobs")
+async def submit_job(request: JobSubmit):
+    """Queue a long-running operation and return its id immediately.
+
+    Async so it runs on the event loop: submit() and cancel() touch the job
+    queue, subscriber queues and worker tasks, which are not thread-safe.
+    """
+    try:
+        job = job_manager.submit(request.kind, request.params)
+    except UnknownJobKind as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=202, content={"job": job, "status": "accepted"})
+
+@router.get("/jobs")
+def list_jobs(
+    status: Optional[str] = Query(None, description="queued, running, succeeded, failed or cancelled"),
+    limit: int = Query(50, ge=1, le=500, description="Maximum jobs to return")
+):
+    """Most recent jobs first"""
+    jobs = job_manager.list(status, limit)
+    return {
+        "jobs": jobs,
+        "count": len(jobs),
+        "status": "success"
+    }
+
+@router.get("/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    include_items: bool = Query(False, description="Include the partial results stored so far"),
+    offset: int = Query(0, ge=0, description="First item to return"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum items to return")
+):
+    """Status, progress and result of a job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if include_items:
+        job["items"] = job_manager.items(job_id, offset, limit)
+    return {
+        "job": job,
+        "status": "success"
+    }
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events with the job state on every change, until it finishes"""
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    async def event_stream():
+        async for job in job_manager.watch(job_id):
+            if job is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return {
+        "job": job,
+        "status": "success"
+    }
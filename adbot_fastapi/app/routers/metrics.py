@@ -0,0 +1,13 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+from app.core import metrics
+from app.core.config import METRICS_CONFIG
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Request and PowerShell phase timings in the Prometheus text format"""
+    if not METRICS_CONFIG["enabled"]:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
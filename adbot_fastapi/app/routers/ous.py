@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Query
 import json
 import logging
-from app.core.powershell_client import execute_remote_ps
+from app.core.powershell_client import execute_remote_ps_async, read_remote_ps_async
+from app.core.directory_cache import directory_cache
+from app.core import paging, records, fields as field_projection
+from typing import Optional
 from app.models.ou_schemas import ADOUCreate, ADOUUpdate, ADOUResponse
 from urllib.parse import unquote
 
@@ -9,13 +12,12 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.get("/ous/{distinguished_name}/protection-status")
-def get_ou_protection_status(distinguished_name: str):
+async def get_ou_protection_status(distinguished_name: str):
     """Check if an OU is protected from accidental deletion"""
     try:
         dn = unquote(distinguished_name)
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             $ou = Get-ADOrganizationalUnit -Identity "{dn}" -Properties ProtectedFromAccidentalDeletion
             $protectionStatus = @{{
                 ProtectedFromAccidentalDeletion = $ou.ProtectedFromAccidentalDeletion
@@ -28,7 +30,7 @@ def get_ou_protection_status(distinguished_name: str):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=404, detail=f"OU not found: {stderr}")
         
@@ -46,12 +48,11 @@ def get_ou_protection_status(distinguished_name: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/ous/domain-info")
-def get_domain_info():
+async def get_domain_info():
     """Get domain information for OU creation"""
     try:
         ps_command = '''
         try {
-            Import-Module ActiveDirectory -ErrorAction Stop
             $domain = Get-ADDomain
             $domainInfo = @{
                 DomainDN = $domain.DistinguishedName
@@ -64,7 +65,7 @@ def get_domain_info():
             exit 1
         }
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to get domain info: {stderr}")
         
@@ -82,38 +83,62 @@ def get_domain_info():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/ous")
-def list_ous():
+async def list_ous(
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size, at most {paging.MAX_PAGE_SIZE}; the full list when omitted"),
+    cursor: Optional[str] = Query(None, description="next_token from the previous page")
+):
     """List all Organizational Units (OUs)"""
+    return records.RecordJSONResponse(await _list_ous_page(limit, cursor))
+
+async def _list_ous_page(limit: Optional[int], cursor: Optional[str]) -> dict:
+    """One page, or the full list, of OUs as records"""
     try:
-        ps_command = '''
-        try {
-            Import-Module ActiveDirectory -ErrorAction Stop
-            $ous = Get-ADOrganizationalUnit -Filter * -Properties Name, DistinguishedName, Description |
-                   Select-Object Name, DistinguishedName, Description |
-                   Sort-Object Name
-            if ($ous.Count -eq 0) {
-                Write-Output "[]"
-            } else {
-                $ous | ConvertTo-Json -Depth 2
+        page_size, after = paging.resolve_page("ous", limit, cursor)
+    except paging.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        cache_key = ("list", page_size, cursor) if page_size else ("list",)
+        generation = directory_cache.generation("ous")
+        cached = directory_cache.get("ous", cache_key)
+        if cached is not None:
+            data, page = cached if page_size else (cached, {})
+            return {
+                "ous": data,
+                "count": len(data),
+                "status": "success",
+                **page
             }
-        } catch {
+        ps_command = f'''
+        try {{
+            {paging.page_search("ous", "(objectCategory=organizationalUnit)", after, page_size)}
+            $ous = Get-ADOrganizationalUnit {paging.page_source("-Filter *", page_size)} -Properties Name, DistinguishedName, Description |
+                   {paging.page_order(page_size)} |
+                   Select-Object Name, DistinguishedName, Description
+            {paging.page_output("$ous", page_size)}
+        }} catch {{
             Write-Error "PowerShell Error: $($_.Exception.Message)"
             exit 1
-        }
+        }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to get OUs: {stderr}")
         if not stdout or stdout.strip() == "":
             return {"ous": [], "count": 0}
         try:
-            data = json.loads(stdout)
-            if isinstance(data, dict):
-                data = [data]
+            rows, hits, last = paging.page_result(records.loads(stdout), page_size)
+            data = records.from_rows("ous", rows)
+            page = {}
+            if page_size:
+                data, page = paging.build_page("ous", data, page_size, hits=hits, last=last)
+                directory_cache.set("ous", cache_key, (data, page), generation=generation)
+            else:
+                directory_cache.set("ous", cache_key, data, generation=generation)
             return {
                 "ous": data,
                 "count": len(data),
-                "status": "success"
+                "status": "success",
+                **page
             }
         except json.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Failed to parse OU data")
@@ -122,19 +147,29 @@ def list_ous():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/ous/{distinguished_name}")
-def get_ou(distinguished_name: str):
+async def get_ou(
+    distinguished_name: str,
+    fields: Optional[str] = Query(None, description="Comma-separated attributes to return")
+):
     """Get details of a specific OU"""
+    try:
+        selected = field_projection.resolve_fields("ous", fields)
+    except field_projection.UnknownField as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    projected = not field_projection.is_default("ous", selected)
     try:
         dn = unquote(distinguished_name)
+        generation = directory_cache.generation("ous")
+        cached = directory_cache.get("ous", directory_cache.detail_key(dn))
+        if cached is not None and all(f in cached for f in selected):
+            return {"ou": field_projection.project(cached, selected) if projected else cached, "status": "success"}
+        ou_info = field_projection.hashtable_entries("ous", selected, "$ou")
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            $ou = Get-ADOrganizationalUnit -Identity "{dn}" -Properties *
+            $ou = Get-ADOrganizationalUnit -Identity "{dn}" {field_projection.properties("ous", selected)}
             if ($ou) {{
                 $ouInfo = @{{
-                    Name = $ou.Name
-                    DistinguishedName = $ou.DistinguishedName
-                    Description = $ou.Description
+{ou_info}
                 }}
                 $ouInfo | ConvertTo-Json -Depth 2
             }} else {{
@@ -146,11 +181,13 @@ def get_ou(distinguished_name: str):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=404, detail=f"OU not found: {stderr}")
         try:
             data = json.loads(stdout)
+            if not projected:
+                directory_cache.set("ous", directory_cache.detail_key(dn), data, generation=generation)
             return {"ou": data, "status": "success"}
         except json.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Failed to parse OU data")
@@ -159,13 +196,12 @@ def get_ou(distinguished_name: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/ous")
-def create_ou(ou: ADOUCreate):
+async def create_ou(ou: ADOUCreate):
     """Create a new Organizational Unit (OU)"""
     try:
         desc_param = f'-Description "{ou.description}"' if ou.description else ''
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             New-ADOrganizationalUnit -Name "{ou.name}" -Path "{ou.path}" {desc_param}
             Write-Output "OU created successfully"
         }} catch {{
@@ -173,14 +209,15 @@ def create_ou(ou: ADOUCreate):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to create OU: {stderr}")
+        directory_cache.invalidate_object("ous")
         # Get the created OU details
         try:
             # Compose the new DN
             new_dn = f"OU={ou.name},{ou.path}"
-            ou_details = get_ou(new_dn)
+            ou_details = await get_ou(new_dn, fields=None)
             return {"message": "OU created successfully", "ou": ou_details["ou"]}
         except:
             return {"message": stdout.strip() or "OU created successfully"}
@@ -189,7 +226,7 @@ def create_ou(ou: ADOUCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/ous/{distinguished_name}")
-def update_ou(distinguished_name: str, ou: ADOUUpdate):
+async def update_ou(distinguished_name: str, ou: ADOUUpdate):
     """Update an OU (name, description)"""
     try:
         dn = unquote(distinguished_name)
@@ -203,7 +240,6 @@ def update_ou(distinguished_name: str, ou: ADOUUpdate):
         set_params_str = ' '.join(set_params)
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             Set-ADOrganizationalUnit -Identity "{dn}" {set_params_str}
             Write-Output "OU updated successfully"
         }} catch {{
@@ -211,12 +247,16 @@ def update_ou(distinguished_name: str, ou: ADOUUpdate):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to update OU: {stderr}")
+        # A renamed OU changes the DNs of everything below it
+        directory_cache.invalidate_object("ous", dn)
+        directory_cache.invalidate("groups")
+        directory_cache.invalidate("computers")
         # Get updated OU details
         try:
-            ou_details = get_ou(dn)
+            ou_details = await get_ou(dn, fields=None)
             return {"message": "OU updated successfully", "ou": ou_details["ou"]}
         except:
             return {"message": stdout.strip() or "OU updated successfully"}
@@ -225,13 +265,13 @@ def update_ou(distinguished_name: str, ou: ADOUUpdate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/ous/{distinguished_name}")
-def delete_ou(distinguished_name: str):
+async def delete_ou(distinguished_name: str):
     """Delete an OU"""
     try:
         dn = unquote(distinguished_name)
         # Get OU info before deletion
         try:
-            ou_details = get_ou(dn)
+            ou_details = await get_ou(dn, fields=None)
             ou_info = ou_details["ou"]
         except:
             ou_info = None
@@ -239,8 +279,6 @@ def delete_ou(distinguished_name: str):
         # First, try to remove protection from accidental deletion
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             # Check if OU exists and get its current protection status
             $ou = Get-ADOrganizationalUnit -Identity "{dn}" -Properties ProtectedFromAccidentalDeletion
             if ($ou.ProtectedFromAccidentalDeletion) {{
@@ -257,9 +295,10 @@ def delete_ou(distinguished_name: str):
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to delete OU: {stderr}")
+        directory_cache.invalidate_object("ous", dn)
         return {"message": "OU deleted successfully", "deleted_ou": ou_info, "status": "success"}
     except Exception as e:
         logger.error(f"Error deleting OU: {str(e)}")
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException, Query
+import logging
+import time
+from typing import Optional
+from app.core.search_index import search_index
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/search")
+async def search_directory(
+    q: str = Query(..., min_length=1, description="Prefix or fragment of a name, username, display name, email or department"),
+    types: Optional[str] = Query(None, description="Comma-separated object types: users, groups, computers; all when omitted"),
+    limit: int = Query(20, ge=1, le=200, description="Maximum results to return")
+):
+    """Type-ahead search answered from the in-memory index"""
+    object_types = [t.strip() for t in types.split(",") if t.strip()] if types else None
+    unknown = [t for t in object_types or [] if t not in search_index.indexes]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown object type '{unknown[0]}', expected one of {', '.join(search_index.indexes)}")
+    try:
+        started = time.perf_counter()
+        results = await search_index.search(q, object_types, limit)
+        return {
+            "results": results,
+            "count": len(results),
+            "query": q,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2),
+            "status": "success"
+        }
+    except Exception as e:
+        logger.error(f"Error searching directory: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/search/status")
+def get_search_status():
+    """Document counts, sources and build times of the search index"""
+    return {
+        "index": search_index.status(),
+        "status": "success"
+    }
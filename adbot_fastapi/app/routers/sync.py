@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException
+import logging
+from app.core.directory_sync import directory_sync
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+@router.get("/sync/status")
+def get_sync_status():
+    """Sync lag, high-water marks and delta sizes of the directory mirror"""
+    return {
+        "sync": directory_sync.status(),
+        "status": "success"
+    }
+
+@router.post("/sync/run")
+async def run_sync():
+    """Run a delta poll for every mirrored object type right now"""
+    try:
+        await directory_sync.sync_all()
+        return {
+            "message": "Directory sync completed",
+            "sync": directory_sync.status(),
+            "status": "success"
+        }
+    except Exception as e:
+        logger.error(f"Error running directory sync: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,17 +1,19 @@
 from fastapi import APIRouter, HTTPException
 import json
 import logging
-from app.core.powershell_client import execute_remote_ps
+from app.core.powershell_client import execute_remote_ps_async
+from app.core.session_pool import pool_stats
+from app.core.backends import backend_name, get_backend
 from app.models.user_schemas import ADUserCreate, ADUserUpdate
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.get("/test_connection")
-def test_connection():
+async def test_connection():
     try:
         ps_command = "Write-Output 'Connection successful'; $env:COMPUTERNAME"
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         return {
             "status": "success" if rc == 0 else "error",
             "return_code": rc,
@@ -20,4 +22,14 @@ def test_connection():
         }
     except Exception as e:
         logger.error(f"Connection test failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Connection test failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Connection test failed: {str(e)}")
+
+@router.get("/test_connection/pool")
+def get_pool_stats():
+    """Report the state of the pooled WinRM sessions, or of the fake directory backend"""
+    backend = backend_name()
+    return {
+        "backend": backend,
+        "pools": [get_backend().stats()] if backend == "fake" else pool_stats(),
+        "status": "success"
+    }
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, HTTPException, Query, Path
+from fastapi import APIRouter, HTTPException, Query, Path, Header, Response
+from fastapi.responses import JSONResponse
 import json
 import logging
 from typing import Optional, List
-from app.core.powershell_client import execute_remote_ps
+from app.core.powershell_client import execute_remote_ps_async, read_remote_ps_async
+from app.core.directory_cache import directory_cache
+from app.core.directory_sync import directory_sync
+from app.core.jobs import job_manager
+from app.core.membership_graph import membership_graph
+from app.core import paging, ldap_query, bulk, batch_get, streaming, records, fields as field_projection
+from app.core.ldap_query import ps_double_quoted
 from app.models.user_schemas import (
     ADUserCreate, ADUserUpdate, ADUserResponse, ADUserSearch, 
-    ADUserMove, ADUserPasswordReset, ADOrganizationalUnit
+    ADUserMove, ADUserPasswordReset, ADOrganizationalUnit, ADUserBulkOperation
 )
+from app.models.batch_schemas import BatchGetRequest
 from datetime import datetime
 from urllib.parse import unquote
 
@@ -15,12 +23,19 @@ logger = logging.getLogger(__name__)
 
 # OU Management Endpoints
 @router.get("/organizational-units")
-def list_organizational_units():
+async def list_organizational_units():
     """Get all Organizational Units - helpful for user creation"""
     try:
+        generation = directory_cache.generation("ous")
+        cached = directory_cache.get("ous", ("list",))
+        if cached is not None:
+            return {
+                "organizational_units": cached,
+                "count": len(cached),
+                "status": "success"
+            }
         ps_command = '''
         try {
-            Import-Module ActiveDirectory -ErrorAction Stop
             $ous = Get-ADOrganizationalUnit -Filter * -Properties Name, DistinguishedName, Description |
                    Select-Object Name, DistinguishedName, Description |
                    Sort-Object Name
@@ -34,7 +49,7 @@ def list_organizational_units():
             exit 1
         }
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to get OUs: {stderr}")
         
@@ -45,6 +60,7 @@ def list_organizational_units():
             data = json.loads(stdout)
             if isinstance(data, dict):
                 data = [data]
+            directory_cache.set("ous", ("list",), data, generation=generation)
             return {
                 "organizational_units": data,
                 "count": len(data),
@@ -58,12 +74,11 @@ def list_organizational_units():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/users/default-container")
-def get_default_user_container():
+async def get_default_user_container():
     """Get the default container where users are created if no OU is specified"""
     try:
         ps_command = '''
         try {
-            Import-Module ActiveDirectory -ErrorAction Stop
             $domain = Get-ADDomain
             $defaultContainer = "CN=Users," + $domain.DistinguishedName
             $containerInfo = @{
@@ -77,7 +92,7 @@ def get_default_user_container():
             exit 1
         }
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Failed to get default container: {stderr}")
         
@@ -96,7 +111,7 @@ def get_default_user_container():
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.post("/users")
-def create_user(user: ADUserCreate):
+async def create_user(user: ADUserCreate):
     """Create a new user with detailed feedback and OU validation"""
     enabled_ps = "$true" if user.enabled else "$false"
     try:
@@ -140,7 +155,6 @@ def create_user(user: ADUserCreate):
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             $SecurePass = ConvertTo-SecureString "{user.password}" -AsPlainText -Force
             
             Write-Output "Starting user creation..."
@@ -182,10 +196,11 @@ def create_user(user: ADUserCreate):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             logger.error(f"PowerShell command failed: {stderr}")
             raise HTTPException(status_code=500, detail=f"User creation failed: {stderr}")
+        directory_cache.invalidate_object("users", user.samaccountname)
         
         # Parse the result to check user location
         try:
@@ -204,7 +219,7 @@ def create_user(user: ADUserCreate):
         
         # Get the created user details
         try:
-            created_user_response = get_user(user.samaccountname)
+            created_user_response = await get_user(user.samaccountname, fields=None, response=Response())
             return {
                 "message": "User created successfully",
                 "user": created_user_response.get("user"),
@@ -275,7 +290,7 @@ def create_user(user: ADUserCreate):
         
         # Get the created user details
         try:
-            created_user = get_user_details(user.samaccountname)
+            created_user = await get_user_details(user.samaccountname)
             return {
                 "message": "User created successfully",
                 "user": created_user,
@@ -288,11 +303,54 @@ def create_user(user: ADUserCreate):
         logger.error(f"Error creating user: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/users/{samaccountname}/effective-groups")
+async def get_user_effective_groups(
+    samaccountname: str,
+    refresh: bool = Query(False, description="Reload the membership graph from AD first")
+):
+    """Groups a user belongs to directly, through nesting or as primary group"""
+    try:
+        groups = await membership_graph.effective_groups(samaccountname, force=refresh)
+    except Exception as e:
+        logger.error(f"Error getting effective groups: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if groups is None:
+        raise HTTPException(status_code=404, detail=f"User not found: {samaccountname}")
+    return {
+        "user": samaccountname,
+        "groups": groups,
+        "count": len(groups),
+        "graph": membership_graph.status(),
+        "status": "success"
+    }
+
 @router.get("/users/{samaccountname}")
-def get_user(samaccountname: str = Path(..., description="Username to lookup")):
-    """Get detailed information about a specific user"""
+async def get_user(
+    samaccountname: str = Path(..., description="Username to lookup"),
+    fields: Optional[str] = Query(None, description="Comma-separated attributes to return, e.g. Name,Department"),
+    response: Response = None
+):
+    """Get detailed information about a specific user; the ETag header is the user's uSNChanged"""
     try:
-        user_details = get_user_details(samaccountname)
+        selected = field_projection.resolve_fields("users", fields)
+    except field_projection.UnknownField as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    wanted = selected if "uSNChanged" in selected else selected + ("uSNChanged",)
+    try:
+        generation = directory_cache.generation("users")
+        user_details = directory_cache.get("users", directory_cache.detail_key(samaccountname))
+        if user_details is not None and all(f in user_details for f in wanted):
+            if fields:
+                user_details = field_projection.project(user_details, wanted)
+        else:
+            user_details = await get_user_details(samaccountname, wanted)
+            if not fields:
+                # Projections are not cached; the full entry stays the one to invalidate
+                directory_cache.set("users", directory_cache.detail_key(samaccountname), user_details, generation=generation)
+        if user_details.get("uSNChanged") is not None and response is not None:
+            response.headers["ETag"] = f'"{user_details["uSNChanged"]}"'
+        if "uSNChanged" not in selected:
+            user_details = {k: v for k, v in user_details.items() if k != "uSNChanged"}
         return {
             "user": user_details,
             "status": "success"
@@ -303,37 +361,16 @@ def get_user(samaccountname: str = Path(..., description="Username to lookup")):
         logger.error(f"Error getting user: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def get_user_details(samaccountname: str) -> dict:
-    """Helper function to get user details"""
+async def get_user_details(samaccountname: str, fields: tuple = None) -> dict:
+    """Helper function to get user details, optionally only the given fields"""
+    selected = fields or field_projection.FIELD_CATALOG["users"]["detail"]
+    user_info = field_projection.hashtable_entries("users", selected, "$user")
     ps_command = f'''
     try {{
-        Import-Module ActiveDirectory -ErrorAction Stop
-        $user = Get-ADUser -Identity "{samaccountname}" -Properties *
+        $user = Get-ADUser -Identity "{samaccountname}" {field_projection.properties("users", selected)}
         if ($user) {{
             $userInfo = @{{
-                Name = $user.Name
-                SamAccountName = $user.SamAccountName
-                Enabled = $user.Enabled
-                LastLogonDate = if ($user.LastLogonDate) {{ $user.LastLogonDate.ToString('yyyy-MM-dd HH:mm:ss') }} else {{ "Never" }}
-                Description = $user.Description
-                EmailAddress = $user.EmailAddress
-                GivenName = $user.GivenName
-                Surname = $user.Surname
-                DisplayName = $user.DisplayName
-                UserPrincipalName = $user.UserPrincipalName
-                Department = $user.Department
-                Title = $user.Title
-                OfficePhone = $user.OfficePhone
-                Manager = $user.Manager
-                DistinguishedName = $user.DistinguishedName
-                Created = $user.Created.ToString('yyyy-MM-dd HH:mm:ss')
-                Modified = $user.Modified.ToString('yyyy-MM-dd HH:mm:ss')
-                PasswordLastSet = if ($user.PasswordLastSet) {{ $user.PasswordLastSet.ToString('yyyy-MM-dd HH:mm:ss') }} else {{ "Never" }}
-                AccountExpirationDate = if ($user.AccountExpirationDate) {{ $user.AccountExpirationDate.ToString('yyyy-MM-dd HH:mm:ss') }} else {{ "Never" }}
-                LockedOut = $user.LockedOut
-                PasswordExpired = $user.PasswordExpired
-                PasswordNeverExpires = $user.PasswordNeverExpires
-                MemberOf = $user.MemberOf
+{user_info}
             }}
             $userInfo | ConvertTo-Json -Depth 3
         }} else {{
@@ -346,7 +383,7 @@ def get_user_details(samaccountname: str) -> dict:
     }}
     '''
     
-    stdout, stderr, rc = execute_remote_ps(ps_command)
+    stdout, stderr, rc = await read_remote_ps_async(ps_command)
     if rc != 0:
         raise HTTPException(status_code=404, detail=f"User not found: {stderr}")
     
@@ -355,109 +392,268 @@ def get_user_details(samaccountname: str) -> dict:
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="Failed to parse user data")
 
-@router.put("/users/{samaccountname}")
-def update_user(samaccountname: str, user: ADUserUpdate):
-    """Update user with before/after comparison"""
+@router.post("/users/batch-get")
+async def batch_get_users(request: BatchGetRequest):
+    """Get many users in one round trip; identities that do not exist map to null"""
     try:
-        # Get current user state
-        current_user = get_user_details(samaccountname)
-        
-        # Build update parameters
-        set_params = []
-        changes_made = []
-        
-        if user.name and user.name != current_user.get("Name"):
-            set_params.append(f'-Name "{user.name}"')
-            changes_made.append(f"Name: '{current_user.get('Name')}' -> '{user.name}'")
-            
-        if user.password:
-            set_params.append(f'-AccountPassword (ConvertTo-SecureString "{user.password}" -AsPlainText -Force)')
+        result = await batch_get.get_many("users", request.identities, request.fields)
+    except batch_get.BatchGetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error batch getting users: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "users": result.pop("items"),
+        **result,
+        "status": "success"
+    }
+
+# Bulk operations
+def _bulk_result(operation: str, item: dict) -> dict:
+    """Shape one engine result like the per-user endpoints"""
+    samaccountname = item.get("SamAccountName")
+    if item.get("Success"):
+        return {
+            "samaccountname": samaccountname,
+            "success": True,
+            "result": {
+                "operation": operation,
+                "samaccountname": samaccountname,
+                "result": item,
+                "status": "success"
+            }
+        }
+    return {
+        "samaccountname": samaccountname,
+        "success": False,
+        "error": item.get("Error") or item.get("Message")
+    }
+
+def _bulk_response(operation: str, outcome: dict) -> dict:
+    results = [_bulk_result(operation, item) for item in outcome["items"]]
+    return {
+        "operation": f"bulk_{operation}",
+        "total": len(results),
+        "successful": len([r for r in results if r["success"]]),
+        "failed": len([r for r in results if not r["success"]]),
+        "chunks": outcome["chunks"],
+        "duration_ms": outcome["duration_ms"],
+        "results": results
+    }
+
+async def _run_bulk(operation: str, samaccountnames: list, parameters: dict = None) -> dict:
+    try:
+        outcome = await bulk.run_bulk(operation, samaccountnames, parameters)
+    except bulk.BulkOperationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if any(item.get("Success") for item in outcome["items"]):
+        directory_cache.invalidate("users")
+    return _bulk_response(operation, outcome)
+
+# Registered before PUT /users/{samaccountname}, which would otherwise capture "bulk-enable"
+@router.put("/users/bulk-enable")
+async def bulk_enable_users(samaccountnames: list[str]):
+    """Enable multiple user accounts"""
+    return await _run_bulk("enable", samaccountnames)
+
+@router.put("/users/bulk-disable")
+async def bulk_disable_users(samaccountnames: list[str]):
+    """Disable multiple user accounts"""
+    return await _run_bulk("disable", samaccountnames)
+
+@router.post("/users/bulk")
+async def bulk_user_operation(
+    request: ADUserBulkOperation,
+    background: bool = Query(False, description="Run as a background job and return its id immediately")
+):
+    """Enable, disable, delete or move many users in one request"""
+    if background:
+        if request.operation not in bulk.BULK_OPERATIONS:
+            raise HTTPException(status_code=400, detail=f"Unknown operation '{request.operation}'")
+        job = job_manager.submit("users.bulk", request.model_dump())
+        return JSONResponse(status_code=202, content={"job": job, "status": "accepted"})
+    return await _run_bulk(request.operation, request.samaccountnames, request.parameters)
+
+async def _bulk_job(job):
+    """Job handler for users.bulk; on resume, users that already have a result are skipped"""
+    operation = job.params["operation"]
+    samaccountnames = job.params["samaccountnames"]
+    done = {(item.get("samaccountname") or "").lower() for item in job.items()}
+    pending = [name for name in samaccountnames if name.lower() not in done]
+    job.progress(len(done), len(samaccountnames), f"{len(pending)} users to process")
+
+    def on_chunk(items):
+        job.add_items([_bulk_result(operation, item) for item in items])
+        job.progress(job.items_count, message=f"{job.items_count} of {len(samaccountnames)} users processed")
+
+    try:
+        await bulk.run_bulk(operation, pending, job.params.get("parameters"), on_chunk=on_chunk)
+    except bulk.BulkOperationError as e:
+        raise ValueError(str(e))
+    directory_cache.invalidate("users")
+    results = job.items()
+    return {
+        "operation": f"bulk_{operation}",
+        "total": len(results),
+        "successful": len([r for r in results if r["success"]]),
+        "failed": len([r for r in results if not r["success"]])
+    }
+
+job_manager.register_handler("users.bulk", _bulk_job, "Bulk enable/disable/delete/move; params as for POST /users/bulk")
+
+# ADUserUpdate attribute -> (user field and Set-ADUser parameter, label in changes_made)
+_UPDATE_FIELDS = {
+    "name": ("Name", "Name"),
+    "enabled": ("Enabled", "Enabled"),
+    "description": ("Description", "Description"),
+    "email": ("EmailAddress", "Email"),
+    "given_name": ("GivenName", "Given Name"),
+    "surname": ("Surname", "Surname"),
+    "display_name": ("DisplayName", "Display Name"),
+    "user_principal_name": ("UserPrincipalName", "User Principal Name"),
+    "department": ("Department", "Department"),
+    "title": ("Title", "Title"),
+    "phone": ("OfficePhone", "Phone"),
+    "manager": ("Manager", "Manager"),
+}
+
+def _ps_value(value) -> str:
+    if isinstance(value, bool):
+        return "$true" if value else "$false"
+    return f'"{ps_double_quoted(str(value))}"'
+
+def _parse_if_match(if_match: Optional[str]) -> Optional[str]:
+    """The uSNChanged an If-Match header expects; None when absent or *"""
+    if not if_match or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return tag.strip('"')
+
+def build_update_script(samaccountname: str, user: ADUserUpdate, expected_usn: str = None) -> str:
+    """One script that reads the compared attributes, applies only what differs and reports both states.
+
+    The diff is case-sensitive, like the comparison the API used to make
+    locally. With expected_usn, nothing is written unless the user's
+    uSNChanged still matches it.
+    """
+    requested = {attr: getattr(user, attr) for attr in _UPDATE_FIELDS if getattr(user, attr) is not None}
+    if not user.name:
+        requested.pop("name", None)
+    snapshot = ("SamAccountName",) + tuple(_UPDATE_FIELDS[attr][0] for attr in requested) + ("uSNChanged",)
+    properties = field_projection.properties("users", snapshot)
+    entries = field_projection.hashtable_entries("users", snapshot, "$user")
+    checks = []
+    for attr, value in requested.items():
+        field = _UPDATE_FIELDS[attr][0]
+        checks.append(
+            f"if ($before.{field} -cne {_ps_value(value)}) {{ $set['{field}'] = {_ps_value(value)}; $applied += '{field}' }}"
+        )
+    if user.password:
+        checks.append(
+            f"$set['AccountPassword'] = (ConvertTo-SecureString {_ps_value(user.password)} -AsPlainText -Force); "
+            "$applied += 'Password'"
+        )
+    precondition = ""
+    if expected_usn is not None:
+        precondition = f'''
+        if ([string]$user.uSNChanged -ne {_ps_value(expected_usn)}) {{
+            @{{ PreconditionFailed = $true; ETag = [string]$user.uSNChanged }} | ConvertTo-Json -Compress
+            return
+        }}'''
+    checks = "\n        ".join(checks)
+    return f'''
+    try {{
+        $user = Get-ADUser -Identity "{ps_double_quoted(samaccountname)}" {properties} -ErrorAction Stop{precondition}
+        $before = @{{
+{entries}
+        }}
+        $set = @{{}}
+        $applied = @()
+        {checks}
+        if ($set.Count -gt 0) {{
+            Set-ADUser -Identity $user.DistinguishedName @set -ErrorAction Stop
+            $user = Get-ADUser -Identity $user.ObjectGUID {properties} -ErrorAction Stop
+        }}
+        $after = @{{
+{entries}
+        }}
+        @{{
+            Before = $before
+            After = $after
+            Applied = @($applied)
+            ETag = [string]$user.uSNChanged
+        }} | ConvertTo-Json -Depth 4 -Compress
+    }} catch [Microsoft.ActiveDirectory.Management.ADIdentityNotFoundException] {{
+        @{{ NotFound = $true }} | ConvertTo-Json -Compress
+    }} catch {{
+        Write-Error "PowerShell Error: $($_.Exception.Message)"
+        exit 1
+    }}
+    '''
+
+def _describe_changes(user: ADUserUpdate, before: dict, applied: list) -> list:
+    """changes_made entries, in the order and wording the endpoint has always used"""
+    changes_made = []
+    for attr, (field, label) in _UPDATE_FIELDS.items():
+        if field in applied:
+            value = getattr(user, attr)
+            if attr == "enabled":
+                changes_made.append(f"{label}: {before.get(field)} -> {value}")
+            else:
+                changes_made.append(f"{label}: '{before.get(field, '')}' -> '{value}'")
+        if attr == "name" and "Password" in applied:
             changes_made.append("Password: Updated")
-            
-        logger.info(f"Checking enabled field: user.enabled={user.enabled}, current_user.Enabled={current_user.get('Enabled')}")
-        if user.enabled is not None and user.enabled != current_user.get("Enabled"):
-            enabled_value = "$true" if user.enabled else "$false"
-            set_params.append(f'-Enabled {enabled_value}')
-            changes_made.append(f"Enabled: {current_user.get('Enabled')} -> {user.enabled}")
-            logger.info(f"Enabled field will be updated: {enabled_value}")
-        else:
-            logger.info(f"Enabled field unchanged or not provided")
-            
-        if user.description is not None and user.description != current_user.get("Description"):
-            set_params.append(f'-Description "{user.description}"')
-            changes_made.append(f"Description: '{current_user.get('Description', '')}' -> '{user.description}'")
-            
-        if user.email is not None and user.email != current_user.get("EmailAddress"):
-            set_params.append(f'-EmailAddress "{user.email}"')
-            changes_made.append(f"Email: '{current_user.get('EmailAddress', '')}' -> '{user.email}'")
-            
-        if user.given_name is not None and user.given_name != current_user.get("GivenName"):
-            set_params.append(f'-GivenName "{user.given_name}"')
-            changes_made.append(f"Given Name: '{current_user.get('GivenName', '')}' -> '{user.given_name}'")
-            
-        if user.surname is not None and user.surname != current_user.get("Surname"):
-            set_params.append(f'-Surname "{user.surname}"')
-            changes_made.append(f"Surname: '{current_user.get('Surname', '')}' -> '{user.surname}'")
-            
-        if user.display_name is not None and user.display_name != current_user.get("DisplayName"):
-            set_params.append(f'-DisplayName "{user.display_name}"')
-            changes_made.append(f"Display Name: '{current_user.get('DisplayName', '')}' -> '{user.display_name}'")
-            
-        if user.user_principal_name is not None and user.user_principal_name != current_user.get("UserPrincipalName"):
-            set_params.append(f'-UserPrincipalName "{user.user_principal_name}"')
-            changes_made.append(f"User Principal Name: '{current_user.get('UserPrincipalName', '')}' -> '{user.user_principal_name}'")
-            
-        if user.department is not None and user.department != current_user.get("Department"):
-            set_params.append(f'-Department "{user.department}"')
-            changes_made.append(f"Department: '{current_user.get('Department', '')}' -> '{user.department}'")
-            
-        if user.title is not None and user.title != current_user.get("Title"):
-            set_params.append(f'-Title "{user.title}"')
-            changes_made.append(f"Title: '{current_user.get('Title', '')}' -> '{user.title}'")
-            
-        if user.phone is not None and user.phone != current_user.get("OfficePhone"):
-            set_params.append(f'-OfficePhone "{user.phone}"')
-            changes_made.append(f"Phone: '{current_user.get('OfficePhone', '')}' -> '{user.phone}'")
-            
-        if user.manager is not None and user.manager != current_user.get("Manager"):
-            set_params.append(f'-Manager "{user.manager}"')
-            changes_made.append(f"Manager: '{current_user.get('Manager', '')}' -> '{user.manager}'")
-        
-        if not set_params:
+    return changes_made
+
+def _strip_usn(snapshot: dict) -> dict:
+    return {k: v for k, v in snapshot.items() if k != "uSNChanged"}
+
+@router.put("/users/{samaccountname}")
+async def update_user(
+    samaccountname: str,
+    user: ADUserUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag from GET /users/{samaccountname}; 412 if the user changed since")
+):
+    """Update user with before/after comparison, in one round trip"""
+    try:
+        stdout, stderr, rc = await execute_remote_ps_async(
+            build_update_script(samaccountname, user, _parse_if_match(if_match))
+        )
+        if rc != 0:
+            raise HTTPException(status_code=500, detail=f"Update failed: {stderr}")
+        result = json.loads(stdout)
+        if result.get("NotFound"):
+            raise HTTPException(status_code=404, detail=f"User not found: {samaccountname}")
+        if result.get("PreconditionFailed"):
+            raise HTTPException(
+                status_code=412,
+                detail=f"User {samaccountname} was modified since ETag {if_match}",
+                headers={"ETag": f'"{result.get("ETag")}"'}
+            )
+        applied = result.get("Applied") or []
+        applied = [applied] if isinstance(applied, str) else applied
+        current_user = _strip_usn(result["Before"])
+        response.headers["ETag"] = f'"{result.get("ETag")}"'
+        changes_made = _describe_changes(user, current_user, applied)
+        logger.info(f"Changes made to {samaccountname}: {changes_made}")
+
+        if not applied:
             return {
                 "message": "No changes detected",
                 "current_user": current_user,
                 "changes_made": [],
                 "status": "success"
             }
-        
-        # Execute update
-        set_params_str = ' '.join(set_params)
-        logger.info(f"Update parameters: {set_params_str}")
-        logger.info(f"Changes to be made: {changes_made}")
-        ps_command = f'''
-        try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            Set-ADUser -Identity "{samaccountname}" {set_params_str}
-            Write-Output "User updated successfully"
-        }} catch {{
-            Write-Error "PowerShell Error: $($_.Exception.Message)"
-            exit 1
-        }}
-        '''
-        
-        stdout, stderr, rc = execute_remote_ps(ps_command)
-        if rc != 0:
-            raise HTTPException(status_code=500, detail=f"Update failed: {stderr}")
-        
-        # Get updated user state
-        updated_user = get_user_details(samaccountname)
+        directory_cache.invalidate_object("users", samaccountname)
         
         return {
             "message": "User updated successfully",
             "changes_made": changes_made,
             "before": current_user,
-            "after": updated_user,
+            "after": _strip_usn(result["After"]),
             "status": "success"
         }
         
@@ -468,16 +664,15 @@ def update_user(samaccountname: str, user: ADUserUpdate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{samaccountname}/move")
-def move_user(samaccountname: str, move_request: ADUserMove):
+async def move_user(samaccountname: str, move_request: ADUserMove):
     """Move user to a different OU"""
     try:
         # Get current user location
-        current_user = get_user_details(samaccountname)
+        current_user = await get_user_details(samaccountname, ("SamAccountName", "DistinguishedName"))
         current_ou = current_user.get("DistinguishedName", "").split(",", 1)[1] if "," in current_user.get("DistinguishedName", "") else "Unknown"
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             Move-ADObject -Identity "{current_user['DistinguishedName']}" -TargetPath "{move_request.target_ou}"
             Write-Output "User moved successfully"
         }} catch {{
@@ -486,12 +681,13 @@ def move_user(samaccountname: str, move_request: ADUserMove):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Move failed: {stderr}")
+        directory_cache.invalidate_object("users", samaccountname)
         
         # Get updated user location
-        updated_user = get_user_details(samaccountname)
+        updated_user = await get_user_details(samaccountname)
         
         return {
             "message": "User moved successfully",
@@ -508,14 +704,13 @@ def move_user(samaccountname: str, move_request: ADUserMove):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/{samaccountname}/reset-password")
-def reset_password(samaccountname: str, reset_request: ADUserPasswordReset):
+async def reset_password(samaccountname: str, reset_request: ADUserPasswordReset):
     """Reset user password with options"""
     try:
         change_on_logon = "$true" if reset_request.force_change_on_logon else "$false"
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             Set-ADAccountPassword -Identity "{samaccountname}" -Reset -NewPassword (ConvertTo-SecureString "{reset_request.new_password}" -AsPlainText -Force)
             Set-ADUser -Identity "{samaccountname}" -ChangePasswordAtLogon {change_on_logon}
             Write-Output "Password reset successfully"
@@ -525,9 +720,10 @@ def reset_password(samaccountname: str, reset_request: ADUserPasswordReset):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Password reset failed: {stderr}")
+        directory_cache.invalidate_object("users", samaccountname)
         
         return {
             "message": "Password reset successfully",
@@ -540,18 +736,17 @@ def reset_password(samaccountname: str, reset_request: ADUserPasswordReset):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/users/{samaccountname}")
-def delete_user(samaccountname: str):
+async def delete_user(samaccountname: str):
     """Delete a user (with confirmation of current state)"""
     try:
         # Get user info before deletion
         try:
-            current_user = get_user_details(samaccountname)
+            current_user = await get_user_details(samaccountname)
         except:
             current_user = None
             
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             Remove-ADUser -Identity "{samaccountname}" -Confirm:$false
             Write-Output "User deleted successfully"
         }} catch {{
@@ -560,9 +755,10 @@ def delete_user(samaccountname: str):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=500, detail=f"Delete failed: {stderr}")
+        directory_cache.invalidate_object("users", samaccountname)
         
         return {
             "message": "User deleted successfully",
@@ -575,15 +771,13 @@ def delete_user(samaccountname: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/users/enable/{samaccountname}")
-def enable_user(samaccountname: str):
+async def enable_user(samaccountname: str):
     """Enable a user account"""
     try:
         logger.info(f"Enabling user: {samaccountname}")
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             # Check if user exists first
             $user = Get-ADUser -Identity "{samaccountname}" -ErrorAction Stop
             
@@ -621,7 +815,7 @@ def enable_user(samaccountname: str):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         
         if rc != 0:
             logger.error(f"Enable user failed - Return code: {rc}, stderr: {stderr}")
@@ -631,6 +825,7 @@ def enable_user(samaccountname: str):
             except json.JSONDecodeError:
                 raise HTTPException(status_code=500, detail=f"Failed to enable user: {stderr}")
         
+        directory_cache.invalidate_object("users", samaccountname)
         try:
             result = json.loads(stdout)
             logger.info(f"User {samaccountname} enabled successfully: {result}")
@@ -655,15 +850,13 @@ def enable_user(samaccountname: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/users/disable/{samaccountname}")
-def disable_user(samaccountname: str):
+async def disable_user(samaccountname: str):
     """Disable a user account"""
     try:
         logger.info(f"Disabling user: {samaccountname}")
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             # Check if user exists first
             $user = Get-ADUser -Identity "{samaccountname}" -ErrorAction Stop
             
@@ -701,7 +894,7 @@ def disable_user(samaccountname: str):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         
         if rc != 0:
             logger.error(f"Disable user failed - Return code: {rc}, stderr: {stderr}")
@@ -711,6 +904,7 @@ def disable_user(samaccountname: str):
             except json.JSONDecodeError:
                 raise HTTPException(status_code=500, detail=f"Failed to disable user: {stderr}")
         
+        directory_cache.invalidate_object("users", samaccountname)
         try:
             result = json.loads(stdout)
             logger.info(f"User {samaccountname} disabled successfully: {result}")
@@ -735,15 +929,13 @@ def disable_user(samaccountname: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/users/status/{samaccountname}")
-def get_user_status(samaccountname: str):
+async def get_user_status(samaccountname: str):
     """Get the current enabled/disabled status of a user"""
     try:
         logger.info(f"Getting status for user: {samaccountname}")
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             $user = Get-ADUser -Identity "{samaccountname}" -Properties Enabled, Name, SamAccountName
             $result = @{{
                 Name = $user.Name
@@ -766,7 +958,7 @@ def get_user_status(samaccountname: str):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             logger.error(f"Get user status failed: {stderr}")
             raise HTTPException(status_code=404, detail=f"User not found: {stderr}")
@@ -785,15 +977,19 @@ def get_user_status(samaccountname: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/users/test-ou-placement")
-def test_ou_placement(ou_dn: str):
+async def test_ou_placement(
+    ou_dn: str,
+    background: bool = Query(False, description="Run as a background job and return its id immediately")
+):
     """Test OU placement by creating a test user (for troubleshooting)"""
+    if background:
+        job = job_manager.submit("users.test-ou-placement", {"ou_dn": ou_dn})
+        return JSONResponse(status_code=202, content={"job": job, "status": "accepted"})
     try:
         test_username = f"test_user_{int(datetime.now().timestamp())}"
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             # First validate the OU
             $ou = Get-ADOrganizationalUnit -Identity "{ou_dn}" -ErrorAction Stop
             Write-Output "OU exists: $($ou.DistinguishedName)"
@@ -832,7 +1028,7 @@ def test_ou_placement(ou_dn: str):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         if rc != 0:
             logger.error(f"OU placement test failed: {stderr}")
             raise HTTPException(status_code=500, detail=f"OU placement test failed: {stderr}")
@@ -854,13 +1050,20 @@ def test_ou_placement(ou_dn: str):
         logger.error(f"Error testing OU placement: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _test_ou_placement_job(job):
+    job.progress(0, 1, f"Testing placement in {job.params['ou_dn']}")
+    result = await test_ou_placement(job.params["ou_dn"], background=False)
+    job.progress(1, 1)
+    return result
+
+job_manager.register_handler("users.test-ou-placement", _test_ou_placement_job, "Create and delete a test user in params.ou_dn")
+
 @router.get("/users/debug-ou/{samaccountname}")
-def debug_user_location(samaccountname: str):
+async def debug_user_location(samaccountname: str):
     """Debug where a user is actually located in AD"""
     try:
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
             $user = Get-ADUser -Identity "{samaccountname}" -Properties DistinguishedName, CanonicalName
             
             $userInfo = @{{
@@ -877,7 +1080,7 @@ def debug_user_location(samaccountname: str):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             raise HTTPException(status_code=404, detail=f"User not found: {stderr}")
         
@@ -895,7 +1098,7 @@ def debug_user_location(samaccountname: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/users/validate-ou/{ou_dn}")
-def validate_ou(ou_dn: str):
+async def validate_ou(ou_dn: str):
     """Validate if an OU exists and is accessible"""
     try:
         decoded_ou = unquote(ou_dn)
@@ -903,8 +1106,6 @@ def validate_ou(ou_dn: str):
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             Write-Output "Validating OU: {decoded_ou}"
             
             # Try to get the OU
@@ -937,7 +1138,7 @@ def validate_ou(ou_dn: str):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         
         logger.info(f"OU validation stdout: {stdout}")
         logger.info(f"OU validation stderr: {stderr}")
@@ -982,45 +1183,93 @@ def validate_ou(ou_dn: str):
         }
 
 @router.get("/users")
-def list_users(
-    search: Optional[str] = Query(None, description="Search by name or samaccountname"),
+async def list_users(
+    search: Optional[str] = Query(None, description="Prefix of a name, username, display name, first or last name"),
     enabled: Optional[bool] = Query(None, description="Filter by enabled status"),
-    limit: Optional[int] = Query(100, description="Limit number of results")
+    department: Optional[str] = Query(None, description="Filter by department"),
+    ou: Optional[str] = Query(None, description="Only users in this Organizational Unit (and below)"),
+    limit: Optional[int] = Query(100, description=f"Page size, at most {paging.MAX_PAGE_SIZE}"),
+    cursor: Optional[str] = Query(None, description="next_token from the previous page"),
+    explain: bool = Query(False, description="Include the compiled LDAP query plan"),
+    fields: Optional[str] = Query(None, description="Comma-separated attributes to return; Name and SamAccountName are always included"),
+    accept: Optional[str] = Header(None)
 ):
-    """List users with optional filtering and search"""
+    """List users with optional filtering and search, one page at a time.
+
+    With Accept: application/x-ndjson every matching user is streamed instead,
+    one JSON object per line; limit and cursor do not apply.
+    """
     try:
-        # Build filter based on parameters
-        filter_parts = []
-        if search:
-            filter_parts.append(f"(Name -like '*{search}*' -or SamAccountName -like '*{search}*')")
-        if enabled is not None:
-            filter_parts.append(f"Enabled -eq ${str(enabled).lower()}")
-        
-        if filter_parts:
-            filter_string = " -and ".join(filter_parts)
-        else:
-            filter_string = "*"
+        selected = field_projection.resolve_fields("users", fields, view="list")
+    except field_projection.UnknownField as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if streaming.wants_ndjson(accept):
+        query = ldap_query.compile_user_query(search=search, enabled=enabled, department=department, ou=ou)
+        if directory_sync.covers("users", selected):
+            return streaming.ndjson_from_records(directory_sync.records("users", where=query.matches, fields=selected))
+        return streaming.ndjson_from_remote(streaming.stream_script(
+            f"Get-ADUser {query.cmdlet_parameters()} {field_projection.properties('users', selected)} | "
+            f"Select-Object {field_projection.select_list('users', selected)}"
+        ), "users")
+    return records.RecordJSONResponse(
+        await _list_users_page(search, enabled, department, ou, limit, cursor, explain, selected)
+    )
+
+async def _list_users_page(search: Optional[str], enabled: Optional[bool], department: Optional[str], ou: Optional[str],
+                           limit: Optional[int], cursor: Optional[str], explain: bool = False,
+                           selected: tuple = None) -> dict:
+    """One page of users as records, shared by GET /users and the users.list job"""
+    selected = selected or field_projection.FIELD_CATALOG["users"]["list"]
+    filters = {"search": search, "enabled": enabled, "department": department, "ou": ou}
+    try:
+        page_size, after = paging.resolve_page("users", limit, cursor, filters)
+    except paging.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters_applied = {
+        "search": search,
+        "enabled": enabled,
+        "department": department,
+        "ou": ou,
+        "limit": limit,
+        "cursor": cursor
+    }
+    query = ldap_query.compile_user_query(search=search, enabled=enabled, department=department, ou=ou)
+    # The page search adds its own seek; the clause below only shows it in the query plan
+    page_search = paging.page_search("users", query.ldap_filter, after, page_size, query.search_base, query.search_scope)
+    if after is not None:
+        query.add("name", paging.keyset_ldap(after), "keyset seek (>=), name-sorted on the DC")
+    plan = {"query_plan": query.explain()} if explain else {}
+    try:
+        if directory_sync.covers("users", selected):
+            data = directory_sync.records("users", where=query.matches, fields=selected)
+            data, page = paging.build_page("users", paging.paginate("users", data, page_size, after), page_size, filters)
+            return {
+                "users": data,
+                "count": len(data),
+                "status": "success",
+                "filters_applied": filters_applied,
+                **page,
+                **plan
+            }
+        cache_key = ("list", search, enabled, department, ou, page_size, cursor, selected)
+        generation = directory_cache.generation("users")
+        cached = directory_cache.get("users", cache_key)
+        if cached is not None:
+            return {**cached, **plan}
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            $users = Get-ADUser -Filter "{filter_string}" -Properties Name, SamAccountName, Enabled, LastLogonDate, Description, Department, GivenName, Surname, DisplayName, UserPrincipalName |
-                     Select-Object Name, SamAccountName, Enabled, 
-                     @{{Name='LastLogonDate'; Expression={{if ($_.LastLogonDate) {{$_.LastLogonDate.ToString('yyyy-MM-dd HH:mm:ss')}} else {{'Never'}}}}}},
-                     Description, Department, GivenName, Surname, DisplayName, UserPrincipalName |
-                     Sort-Object Name |
-                     Select-Object -First {limit}
-            if ($users.Count -eq 0) {{
-                Write-Output "[]"
-            }} else {{
-                $users | ConvertTo-Json -Depth 2
-            }}
+            {page_search}
+            $users = Get-ADUser {paging.page_source(query.cmdlet_parameters(), page_size)} {field_projection.properties("users", selected)} |
+                     {paging.page_order(page_size)} |
+                     Select-Object {field_projection.select_list("users", selected)}
+            {paging.page_output("$users", page_size)}
         }} catch {{
             Write-Error "PowerShell Error: $($_.Exception.Message)"
             exit 1
         }}
         '''
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             logger.error(f"PowerShell command failed with return code {rc}")
             logger.error(f"Error output: {stderr}")
@@ -1031,19 +1280,18 @@ def list_users(
         if not stdout or stdout.strip() == "":
             return {"users": [], "message": "No users found or empty response"}
         try:
-            data = json.loads(stdout)
-            if isinstance(data, dict):
-                data = [data]
-            return {
+            rows, hits, last = paging.page_result(records.loads(stdout), page_size)
+            data = records.from_rows("users", rows)
+            data, page = paging.build_page("users", data, page_size, filters, hits=hits, last=last)
+            result = {
                 "users": data,
                 "count": len(data),
                 "status": "success",
-                "filters_applied": {
-                    "search": search,
-                    "enabled": enabled,
-                    "limit": limit
-                }
+                "filters_applied": filters_applied,
+                **page
             }
+            directory_cache.set("users", cache_key, result, generation=generation)
+            return {**result, **plan}
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error: {str(e)}")
             logger.error(f"Raw output: {stdout}")
@@ -1056,16 +1304,30 @@ def list_users(
         logger.error(f"Unexpected error in list_users: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _list_users_job(job):
+    """Job handler for users.list: every matching user, page by page, resumable from the last page"""
+    p = job.params
+    cursor = job.checkpoint.get("cursor")
+    while True:
+        page = await _list_users_page(
+            p.get("search"), p.get("enabled"), p.get("department"), p.get("ou"), paging.MAX_PAGE_SIZE, cursor
+        )
+        cursor = page.get("next_token")
+        job.add_items(records.to_dicts(page.get("users", [])), checkpoint={"cursor": cursor})
+        job.progress(job.items_count, message=f"{job.items_count} users fetched")
+        if not page.get("has_more"):
+            return {"count": job.items_count}
+
+job_manager.register_handler("users.list", _list_users_job, "All users matching params search/enabled/department/ou")
+
 @router.get("/users/check-permissions")
-def check_ad_permissions():
+async def check_ad_permissions():
     """Simple permission check for enable/disable operations"""
     try:
         logger.info("Checking basic AD permissions")
         
         ps_command = '''
         try {
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             # Get current user
             $currentUser = [System.Security.Principal.WindowsIdentity]::GetCurrent()
             
@@ -1095,7 +1357,7 @@ def check_ad_permissions():
         }
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await read_remote_ps_async(ps_command)
         if rc != 0:
             logger.error(f"Permission check failed: {stderr}")
             raise HTTPException(status_code=500, detail=f"Permission check failed: {stderr}")
@@ -1322,86 +1584,14 @@ def check_ad_permissions():
 #     except Exception as e:
 #         return {"error": str(e)}
 
-# Bulk operations
-@router.put("/users/bulk-enable")
-def bulk_enable_users(samaccountnames: list[str]):
-    """Enable multiple user accounts"""
-    results = []
-    
-    for samaccountname in samaccountnames:
-        try:
-            result = enable_user(samaccountname)
-            results.append({
-                "samaccountname": samaccountname,
-                "success": True,
-                "result": result
-            })
-        except HTTPException as e:
-            results.append({
-                "samaccountname": samaccountname,
-                "success": False,
-                "error": str(e.detail)
-            })
-        except Exception as e:
-            results.append({
-                "samaccountname": samaccountname,
-                "success": False,
-                "error": str(e)
-            })
-    
-    return {
-        "operation": "bulk_enable",
-        "total": len(samaccountnames),
-        "successful": len([r for r in results if r["success"]]),
-        "failed": len([r for r in results if not r["success"]]),
-        "results": results
-    }
-
-
-@router.put("/users/bulk-disable")
-def bulk_disable_users(samaccountnames: list[str]):
-    """Disable multiple user accounts"""
-    results = []
-    
-    for samaccountname in samaccountnames:
-        try:
-            result = disable_user(samaccountname)
-            results.append({
-                "samaccountname": samaccountname,
-                "success": True,
-                "result": result
-            })
-        except HTTPException as e:
-            results.append({
-                "samaccountname": samaccountname,
-                "success": False,
-                "error": str(e.detail)
-            })
-        except Exception as e:
-            results.append({
-                "samaccountname": samaccountname,
-                "success": False,
-                "error": str(e)
-            })
-    
-    return {
-        "operation": "bulk_disable",
-        "total": len(samaccountnames),
-        "successful": len([r for r in results if r["success"]]),
-        "failed": len([r for r in results if not r["success"]]),
-        "results": results
-    }
-
 @router.put("/users/reset-and-enable/{samaccountname}")
-def reset_password_and_enable_user(samaccountname: str, new_password: str = "TempPassword123!"):
+async def reset_password_and_enable_user(samaccountname: str, new_password: str = "TempPassword123!"):
     """Reset user password and enable account"""
     try:
         logger.info(f"Resetting password and enabling user: {samaccountname}")
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             # Check if user exists first
             $user = Get-ADUser -Identity "{samaccountname}" -ErrorAction Stop
             
@@ -1448,7 +1638,7 @@ def reset_password_and_enable_user(samaccountname: str, new_password: str = "Tem
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         
         if rc != 0:
             logger.error(f"Reset and enable failed - Return code: {rc}, stderr: {stderr}")
@@ -1458,6 +1648,7 @@ def reset_password_and_enable_user(samaccountname: str, new_password: str = "Tem
             except json.JSONDecodeError:
                 raise HTTPException(status_code=500, detail=f"Failed to reset and enable user: {stderr}")
         
+        directory_cache.invalidate_object("users", samaccountname)
         try:
             result = json.loads(stdout)
             logger.info(f"User {samaccountname} password reset and enabled successfully: {result}")
@@ -1482,15 +1673,13 @@ def reset_password_and_enable_user(samaccountname: str, new_password: str = "Tem
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/users/force-enable/{samaccountname}")
-def force_enable_user(samaccountname: str):
+async def force_enable_user(samaccountname: str):
     """Force enable a user account (bypasses password policy checks)"""
     try:
         logger.info(f"Force enabling user: {samaccountname}")
         
         ps_command = f'''
         try {{
-            Import-Module ActiveDirectory -ErrorAction Stop
-            
             # Check if user exists first
             $user = Get-ADUser -Identity "{samaccountname}" -ErrorAction Stop
             
@@ -1529,7 +1718,7 @@ def force_enable_user(samaccountname: str):
         }}
         '''
         
-        stdout, stderr, rc = execute_remote_ps(ps_command)
+        stdout, stderr, rc = await execute_remote_ps_async(ps_command)
         
         if rc != 0:
             logger.error(f"Force enable failed - Return code: {rc}, stderr: {stderr}")
@@ -1539,6 +1728,7 @@ def force_enable_user(samaccountname: str):
             except json.JSONDecodeError:
                 raise HTTPException(status_code=500, detail=f"Failed to force enable user: {stderr}")
         
+        directory_cache.invalidate_object("users", samaccountname)
         try:
             result = json.loads(stdout)
             logger.info(f"User {samaccountname} force enabled successfully: {result}")
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+ADBot benchmark harness
+
+Starts the API on the fake PowerShell backend at each directory scale, and the
+authentication API with AUTH_BACKEND=fake, then drives every scenario in
+scenarios.py with concurrent httpx clients. Reports p50/p95/p99 latency,
+throughput and the server's peak RSS per scenario, and compares the results
+with a stored baseline so regressions fail the run.
+
+Usage (from adbot_fastapi/):
+    python benchmarks/run.py                              # 1k, 10k and 100k objects
+    python benchmarks/run.py --scales 10k --requests 500 --concurrency 20
+    python benchmarks/run.py --save-baseline              # record the current numbers
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from scenarios import ADBOT, AUTH, FAKE_AUTH_PASSWORD, SCENARIOS, ScenarioContext
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+ADBOT_DIR = BENCHMARKS_DIR.parent
+AUTH_DIR = ADBOT_DIR.parent / "auth_api"
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baselines.json"
+
+# Metrics compared against the baseline and the direction that counts as worse
+COMPARED_METRICS = {
+    "p50_ms": "higher",
+    "p95_ms": "higher",
+    "p99_ms": "higher",
+    "throughput_rps": "lower",
+    "peak_rss_mb": "higher",
+}
+# Latency differences below this are treated as noise whatever the relative change
+LATENCY_NOISE_MS = 2.0
+
+
+def parse_scale(value: str) -> int:
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+
+def scale_label(objects: int) -> str:
+    if objects >= 1_000_000 and objects % 1_000_000 == 0:
+        return f"{objects // 1_000_000}m"
+    if objects >= 1_000 and objects % 1_000 == 0:
+        return f"{objects // 1_000}k"
+    return str(objects)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """An app run under uvicorn in a subprocess, with its memory read from /proc"""
+
+    def __init__(self, name: str, app: str, cwd: Path, env: dict, log_dir: Path):
+        self.name = name
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = log_dir / f"{name}.log"
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+            cwd=cwd, env={**os.environ, **env}, stdout=self._log, stderr=subprocess.STDOUT,
+        )
+
+    def wait_ready(self, path: str, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} exited with code {self.process.returncode}, see {self.log_path}")
+            try:
+                if httpx.get(self.url + path, timeout=5).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{self.name} did not become ready within {timeout}s, see {self.log_path}")
+
+    def _status_kb(self, field: str):
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith(field + ":"):
+                        return int(line.split()[1])
+        except OSError:
+            return None
+        return None
+
+    def peak_rss_mb(self):
+        """Peak resident set size since the last reset_peak(), or None where /proc is unavailable"""
+        kb = self._status_kb("VmHWM")
+        return round(kb / 1024, 1) if kb is not None else None
+
+    def reset_peak(self):
+        # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+)
+        try:
+            with open(f"/proc/{self.process.pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+
+
+async def drive(client: httpx.AsyncClient, scenario, ctx: ScenarioContext, requests: int, concurrency: int) -> tuple:
+    """Send `requests` requests over `concurrency` workers; (latencies in ms, errors, wall seconds)"""
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, path, body = scenario.request(ctx)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(latencies: list, errors: int, wall: float, peak_rss_mb) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "p50_ms": round(percentile(ordered, 0.50), 2),
+        "p95_ms": round(percentile(ordered, 0.95), 2),
+        "p99_ms": round(percentile(ordered, 0.99), 2),
+        "max_ms": round(ordered[-1], 2) if ordered else 0.0,
+        "throughput_rps": round(len(ordered) / wall, 1) if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+async def run_scenarios(server: Server, scenarios: list, ctx: ScenarioContext, args) -> dict:
+    results = {}
+    async with httpx.AsyncClient(base_url=server.url, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        for scenario in scenarios:
+            await drive(client, scenario, ctx, args.warmup, min(args.concurrency, args.warmup or 1))
+            server.reset_peak()
+            latencies, errors, wall = await drive(client, scenario, ctx, args.requests, args.concurrency)
+            results[scenario.name] = summarize(latencies, errors, wall, server.peak_rss_mb())
+            print_row(scenario.name, results[scenario.name])
+    return results
+
+
+def discover_users(server: Server, wanted: int = 1000) -> list:
+    response = httpx.get(f"{server.url}/users", params={"limit": wanted, "fields": "SamAccountName"}, timeout=120)
+    response.raise_for_status()
+    users = [u["SamAccountName"] for u in response.json()["users"]]
+    if not users:
+        raise RuntimeError("The fake directory returned no users")
+    return users
+
+
+def print_row(name: str, r: dict):
+    rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "n/a"
+    print(f"  {name:<22} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} "
+          f"{r['throughput_rps']:>9.1f} {rss:>9} {r['errors']:>6}")
+
+
+def print_header(title: str):
+    print(f"\n{title}")
+    print(f"  {'scenario':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'rss MB':>9} {'errors':>6}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable regressions of results against the baseline results"""
+    regressions = []
+    for group, scenarios in results.items():
+        for name, current in scenarios.items():
+            previous = baseline.get(group, {}).get(name)
+            if not previous:
+                continue
+            if current["errors"] > previous.get("errors", 0):
+                regressions.append(f"{group}/{name}: errors {previous.get('errors', 0)} -> {current['errors']}")
+            for metric, worse in COMPARED_METRICS.items():
+                old, new = previous.get(metric), current.get(metric)
+                if not old or new is None:
+                    continue
+                if worse == "higher":
+                    regressed = new > old * (1 + tolerance)
+                    if metric.endswith("_ms"):
+                        regressed = regressed and new - old > LATENCY_NOISE_MS
+                else:
+                    regressed = new < old * (1 - tolerance)
+                if regressed:
+                    regressions.append(f"{group}/{name}: {metric} {old} -> {new} ({(new - old) / old:+.0%})")
+    return regressions
+
+
+def adbot_env(objects: int, args, work_dir: Path) -> dict:
+    return {
+        "POWERSHELL_BACKEND": "fake",
+        "FAKE_DIRECTORY_OBJECTS": str(objects),
+        "FAKE_DIRECTORY_LATENCY_MS": str(args.latency_ms),
+        "FAKE_DIRECTORY_PER_OBJECT_US": str(args.per_object_us),
+        "WINRM_WARMUP_ON_STARTUP": "false",
+        "TIMESERIES_ENABLED": "false",
+        "JOBS_DB_PATH": str(work_dir / f"jobs-{objects}.db"),
+        "TIMESERIES_DB_PATH": str(work_dir / f"timeseries-{objects}.db"),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the ADBot APIs against the fake directory backend")
+    parser.add_argument("--scales", default="1k,10k,100k", help="Comma-separated directory sizes, e.g. 1k,10k,100k")
+    parser.add_argument("--scenarios", help="Comma-separated scenario names; all when omitted")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per scenario before timing")
+    parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight at once")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake directory round trip per script")
+    parser.add_argument("--per-object-us", type=float, default=5, help="Fake directory cost per object examined, sorted or returned")
+    parser.add_argument("--auth-latency-ms", type=float, default=50, help="Fake WinRM validation time per login")
+    parser.add_argument("--no-auth", action="store_true", help="Skip the authentication API")
+    parser.add_argument("--output", type=Path, help="Write the full results as JSON")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative change tolerated before flagging")
+    args = parser.parse_args()
+
+    selected = set(args.scenarios.split(",")) if args.scenarios else None
+    scenarios = [s for s in SCENARIOS if selected is None or s.name in selected]
+    if selected and selected - {s.name for s in scenarios}:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(selected - {s.name for s in scenarios}))}")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="adbot-bench-") as tmp:
+        work_dir = Path(tmp)
+        for objects in (parse_scale(s) for s in args.scales.split(",")):
+            adbot_scenarios = [s for s in scenarios if s.app == ADBOT]
+            if not adbot_scenarios:
+                break
+            server = Server(f"adbot-{scale_label(objects)}", "app.main:app", ADBOT_DIR, adbot_env(objects, args, work_dir), work_dir)
+            try:
+                server.wait_ready("/test_connection")
+                ctx = ScenarioContext(discover_users(server))
+                print_header(f"adbot_fastapi, {objects:,} objects")
+                results[scale_label(objects)] = asyncio.run(run_scenarios(server, adbot_scenarios, ctx, args))
+            finally:
+                server.stop()
+
+        auth_scenarios = [s for s in scenarios if s.app == AUTH]
+        if auth_scenarios and not args.no_auth:
+            env = {"AUTH_BACKEND": "fake", "FAKE_AUTH_LATENCY_MS": str(args.auth_latency_ms), "FAKE_AUTH_PASSWORD": FAKE_AUTH_PASSWORD}
+            server = Server("auth", "main:app", AUTH_DIR, env, work_dir)
+            try:
+                server.wait_ready("/auth/health")
+                print_header("auth_api")
+                results["auth"] = asyncio.run(run_scenarios(server, auth_scenarios, ScenarioContext(["benchmark"]), args))
+            finally:
+                server.stop()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "save_baseline")},
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, default=str))
+
+    status = 0
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        if regressions:
+            print(f"\nRegressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            status = 1
+        else:
+            print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2, default=str) + "\n")
+        print(f"\nBaseline written to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
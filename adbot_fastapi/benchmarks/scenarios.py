@@ -0,0 +1,72 @@
+"""Requests the benchmark harness times, and the state they draw identities from"""
+
+from dataclasses import dataclass
+from itertools import count
+from typing import Callable, Optional
+
+# Applications the harness starts: the main API and the authentication API
+ADBOT = "adbot"
+AUTH = "auth"
+
+# Password the fake authentication backend is started with, and the one auth_login sends
+FAKE_AUTH_PASSWORD = "benchmark"
+
+
+class ScenarioContext:
+    """Identities discovered from the running API, handed out round-robin"""
+
+    def __init__(self, users: list):
+        self.users = users
+        self._next_user = count()
+        self._next_batch = count()
+        self._next_revision = count()
+
+    def user(self) -> str:
+        return self.users[next(self._next_user) % len(self.users)]
+
+    def batch(self, size: int = 50) -> list:
+        start = (next(self._next_batch) * size) % max(len(self.users) - size, 1)
+        return self.users[start:start + size]
+
+    def revision(self) -> int:
+        """A fresh number per call, so update bodies always differ from what is stored"""
+        return next(self._next_revision)
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    app: str = ADBOT
+    body: Optional[Callable] = None
+    # Filled into the path from the context, e.g. {"user": ScenarioContext.user}
+    params: Optional[dict] = None
+
+    def request(self, ctx: ScenarioContext) -> tuple:
+        path = self.path.format(**{k: f(ctx) for k, f in (self.params or {}).items()})
+        return self.method, path, self.body(ctx) if self.body else None
+
+
+SCENARIOS = [
+    Scenario("users_page", "GET", "/users?limit=100"),
+    Scenario("user_detail", "GET", "/users/{user}", params={"user": ScenarioContext.user}),
+    Scenario("groups", "GET", "/groups"),
+    Scenario("group_member_counts", "GET", "/groups/member-counts"),
+    Scenario("computers", "GET", "/computers"),
+    Scenario("ous", "GET", "/ous"),
+    Scenario("dashboard_stats", "GET", "/dashboard/stats"),
+    Scenario("update_user", "PUT", "/users/{user}", params={"user": ScenarioContext.user}, body=lambda ctx: {
+        "description": f"Benchmark revision {ctx.revision()}",
+    }),
+    Scenario("users_bulk_disable", "PUT", "/users/bulk-disable", body=ScenarioContext.batch),
+    Scenario("users_bulk_enable", "PUT", "/users/bulk-enable", body=ScenarioContext.batch),
+    Scenario("users_bulk_move", "POST", "/users/bulk", body=lambda ctx: {
+        "operation": "move",
+        "samaccountnames": ctx.batch(),
+        "parameters": {"target_ou": "OU=Unit 0000,DC=fake,DC=local"},
+    }),
+    Scenario("auth_login", "POST", "/auth/login", app=AUTH, body=lambda ctx: {
+        "username": "Administrator", "password": FAKE_AUTH_PASSWORD, "server_ip": "fake",
+    }),
+]
@@ -17,9 +17,20 @@ import jwt
 import logging
 from datetime import datetime, timedelta
 import os
+import time
 from pypsrp.client import Client
 from dotenv import load_dotenv
 import uvicorn
+import contextlib
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+except ImportError:  # optional, tracing is a no-op without the OpenTelemetry SDK
+    trace = None
 
 # Load environment variables
 load_dotenv()
@@ -38,6 +49,22 @@ logger = logging.getLogger(__name__)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-this-in-production")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 AUTH_API_PORT = int(os.getenv("AUTH_API_PORT", "8001"))
+# "fake" validates logins without WinRM, for benchmarks and local development
+AUTH_BACKEND = os.getenv("AUTH_BACKEND", "winrm").lower()
+FAKE_AUTH_LATENCY_MS = float(os.getenv("FAKE_AUTH_LATENCY_MS", "50"))
+FAKE_AUTH_PASSWORD = os.getenv("FAKE_AUTH_PASSWORD", "")
+# OpenTelemetry tracing, same settings as adbot_fastapi
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "adbot-auth-api")
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "otlp").lower()
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACING_FILE = os.getenv("TRACING_FILE", "auth_traces.jsonl")
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "0.1"))
+
+if AUTH_BACKEND == "fake":
+    if not FAKE_AUTH_PASSWORD:
+        raise RuntimeError("AUTH_BACKEND=fake requires FAKE_AUTH_PASSWORD; refusing to accept logins with any password")
+    logger.warning("AUTH_BACKEND=fake: logins are NOT checked against a domain controller, only against FAKE_AUTH_PASSWORD")
 
 # Create FastAPI app
 app = FastAPI(
@@ -55,8 +82,70 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["traceresponse"],
 )
 
+# Tracing
+def setup_tracing():
+    """Tracer for the auth API, or None when tracing is off or the SDK is missing"""
+    if not TRACING_ENABLED:
+        return None
+    if trace is None:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing is off")
+        return None
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    exporter = None
+    if TRACING_EXPORTER == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter(endpoint=TRACING_OTLP_ENDPOINT)
+        except ImportError:
+            logger.warning("TRACING_EXPORTER=otlp needs opentelemetry-exporter-otlp-proto-http; spans are not exported")
+    elif TRACING_EXPORTER == "file":
+        out = open(TRACING_FILE, "a", encoding="utf-8", buffering=1)
+        exporter = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    elif TRACING_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+    if exporter is not None:
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    logger.info(f"Tracing enabled: exporter={TRACING_EXPORTER}, sample_ratio={TRACING_SAMPLE_RATIO}")
+    return provider.get_tracer("adbot-auth")
+
+tracer = setup_tracing()
+
+@contextlib.contextmanager
+def traced(name: str, attributes: dict = None):
+    """Child span of the current request, or nothing when tracing is off"""
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, kind=trace.SpanKind.CLIENT, attributes=attributes) as span:
+        yield span
+
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    """Server span per request, continuing a caller's traceparent; its context goes back as traceresponse"""
+    if tracer is None:
+        return await call_next(request)
+    with tracer.start_as_current_span(
+        request.method, context=propagate.extract(dict(request.headers)), kind=trace.SpanKind.SERVER,
+        attributes={"http.request.method": request.method, "url.path": request.url.path},
+    ) as span:
+        response = await call_next(request)
+        route = getattr(request.scope.get("route"), "path", None)
+        if route:
+            span.set_attribute("http.route", route)
+            span.update_name(f"{request.method} {route}")
+        span.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
+        context = span.get_span_context()
+        response.headers["traceresponse"] = f"00-{context.trace_id:032x}-{context.span_id:016x}-{int(context.trace_flags):02x}"
+        return response
+
 # Security
 security = HTTPBearer()
 
@@ -114,6 +203,8 @@ def test_winrm_connection(server_ip: str, username: str, password: str):
     for auth_method in ["basic", "negotiate"]:
         try:
             logger.info(f"Attempting {auth_method} authentication")
+            if tracer is not None:
+                trace.get_current_span().add_event("winrm.auth_attempt", {"adbot.auth_method": auth_method})
             client = Client(
                 server=server_ip,
                 username=username,
@@ -141,6 +232,18 @@ def test_winrm_connection(server_ip: str, username: str, password: str):
     
     return False, None, None
 
+def fake_winrm_connection(server_ip: str, username: str, password: str):
+    """Stand-in for test_winrm_connection when AUTH_BACKEND=fake.
+
+    Takes FAKE_AUTH_LATENCY_MS like a WinRM round trip and accepts only
+    FAKE_AUTH_PASSWORD, which must be set for the fake backend to start.
+    """
+    logger.info(f"Fake WinRM validation for {username} on {server_ip}")
+    time.sleep(FAKE_AUTH_LATENCY_MS / 1000)
+    if password != FAKE_AUTH_PASSWORD:
+        return False, None, None
+    return True, "fake", "WindowsProductName : Fake Directory"
+
 # Dependency to get current user from token
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current user from JWT token"""
@@ -201,11 +304,18 @@ async def login(request: LoginRequest):
     
     try:
         # Test WinRM connection
-        success, auth_method, system_info = test_winrm_connection(
-            request.server_ip, 
-            request.username, 
-            request.password
-        )
+        validate = fake_winrm_connection if AUTH_BACKEND == "fake" else test_winrm_connection
+        with traced("winrm credential check", {"adbot.operation": "Get-ComputerInfo", "adbot.backend": AUTH_BACKEND,
+                                               "server.address": request.server_ip}) as span:
+            success, auth_method, system_info = validate(
+                request.server_ip, 
+                request.username, 
+                request.password
+            )
+            if span is not None:
+                span.set_attribute("adbot.auth.success", success)
+                if auth_method:
+                    span.set_attribute("adbot.auth_method", auth_method)
         
         if not success:
             logger.warning(f"Authentication failed for {request.username}")